@@ -0,0 +1,352 @@
+"""
+Bulk backfill: reprocesses every document under a GCS prefix.
+
+Objects are listed once and the pages of the ones not yet done are counted.
+They are split into batches of about --pages-per-batch pages (at most
+--batch-size documents) and sent to Document AI as one batch operation per
+batch, with at most --concurrency operations in flight. Every finished document
+is appended to a checkpoint file, so an interrupted run started again with the
+same checkpoint skips them.
+
+Each operation is waited on for --timeout seconds (by default scaled to the
+pages in the batch); one still running after that is cancelled. Documents are
+post-processed as soon as Document AI finishes them, so only the ones it
+hadn't finished when an operation failed or was cancelled are recorded as
+failed and resubmitted by the next run.
+
+Run from the repository root:
+    python backfill.py gs://BUCKET/archive/2024/ --doc-type form2307 --checkpoint backfill-2024.jsonl
+"""
+# Shared batch flow and data handlers
+import docai_batch
+import pending_operations
+
+# Shared storage layer
+import storage
+
+# Page estimate for documents that can't be counted
+import scheduler
+
+from detect_mime_type import detect_mime_type
+
+# Worker pool for the batches
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+
+# Pages per batch operation, documents are added to a batch until the next
+# one would go over (a longer document gets a batch of its own)
+DEFAULT_PAGES_PER_BATCH = 100
+
+# Documents per batch operation (Document AI accepts up to 1000 gcs_documents)
+MAX_BATCH_SIZE = 1000
+
+# Downloads in parallel while counting pages
+COUNT_WORKERS = 16
+
+# Batch operations in flight, keep it under the concurrent batch operation quota
+DEFAULT_CONCURRENCY = 4
+
+# Seconds an operation is waited on: TIMEOUT_PER_PAGE per page in the batch,
+# at least MIN_TIMEOUT (the docai_batch default)
+TIMEOUT_PER_PAGE = 15
+MIN_TIMEOUT = 400
+
+# Statuses that count as done, anything else is retried by the next run
+DONE_STATUSES = ("ok", "partial")
+
+def extractor_for(doc_type):
+    """
+    Extractor module (processor settings) for a doc type, same routing as main.trigger.
+    """
+    if doc_type == "service_invoice":
+        import service_extractor
+        return service_extractor
+    import extractor_caller
+    return extractor_caller
+
+def object_key(uri, generation):
+    """
+    Checkpoint key of one object. The generation is part of it so a file
+    replaced since the last run is processed again.
+    """
+    return f"{uri}#{generation}" if generation else uri
+
+class Checkpoint:
+    """
+    Append-only JSON lines file, one line per finished document.
+
+    Lines are flushed as they are written, so at most the documents of the
+    batches running at the time of an interruption are redone.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Half-written last line of an interrupted run
+                        continue
+                    if record.get("status") in DONE_STATUSES:
+                        self.done.add(record["key"])
+
+    def is_done(self, key):
+        return key in self.done
+
+    def record(self, key, result):
+        entry = {
+            "key": key,
+            "status": result.get("status"),
+            "pages": result.get("pages", 0),
+            "message": result.get("message"),
+            "time": time.time(),
+        }
+        with self._lock:
+            if entry["status"] in DONE_STATUSES:
+                self.done.add(key)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+def list_documents(gcs_prefix, storage_client=None):
+    """
+    Lists the supported documents under gs://BUCKET/PREFIX.
+
+    Returns:
+        list of dicts with "gcs_uri", "mime_type", "userId" and "key".
+    """
+    matches = re.match(r"gs://(.*?)/(.*)", gcs_prefix)
+    if not matches:
+        raise ValueError(f"Not a gs:// prefix: {gcs_prefix}")
+    bucket, prefix = matches.groups()
+
+    store = storage.Storage(storage_client) if storage_client else storage.get_storage()
+
+    documents = []
+    for blob in store.list(bucket, prefix=prefix):
+        mime_type = detect_mime_type(blob.name)
+        if mime_type is None:
+            continue
+        uri = f"gs://{bucket}/{blob.name}"
+        documents.append({
+            "gcs_uri": uri,
+            "mime_type": mime_type,
+            "userId": (blob.metadata or {}).get("userid"),
+            "key": object_key(uri, blob.generation),
+        })
+    return documents
+
+def count_pages(doc, store):
+    """
+    Page count of one listed document: PDFs are downloaded and counted,
+    images are one page. PAGES_PER_DOCUMENT when a PDF can't be read.
+    """
+    bucket, name = doc["gcs_uri"][len("gs://"):].split("/", 1)
+    try:
+        if doc["mime_type"] == "application/pdf":
+            pages = docai_batch.count_pdf_pages(store.read(bucket, name))
+        else:
+            pages = 1
+    except Exception as e:
+        print(f"Could not count pages of {doc['gcs_uri']}: {e}")
+        pages = None
+    return pages or scheduler.PAGES_PER_DOCUMENT
+
+def add_page_counts(documents, storage_client=None, workers=COUNT_WORKERS):
+    """Sets "pages" on each document (also used by the submission scheduler)."""
+    store = storage.Storage(storage_client) if storage_client else storage.get_storage()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for doc, pages in zip(documents, pool.map(lambda doc: count_pages(doc, store), documents)):
+            doc["pages"] = pages
+    return documents
+
+def make_batches(documents, pages_per_batch, batch_size=MAX_BATCH_SIZE):
+    """
+    Splits the documents, in order, into lists of at most pages_per_batch
+    pages and batch_size documents. A document over the page budget on its
+    own is sent alone.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    batches = []
+    batch, pages = [], 0
+    for doc in documents:
+        doc_pages = doc.get("pages") or scheduler.PAGES_PER_DOCUMENT
+        if batch and (pages + doc_pages > pages_per_batch or len(batch) >= batch_size):
+            batches.append(batch)
+            batch, pages = [], 0
+        batch.append(doc)
+        pages += doc_pages
+    if batch:
+        batches.append(batch)
+    return batches
+
+def batch_timeout(pages):
+    """Default seconds to wait for an operation with this many pages."""
+    return max(MIN_TIMEOUT, TIMEOUT_PER_PAGE * pages)
+
+def run_batch(batch, doc_type, extractor, client=None, process_fn=None, timeout=None):
+    """
+    Sends one batch through Document AI and waits for its outputs.
+
+    Args:
+        timeout: Seconds to wait for the operation, batch_timeout by default.
+            The operation is cancelled when it runs longer.
+
+    Returns:
+        dict keyed by input GCS URI with the status of each document.
+    """
+    if timeout is None:
+        timeout = batch_timeout(scheduler.estimate_pages(batch))
+    try:
+        return docai_batch.batch_process_documents(
+            handler=pending_operations.handler_for(doc_type),
+            userId=None,
+            doc_type=doc_type,
+            project_id=extractor.PROJECT_ID,
+            location=extractor.LOCATION,
+            processor_id=extractor.PROCESSOR_ID,
+            gcs_output_uri=f"gs://processed_output_bucket/processed_path/{doc_type}",
+            gcs_input_documents=batch,
+            field_mask=extractor.FIELD_MASK,
+            timeout=timeout,
+            client=client,
+            process_fn=process_fn,
+            # Each document is saved as soon as it is done, so a failed or
+            # cancelled operation keeps the documents it got through
+            incremental=True,
+            cancel_on_timeout=True,
+        )
+    except docai_batch.BatchFailed as e:
+        # Keep the documents that were handled, only the rest are failed
+        # (and resubmitted by the next run)
+        results = dict(e.results)
+        for doc in batch:
+            results.setdefault(doc["gcs_uri"], {"status": "failed", "message": str(e)})
+        print(f"Batch of {len(batch)} failed after {len(e.results)} document(s): {e}")
+        return results
+    except Exception as e:
+        # The whole operation failed (or timed out and was cancelled),
+        # none of its documents are done
+        message = str(e) or f"{type(e).__name__} after {timeout}s"
+        print(f"Batch of {len(batch)} failed: {message}")
+        return {doc["gcs_uri"]: {"status": "failed", "message": message} for doc in batch}
+
+def backfill(gcs_prefix, doc_type="form2307", checkpoint_path=None,
+             pages_per_batch=DEFAULT_PAGES_PER_BATCH, batch_size=MAX_BATCH_SIZE,
+             concurrency=DEFAULT_CONCURRENCY, limit=None, client=None,
+             storage_client=None, process_fn=None, timeout=None) -> dict:
+    """
+    Reprocesses every document under a prefix, skipping the ones already
+    in the checkpoint.
+
+    Args:
+        gcs_prefix: gs://BUCKET/PREFIX to enumerate.
+        doc_type: Document type of every document under the prefix.
+        checkpoint_path: JSON lines file with finished documents, None to not keep one.
+        pages_per_batch: Page budget of one Document AI batch operation.
+        batch_size: Most documents in one batch operation.
+        concurrency: Batch operations in flight.
+        limit: Only process this many (not yet done) documents.
+        client: Document AI client, the shared one for the extractor's location by default.
+        storage_client: Storage client used for listing.
+        process_fn: Passed to docai_batch, used by local benchmarks.
+        timeout: Seconds to wait for each operation, batch_timeout of its size by default.
+
+    Returns:
+        dict with document/page counts and docs/sec, pages/sec.
+    """
+    start = time.perf_counter()
+    extractor = extractor_for(doc_type)
+    checkpoint = Checkpoint(checkpoint_path)
+
+    documents = list_documents(gcs_prefix, storage_client=storage_client)
+    pending = [doc for doc in documents if not checkpoint.is_done(doc["key"])]
+    skipped = len(documents) - len(pending)
+    if limit is not None:
+        pending = pending[:limit]
+
+    add_page_counts(pending, storage_client=storage_client)
+    batches = make_batches(pending, pages_per_batch, batch_size)
+    print(f"{len(documents)} document(s) under {gcs_prefix}, {skipped} already done, "
+          f"{len(pending)} to process ({scheduler.estimate_pages(pending) if pending else 0} pages) "
+          f"in {len(batches)} batch(es)")
+
+    summary = {
+        "listed": len(documents),
+        "skipped": skipped,
+        "ok": 0,
+        "partial": 0,
+        "failed": 0,
+        "pages": 0,
+    }
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {
+            pool.submit(run_batch, batch, doc_type, extractor, client, process_fn, timeout): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            results = future.result()
+            for doc in futures[future]:
+                result = results.get(doc["gcs_uri"]) or {"status": "failed", "message": "No result"}
+                status = result.get("status")
+                summary[status if status in ("ok", "partial") else "failed"] += 1
+                summary["pages"] += result.get("pages", 0) or 0
+                checkpoint.record(doc["key"], result)
+
+            processed = summary["ok"] + summary["partial"] + summary["failed"]
+            elapsed = time.perf_counter() - start
+            print(f"{processed}/{len(pending)} documents, "
+                  f"{processed / elapsed:.2f} docs/sec, {summary['pages'] / elapsed:.2f} pages/sec")
+
+    elapsed = time.perf_counter() - start
+    processed = summary["ok"] + summary["partial"] + summary["failed"]
+    summary["seconds"] = round(elapsed, 3)
+    summary["docs_per_sec"] = round(processed / elapsed, 3) if elapsed else 0.0
+    summary["pages_per_sec"] = round(summary["pages"] / elapsed, 3) if elapsed else 0.0
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocess every document under a GCS prefix")
+    parser.add_argument("prefix", help="gs://BUCKET/PREFIX")
+    parser.add_argument("--doc-type", default="form2307")
+    parser.add_argument("--checkpoint", default="backfill-checkpoint.jsonl",
+                        help="JSON lines file of finished documents, reused to resume")
+    parser.add_argument("--pages-per-batch", type=int, default=DEFAULT_PAGES_PER_BATCH,
+                        help="page budget of each batch operation")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE,
+                        help="most documents in each batch operation")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--timeout", type=int, default=None,
+                        help=f"seconds to wait for each batch operation before cancelling it "
+                             f"(default {TIMEOUT_PER_PAGE}s per page, at least {MIN_TIMEOUT}s)")
+    args = parser.parse_args()
+
+    summary = backfill(
+        args.prefix,
+        doc_type=args.doc_type,
+        checkpoint_path=args.checkpoint,
+        pages_per_batch=args.pages_per_batch,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        limit=args.limit,
+        timeout=args.timeout,
+    )
+    print(json.dumps(summary))
+
+if __name__ == '__main__':
+    main()
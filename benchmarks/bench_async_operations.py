@@ -0,0 +1,140 @@
+"""
+Compares blocking batch processing with submit-only mode plus a separate
+completion step, using the local stand-in processor and a SQLite pending store.
+Then, with a GCS pending store and leases on local storage: the storage
+requests one completeTrigger shard event costs as pending operations pile up,
+and shard events of one operation landing on several instances at once.
+
+The output stage (shard download, handler, image cleaning) is replaced by a
+no-op so the numbers only show the cost of holding a worker during the wait.
+
+Run from the repository root:
+    python -m benchmarks.bench_async_operations --documents 20 --workers 4
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import tempfile
+import threading
+import time
+
+import docai_batch
+import pending_operations
+from idempotency import GcsLeaseStore, IdempotencyGuard
+from local_processor import LocalDocumentProcessorClient
+from local_storage import LocalStorageClient
+
+def noop_output(output_gcs_destination, handler, userId, doc_type, source=None):
+    return {"status": "ok", "output": output_gcs_destination}
+
+def submit(client, index, wait, store):
+    return docai_batch.batch_process_documents(
+        handler=None,
+        userId="bench",
+        doc_type="form2307",
+        project_id="local",
+        location="us",
+        processor_id="bench",
+        gcs_output_uri="gs://local_output/processed_path/form2307",
+        gcs_input_uri=f"gs://bench/input/{index}.pdf",
+        input_mime_type="application/pdf",
+        client=client,
+        wait=wait,
+        pending_store=store,
+        process_fn=noop_output,
+    )
+
+def bench_blocking(args):
+    client = LocalDocumentProcessorClient(operation_overhead=args.overhead, max_concurrent_operations=10_000)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(lambda i: submit(client, i, True, None), range(args.documents)))
+    wall = time.perf_counter() - start
+    return {"mode": "blocking", "submit_s": round(wall, 3), "all_done_s": round(wall, 3)}
+
+def bench_submit_only(args):
+    client = LocalDocumentProcessorClient(operation_overhead=args.overhead, max_concurrent_operations=10_000)
+    store = pending_operations.SQLitePendingStore()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(lambda i: submit(client, i, False, store), range(args.documents)))
+    submitted = time.perf_counter() - start
+
+    # Completion path, polled like the scheduled pollTrigger would
+    completed = 0
+    while store.list():
+        summary = pending_operations.poll_pending(store, client=client, process_fn=noop_output)
+        completed += summary["completed"]
+        if summary["running"]:
+            time.sleep(args.poll_interval)
+    assert completed == args.documents, "every submitted operation must be completed once"
+    return {
+        "mode": "submit_only",
+        "submit_s": round(submitted, 3),
+        "all_done_s": round(time.perf_counter() - start, 3),
+    }
+
+def bench_shard_events(args):
+    with tempfile.TemporaryDirectory() as root:
+        storage_client = LocalStorageClient(root)
+        store = pending_operations.GcsPendingStore("pending", storage_client=storage_client)
+        client = LocalDocumentProcessorClient(operation_overhead=0, per_document=0, max_concurrent_operations=10_000)
+        names = [
+            submit(client, i, False, store)[f"gs://bench/input/{i}.pdf"]["operation"]
+            for i in range(args.pending)
+        ]
+
+        # One shard event: find its operation's record
+        shard = f"processed_path/form2307/{pending_operations.operation_id(names[-1])}/0/doc-0.json"
+        before = storage_client.requests
+        assert pending_operations.find_by_output(shard, store) == names[-1]
+        lookup_requests = storage_client.requests - before
+
+        # The same operation completed by shard events on several instances,
+        # each with its own guard over the shared lease bucket
+        processed = []
+        lock = threading.Lock()
+
+        def count_output(output_gcs_destination, handler, userId, doc_type, source=None):
+            with lock:
+                processed.append(output_gcs_destination)
+            return {"status": "ok"}
+
+        def instance(_):
+            guard = IdempotencyGuard(GcsLeaseStore("leases", storage_client=storage_client))
+            return pending_operations.complete_operation(names[0], store, client=client, guard=guard,
+                                                         process_fn=count_output)
+
+        with ThreadPoolExecutor(max_workers=args.instances) as pool:
+            statuses = list(pool.map(instance, range(args.instances)))
+        assert len(processed) == 1, processed
+        # Only the instance that did the work reports it completed
+        assert statuses.count(pending_operations.COMPLETED) == 1, statuses
+    return {
+        "mode": "shard_events",
+        "pending_operations": args.pending,
+        "lookup_requests": lookup_requests,
+        "instances": args.instances,
+        "times_completed": len(processed),
+        "reported_completed": statuses.count(pending_operations.COMPLETED),
+        "reported_skipped": statuses.count(pending_operations.SKIPPED),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4, help="concurrent trigger slots")
+    parser.add_argument("--overhead", type=float, default=1.0, help="seconds per operation")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--pending", type=int, default=200, help="pending operations for the shard lookup")
+    parser.add_argument("--instances", type=int, default=8, help="instances completing one operation")
+    args = parser.parse_args()
+
+    for result in (bench_blocking(args), bench_submit_only(args)):
+        result["documents"] = args.documents
+        result["submissions_per_s"] = round(args.documents / result["submit_s"], 2)
+        print(json.dumps(result))
+    print(json.dumps(bench_shard_events(args)))
+
+if __name__ == '__main__':
+    main()
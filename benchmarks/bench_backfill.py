@@ -0,0 +1,134 @@
+"""
+Backfill throughput (docs/sec, pages/sec) for different page budgets per
+batch and concurrency, a resume after an interrupted run, and an operation
+cancelled half way, using the local storage and processor stand-ins.
+
+The output stage is replaced by a stand-in that sleeps per page, so the
+numbers show how batching and concurrency hide the operation overhead.
+
+Run from the repository root:
+    python -m benchmarks.bench_backfill --documents 200
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import fitz
+
+import backfill
+import docai_batch
+from local_processor import LocalDocumentProcessorClient
+from local_storage import LocalStorageClient
+
+def make_archive(storage, documents, pages):
+    pdf = fitz.open()
+    for _ in range(pages):
+        pdf.new_page(width=612, height=1008)
+    data = pdf.tobytes()
+    pdf.close()
+
+    bucket = storage.bucket("archive")
+    for i in range(documents):
+        blob = bucket.blob(f"2307/2024/{i:05d}.pdf")
+        blob.metadata = {"userid": "backfill"}
+        blob.upload_from_string(data, content_type="application/pdf")
+
+def run(args, storage, pages_per_batch, concurrency, checkpoint_path, limit=None, timeout=None,
+        client=None):
+    client = client or LocalDocumentProcessorClient(
+        operation_overhead=args.overhead,
+        per_document=args.per_document,
+        max_concurrent_operations=concurrency,
+    )
+
+    def post_process(output_gcs_destination, handler, userId, doc_type, source=None):
+        time.sleep(args.post_process * args.pages)
+        return {"status": "ok", "output": output_gcs_destination, "pages": args.pages}
+
+    return backfill.backfill(
+        "gs://archive/2307/2024/",
+        doc_type="form2307",
+        checkpoint_path=checkpoint_path,
+        pages_per_batch=pages_per_batch,
+        concurrency=concurrency,
+        limit=limit,
+        client=client,
+        storage_client=storage,
+        process_fn=post_process,
+        timeout=timeout,
+    )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=2, help="pages per document")
+    parser.add_argument("--overhead", type=float, default=1.0, help="seconds per operation")
+    parser.add_argument("--per-document", type=float, default=0.01)
+    parser.add_argument("--post-process", type=float, default=0.002, help="seconds per page")
+    parser.add_argument("--configs", default="2x1,20x1,100x1,100x4", help="pages_per_batch x concurrency")
+    parser.add_argument("--poll", type=float, default=0.05, help="seconds between operation polls")
+    args = parser.parse_args()
+    docai_batch.INCREMENTAL_POLL_SECONDS = args.poll
+
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorageClient(root)
+        make_archive(storage, args.documents, args.pages)
+
+        for config in args.configs.split(","):
+            pages_per_batch, concurrency = map(int, config.split("x"))
+            summary = run(args, storage, pages_per_batch, concurrency, None)
+            print(json.dumps({
+                "pages_per_batch": pages_per_batch,
+                "batches": -(-args.documents * args.pages // pages_per_batch),
+                "concurrency": concurrency,
+                "documents": summary["ok"],
+                "seconds": summary["seconds"],
+                "docs_per_sec": summary["docs_per_sec"],
+                "pages_per_sec": summary["pages_per_sec"],
+            }))
+
+        # Interrupted run (half the documents), then a resume with the same checkpoint
+        checkpoint = os.path.join(root, "checkpoint.jsonl")
+        first = run(args, storage, 100, 4, checkpoint, limit=args.documents // 2)
+        resumed = run(args, storage, 100, 4, checkpoint)
+        assert first["ok"] + resumed["ok"] == args.documents, (first, resumed)
+        print(json.dumps({
+            "resume": True,
+            "first_run_documents": first["ok"],
+            "skipped_on_resume": resumed["skipped"],
+            "resumed_documents": resumed["ok"],
+        }))
+
+        # An operation outliving --timeout is cancelled, not left running
+        # while its documents are resubmitted by the next run
+        client = LocalDocumentProcessorClient(operation_overhead=args.overhead, per_document=args.per_document)
+        timed_out = run(args, storage, 100, 1, None, limit=50, timeout=args.overhead / 2, client=client)
+        assert timed_out["failed"] == 50 and client.in_flight == 0, timed_out
+        print(json.dumps({
+            "timeout": True,
+            "failed_documents": timed_out["failed"],
+            "operations_left_running": client.in_flight,
+            "default_timeout_200_pages": backfill.batch_timeout(200),
+        }))
+
+        # Cancelled half way: the documents Document AI finished are kept,
+        # the next run only resubmits the others
+        checkpoint = os.path.join(root, "cancelled.jsonl")
+        client = LocalDocumentProcessorClient(operation_overhead=args.overhead, per_document=args.per_document)
+        cancelled = run(args, storage, 100, 1, checkpoint, limit=50,
+                        timeout=args.overhead + 25 * args.per_document, client=client)
+        resumed = run(args, storage, 100, 1, checkpoint, limit=cancelled["failed"])
+        assert 0 < cancelled["ok"] < 50 and cancelled["ok"] + cancelled["failed"] == 50, cancelled
+        assert resumed["skipped"] == cancelled["ok"] and resumed["ok"] == cancelled["failed"], (cancelled, resumed)
+        print(json.dumps({
+            "cancelled_half_way": True,
+            "kept_documents": cancelled["ok"],
+            "failed_documents": cancelled["failed"],
+            "skipped_on_resume": resumed["skipped"],
+            "resubmitted_on_resume": resumed["ok"],
+        }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Compares one Document AI operation per upload against coalesced batches,
+using the local stand-in processor.
+
+Run from the repository root:
+    python -m benchmarks.bench_coalescer --events 200 --window 0.5
+"""
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core.exceptions import ResourceExhausted
+from google.cloud import documentai
+import argparse
+import json
+import time
+
+from coalescer import EventCoalescer
+from docai_batch import build_input_config
+from local_processor import LocalDocumentProcessorClient
+
+def run_items(client, items, retry_delay):
+    """Submits items as one operation and waits for it, retrying on quota errors."""
+    request = documentai.BatchProcessRequest(
+        name=client.processor_path("local", "us", "bench"),
+        input_documents=build_input_config(gcs_input_documents=items),
+    )
+    retries = 0
+    while True:
+        try:
+            operation = client.batch_process_documents(request)
+            break
+        except ResourceExhausted:
+            retries += 1
+            time.sleep(retry_delay)
+    operation.result()
+    metadata = documentai.BatchProcessMetadata(operation.metadata)
+    by_source = {p.input_gcs_source: p.output_gcs_destination for p in metadata.individual_process_statuses}
+    return [by_source.get(item["gcs_uri"]) for item in items], retries
+
+def make_client(args):
+    return LocalDocumentProcessorClient(
+        operation_overhead=args.overhead,
+        per_document=args.per_document,
+        max_concurrent_operations=args.quota,
+    )
+
+def bench_per_event(args, events):
+    client = make_client(args)
+    retries = [0]
+
+    def handle(item):
+        time.sleep(item["arrival"])
+        _, r = run_items(client, [item], args.retry_delay)
+        retries[0] += r
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(handle, events))
+    return {
+        "mode": "per_event",
+        "wall_s": round(time.perf_counter() - start, 3),
+        "operations": client.operations,
+        "quota_rejections": client.rejected,
+    }
+
+def bench_coalesced(args, events):
+    client = make_client(args)
+
+    def flush(key, items):
+        results, _ = run_items(client, items, args.retry_delay)
+        return results
+
+    coalescer = EventCoalescer(flush, max_batch_size=args.max_batch, max_wait_seconds=args.window)
+
+    def handle(item):
+        time.sleep(item["arrival"])
+        return coalescer.submit("form2307", item).result()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outputs = list(pool.map(handle, events))
+    assert all(outputs), "every event must get its own output destination back"
+    return {
+        "mode": "coalesced",
+        "wall_s": round(time.perf_counter() - start, 3),
+        "operations": client.operations,
+        "quota_rejections": client.rejected,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--spread", type=float, default=2.0, help="seconds over which events arrive")
+    parser.add_argument("--window", type=float, default=0.5)
+    parser.add_argument("--max-batch", type=int, default=50)
+    parser.add_argument("--overhead", type=float, default=1.0, help="seconds per operation")
+    parser.add_argument("--per-document", type=float, default=0.02)
+    parser.add_argument("--quota", type=int, default=5, help="concurrent operations allowed")
+    parser.add_argument("--retry-delay", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=200, help="events handled at once")
+    args = parser.parse_args()
+
+    events = [
+        {
+            "gcs_uri": f"gs://bench/input/{i}.pdf",
+            "mime_type": "application/pdf",
+            "arrival": args.spread * i / args.events,
+        }
+        for i in range(args.events)
+    ]
+
+    for result in (bench_per_event(args, events), bench_coalesced(args, events)):
+        result["events"] = args.events
+        result["docs_per_s"] = round(args.events / result["wall_s"], 2)
+        print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Date parsing throughput on OCR-like date strings: dateutil (as the handlers
+and getquarter called it) against the dates engine, with its cache cleared
+(every string parsed) and warm (strings repeating as they do across the
+pages and documents of a batch), plus the 2307 path end to end (norm_date,
+validate_date_range, quarter).
+
+Run from the repository root:
+    python -m benchmarks.bench_dates --values 20000
+"""
+import argparse
+import json
+import random
+import time
+
+from dateutil import parser as dateutil_parser
+
+import dates
+import normalize
+from benchmarks.bench_normalize import legacy_date, misread
+
+MONTH_NAMES = ("January", "February", "March", "April", "May", "June", "July",
+               "August", "September", "October", "November", "December")
+
+# (weight, format) of the dates seen on invoices and 2307s
+FORMATS = (
+    (30, "{m:02d}-{d:02d}-{y}"),
+    (20, "{m}/{d}/{y}"),
+    (10, "{m:02d}/{d:02d}/{y}"),
+    (8, "{m:02d} {d:02d} {y}"),
+    (8, "{name} {d}, {y}"),
+    (6, "{short} {d} {y}"),
+    (5, "{d} {name} {y}"),
+    (4, "{d}-{short}-{y}"),
+    (3, "{y}-{m:02d}-{d:02d}"),
+    (3, "Date: {m:02d}/{d:02d}/{y}"),
+    (3, "{m:02d}-{d:02d}-{yy:02d}"),
+    # Century misread as zeros, dateutil reads 0025 as 25 or 2025 depending on the format
+    (1, "{m:02d}-{d:02d}-00{yy:02d}"),
+    (1, "{name} {d}, 00{yy:02d}"),
+    (1, "{d}-{short}-00{yy:02d}"),
+)
+
+def ocr_date(rng):
+    m, d, y = rng.randint(1, 12), rng.randint(1, 28), rng.randint(2019, 2026)
+    fmt = rng.choices([f for _, f in FORMATS], weights=[w for w, _ in FORMATS])[0]
+    return fmt.format(m=m, d=d, y=y, yy=y % 100, name=MONTH_NAMES[m - 1], short=MONTH_NAMES[m - 1][:3])
+
+def form_date(rng):
+    """A 2307 period date with OCR misreads, mostly quarter starts and ends."""
+    q = rng.randint(0, 3)
+    m, d = rng.choice([(3 * q + 1, 1), (3 * q + 3, 30 if q in (1, 2) else 31)])
+    fmt = rng.choice(["{m:02d}-{d:02d}-{y}", "{m:02d} {d:02d} {y}", "{m:02d}{d:02d}{y}", "{m:02d}-{d:02d}-00{yy:02d}"])
+    y = rng.randint(2019, 2026)
+    return misread(fmt.format(m=m, d=d, y=y, yy=y % 100), rng)
+
+def per_second(fn, values):
+    start = time.perf_counter()
+    for value in values:
+        fn(value)
+    return round(len(values) / (time.perf_counter() - start))
+
+def legacy_fuzzy(text):
+    try:
+        return dateutil_parser.parse(text, fuzzy=True).strftime("%m-%d-%Y")
+    except (ValueError, OverflowError):
+        return None
+
+def legacy_2307(from_text, to_text):
+    """norm_date, validate_date_range and quarter as they used to parse."""
+    from_date, to_date = legacy_date(from_text), legacy_date(to_text)
+    try:
+        dateutil_parser.parse(from_date) <= dateutil_parser.parse(to_date)
+        return dateutil_parser.parse(to_date).month
+    except ValueError:
+        return None
+
+def engine_2307(from_text, to_text):
+    from_date, to_date = dates.parse_date(normalize.norm_date(from_text)), dates.parse_date(normalize.norm_date(to_text))
+    if from_date is None or to_date is None:
+        return None
+    from_date <= to_date
+    return dates.parse_date(to_date.text).month
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--values", type=int, default=20000)
+    parser.add_argument("--distinct", type=int, default=500, help="distinct strings in the warm corpus")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    unique = [ocr_date(rng) for _ in range(args.values)]
+    pool = [ocr_date(rng) for _ in range(args.distinct)]
+    repeated = [rng.choice(pool) for _ in range(args.values)]
+
+    # Same dates as dateutil
+    for text in unique:
+        parsed = dates.parse_date(text, fuzzy=True)
+        assert (parsed and parsed.text) == legacy_fuzzy(text), text
+    fast = sum(dates._fast_path(text) is not None for text in unique)
+
+    dates.parse_date.cache_clear()
+    cold = per_second(lambda text: dates.parse_date(text, True), unique)
+    dates.parse_date.cache_clear()
+    warm = per_second(lambda text: dates.parse_date(text, True), repeated)
+    print(json.dumps({
+        "corpus": "ocr_dates",
+        "values": args.values,
+        "fast_path_share": round(fast / len(unique), 3),
+        "dateutil_per_s": per_second(legacy_fuzzy, unique),
+        "engine_cold_per_s": cold,
+        "engine_warm_per_s": warm,
+        "warm_distinct": args.distinct,
+    }))
+
+    # 2307 periods: from/to pairs, normalized, validated and quartered
+    pairs = [(form_date(rng), form_date(rng)) for _ in range(args.values)]
+    for pair in pairs[:2000]:
+        assert engine_2307(*pair) == legacy_2307(*pair), pair
+    normalize.norm_date.cache_clear()
+    dates.parse_date.cache_clear()
+    print(json.dumps({
+        "corpus": "form2307_periods",
+        "values": args.values,
+        "legacy_per_s": per_second(lambda pair: legacy_2307(*pair), pairs),
+        "engine_per_s": per_second(lambda pair: engine_2307(*pair), pairs),
+    }))
+
+if __name__ == '__main__':
+    main()
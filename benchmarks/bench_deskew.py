@@ -0,0 +1,88 @@
+"""
+Deskew angle estimation: the per-block Python loop it replaced versus the
+vectorized block_angles/skew_angle, on synthetic layouts with many blocks,
+plus deskew_using_layout on a straight and a skewed page.
+
+Run from the repository root:
+    python -m benchmarks.bench_deskew --blocks 100,400,1000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import fast_document
+import image_extract
+from benchmarks.synthetic import make_blocks, make_page_image
+
+def loop_angle(blocks):
+    """The previous implementation: sort each block's vertices, scalar arctan2."""
+    angles = []
+    for block in blocks:
+        bbox = sorted(block.layout.bounding_poly.normalized_vertices, key=lambda v: (v.y, v.x))
+        if len(bbox) >= 2:
+            angles.append(np.degrees(np.arctan2(bbox[1].y - bbox[0].y, bbox[1].x - bbox[0].x)))
+    return np.median(angles) if angles else None
+
+def vector_angle(blocks):
+    return image_extract.skew_angle(image_extract.block_angles(blocks))
+
+def make_layout(count, skew, seed=0):
+    """count text-block boxes on a grid, rotated by skew degrees."""
+    rng = np.random.default_rng(seed)
+    boxes = []
+    for i in range(count):
+        x = rng.uniform(0.05, 0.7)
+        y = (i + 1) / (count + 2)
+        boxes.append((x, y, x + rng.uniform(0.05, 0.25), y + 0.008))
+    return make_blocks(boxes, skew=skew)
+
+def lite_blocks(blocks):
+    """Same blocks as fast_document records."""
+    return [
+        fast_document.LiteBlock({"layout": {"boundingPoly": {"normalizedVertices": [
+            {"x": v.x, "y": v.y} for v in block.layout.bounding_poly.normalized_vertices
+        ]}}})
+        for block in blocks
+    ]
+
+def timeit(fn, *args, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+class Page:
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", default="100,400,1000")
+    parser.add_argument("--skew", type=float, default=-1.5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for count in map(int, args.blocks.split(",")):
+        blocks = make_layout(count, args.skew)
+        for kind, layout in (("proto", blocks), ("lite", lite_blocks(blocks))):
+            print(json.dumps({
+                "blocks": count,
+                "records": kind,
+                "loop_ms": round(timeit(loop_angle, layout, repeat=args.repeat), 3),
+                "vectorized_ms": round(timeit(vector_angle, layout, repeat=args.repeat), 3),
+                "angle": round(vector_angle(layout), 3),
+            }))
+
+    # Whole deskew on a full page: a straight scan skips the warp
+    for skew in (0.0, args.skew):
+        img, boxes = make_page_image(skew=skew)
+        page = Page(make_blocks(boxes, skew=skew))
+        print(json.dumps({
+            "page_skew": skew,
+            "deskew_ms": round(timeit(image_extract.deskew_using_layout, img, page, repeat=5), 2),
+        }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Parse time and peak memory of one shard with documentai.Document.from_json
+versus fast_document.load_document, on large scanned pages.
+
+Each measurement runs in a fresh interpreter so peak RSS isn't shared
+between loaders (protobuf allocations aren't visible to tracemalloc).
+
+Run from the repository root:
+    python -m benchmarks.bench_document_loader --width 2480 --height 3508
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import make_shard
+
+SNIPPET = r"""
+import json, resource, sys, time
+path, loader, access = sys.argv[1:4]
+data = open(path, "rb").read()
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+start = time.perf_counter()
+if loader == "proto":
+    from google.cloud import documentai
+    document = documentai.Document.from_json(data, ignore_unknown_fields=True)
+else:
+    import fast_document
+    document = fast_document.load_document(data)
+parsed = time.perf_counter()
+
+# What the pipeline reads: entities always, the image only for the image stage
+types = [e.type for e in document.entities]
+if access == "image":
+    size = len(document.pages[0].image.content)
+done = time.perf_counter()
+
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "parse_ms": (parsed - start) * 1000,
+    "total_ms": (done - start) * 1000,
+    "peak_rss_delta_mb": (after - before) / 1024,
+}))
+"""
+
+def run(path, loader, access):
+    out = subprocess.run(
+        [sys.executable, "-c", SNIPPET, path, loader, access],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=2480)
+    parser.add_argument("--height", type=int, default=3508)
+    parser.add_argument("--rows", type=int, default=20, help="table rows (entities)")
+    args = parser.parse_args()
+
+    shard = make_shard(width=args.width, height=args.height, rows=args.rows)
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        f.write(shard)
+        path = f.name
+    try:
+        for access in ("entities", "image"):
+            for loader in ("proto", "fast"):
+                result = run(path, loader, access)
+                result = {k: round(v, 2) for k, v in result.items()}
+                print(json.dumps({
+                    "loader": loader,
+                    "access": access,
+                    "shard_mb": round(len(shard) / 1024 / 1024, 2),
+                    **result,
+                }))
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+handle_data time per document on entity-heavy 2307 tables: the handler
+reading documentai.Document entities through their proto-plus wrappers
+against the same document converted to fast_document records from its
+protobuf (what handle_data does now), and a LiteDocument parsed from the
+shard JSON for reference.
+
+Run from the repository root:
+    python -m benchmarks.bench_handlers --rows 10,50,200
+"""
+from google.cloud import documentai
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import fast_document
+import handle_data_2307
+import service_invoice_data_handler
+from benchmarks.synthetic import make_entities
+
+def invoice_entities(rows):
+    """Service Invoice header fields and Item_Table rows."""
+    entity = documentai.Document.Entity
+    entities = [
+        entity(type_="Invoice_No", mention_text="No. 0O1234", confidence=0.95),
+        entity(type_="Date", mention_text="March 15, 2025", confidence=0.93,
+               normalized_value=entity.NormalizedValue(text="2025-03-15")),
+        entity(type_="Registered_Name", mention_text="HARMONY HOSPITAL", confidence=0.91),
+        entity(type_="Sold_To_Tin", mention_text="123-333-221-001", confidence=0.94),
+        entity(type_="Item_Table_2", confidence=0.9, properties=[
+            entity(type_="Less_Witholding_Tax", mention_text="P 2,5OO.00"),
+            entity(type_="Total_Amount_Due", mention_text="P 122,5OO.00"),
+        ]),
+    ]
+    for i in range(rows):
+        entities.append(entity(type_="Item_Table", confidence=0.9, properties=[
+            entity(type_="Item_Description_Nature_Of_Service", mention_text=f"Service {i}"),
+            entity(type_="Amount", mention_text="P 1,250.0O"),
+        ]))
+    return entities
+
+def per_document_us(fn, document, repeat):
+    # Handlers print validation errors, keep them out of the timing output
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(document)
+    return round((time.perf_counter() - start) * 1e6 / repeat, 1)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="10,50,200", help="table rows per document, comma separated")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    handlers = (
+        ("form2307", handle_data_2307._SCHEMA, make_entities),
+        ("service_invoice", service_invoice_data_handler._SCHEMA, invoice_entities),
+    )
+    for doc_type, schema, entities in handlers:
+        for rows in map(int, args.rows.split(",")):
+            document = documentai.Document(entities=entities(rows))
+            lite = fast_document.load_document(documentai.Document.to_json(document), images=False, blocks=False)
+
+            # Same output whichever way the entities are read
+            expected = schema.handle_entities(document.entities)
+            assert schema.handle(document) == expected == schema.handle(lite), doc_type
+
+            proto_plus = per_document_us(lambda d: schema.handle_entities(d.entities), document, args.repeat)
+            records = per_document_us(schema.handle, document, args.repeat)
+            print(json.dumps({
+                "doc_type": doc_type,
+                "rows": rows,
+                "entities": len(document.entities),
+                "proto_plus_us": proto_plus,
+                "records_us": records,
+                "conversion_us": per_document_us(fast_document.entity_records, document, args.repeat),
+                "lite_document_us": per_document_us(schema.handle, lite, args.repeat),
+                "speedup": round(proto_plus / records, 2),
+            }))
+
+if __name__ == '__main__':
+    main()
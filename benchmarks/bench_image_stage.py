@@ -0,0 +1,59 @@
+"""
+Pages/sec of the image cleaning stage (decode, deskew, blur, threshold,
+encode) for 1, 2, 4 and 8 workers, with a thread pool and with a process
+pool fed through shared memory.
+
+Run from the repository root:
+    python -m benchmarks.bench_image_stage --pages 16
+"""
+import argparse
+import json
+import os
+import time
+
+import fast_document
+from image_stage import ImageStage
+from benchmarks.synthetic import make_shard
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--width", type=int, default=1700)
+    parser.add_argument("--height", type=int, default=2200)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--modes", default="thread,process")
+    args = parser.parse_args()
+
+    pages = [
+        fast_document.load_document(
+            make_shard(width=args.width, height=args.height, skew=1.5, seed=n), entities=False
+        ).pages[0]
+        for n in range(args.pages)
+    ]
+    # Decode the base64 once up front, both modes start from raw image bytes
+    for page in pages:
+        page.image.content
+
+    for mode in args.modes.split(","):
+        for workers in map(int, args.workers.split(",")):
+            stage = ImageStage(workers=workers, mode=mode)
+            # Start the pool (process workers import OpenCV) outside the timing
+            stage.clean_pages(pages[:workers])
+
+            start = time.perf_counter()
+            cleaned = stage.clean_pages(pages)
+            wall = time.perf_counter() - start
+            stage.shutdown()
+
+            assert len(cleaned) == args.pages
+            print(json.dumps({
+                "mode": mode,
+                "workers": workers,
+                "cores": os.cpu_count(),
+                "pages": args.pages,
+                "pages_per_sec": round(args.pages / wall, 2),
+                "ms_per_page": round(wall * 1000 / args.pages, 1),
+            }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Time to first finished document and total time for a multi-document batch,
+waiting for the whole operation versus consuming inputs as they finish.
+
+Uses the local stand-in processor (inputs finish one after another) and a
+post-processing stand-in that sleeps for a fixed time per document.
+
+Run from the repository root:
+    python -m benchmarks.bench_incremental_outputs --documents 10
+"""
+import argparse
+import json
+import threading
+import time
+
+import docai_batch
+from local_processor import LocalDocumentProcessorClient
+
+def run(args, incremental):
+    client = LocalDocumentProcessorClient(
+        operation_overhead=args.overhead,
+        per_document=args.per_document,
+        max_concurrent_operations=10,
+    )
+    finished = []
+    lock = threading.Lock()
+
+    def post_process(output_gcs_destination, handler, userId, doc_type, source=None):
+        time.sleep(args.post_process)
+        with lock:
+            finished.append(time.perf_counter())
+        return {"status": "ok", "output": output_gcs_destination}
+
+    inputs = [
+        {"gcs_uri": f"gs://bench/input/{i}.pdf", "mime_type": "application/pdf", "userId": "bench"}
+        for i in range(args.documents)
+    ]
+
+    docai_batch.INCREMENTAL_POLL_SECONDS = args.poll
+    start = time.perf_counter()
+    results = docai_batch.batch_process_documents(
+        handler=None,
+        userId="bench",
+        doc_type="form2307",
+        project_id="local",
+        location="us",
+        processor_id="bench",
+        gcs_output_uri="gs://local_output/processed_path/form2307",
+        gcs_input_documents=inputs,
+        client=client,
+        process_fn=post_process,
+        incremental=incremental,
+    )
+    assert all(r["status"] == "ok" for r in results.values()) and len(results) == args.documents
+    return {
+        "mode": "incremental" if incremental else "wait_for_all",
+        "first_result_s": round(min(finished) - start, 3),
+        "all_results_s": round(max(finished) - start, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--overhead", type=float, default=1.0)
+    parser.add_argument("--per-document", type=float, default=0.5, help="Document AI seconds per input")
+    parser.add_argument("--post-process", type=float, default=0.4, help="our seconds per input")
+    parser.add_argument("--poll", type=float, default=0.1)
+    args = parser.parse_args()
+
+    for incremental in (False, True):
+        result = run(args, incremental)
+        result["documents"] = args.documents
+        print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Per-value cost of the field normalizers: the handlers' previous chained
+str.replace + filter(str.isdigit) versions against normalize.py, called one
+value at a time and as batches.
+
+Values are OCR-like TINs, ZIP codes, invoice numbers, amounts and 2307 dates
+with misread letters, separators and stray spaces.
+
+Run from the repository root:
+    python -m benchmarks.bench_normalize --values 100000
+"""
+from datetime import datetime
+import argparse
+import json
+import random
+import re
+import time
+
+import normalize
+
+# The normalizers as both handlers defined them before normalize.py
+def legacy_digits(text):
+    mapping = {"O": "0", "o": "0", "I": "1", "l": "1", "S": "5", "p":"0"}
+    for k, v in mapping.items():
+        text = text.replace(k, v)
+    return ''.join(filter(str.isdigit, text))
+
+def legacy_tin(num):
+    return int(legacy_digits(num))
+
+def legacy_zip_code(zip_code):
+    zip_code = legacy_digits(zip_code)
+    return zip_code if len(zip_code) == 4 else zip_code + " [INVALID]"
+
+def legacy_currency(currency):
+    mapping = {"O": "0", "o": "0", "I": "1", "l": "1", "S": "5", "p":"0"}
+    for k, v in mapping.items():
+        currency = currency.replace(k, v)
+    return re.sub(r"[^0-9.]", "", currency)
+
+def legacy_date(date_str):
+    mapping = {"O": "0", "o": "0", "I": "1", "l": "1", "S": "5", "p":"0"}
+    for k, v in mapping.items():
+        date_str = date_str.replace(k, v)
+    date = "".join(filter(str.isdigit, date_str))
+    if len(date) < 6 or len(date) > 8:
+        return f"{date} [INVALID]"
+    year, mmdd = date[-4:], date[:-4]
+    month, day = (mmdd[:2], mmdd[2:]) if len(mmdd) == 4 else (mmdd[:1], mmdd[1:])
+    try:
+        dt = datetime.strptime(f"{month.zfill(2)}-{day.zfill(2)}-{year}", "%m-%d-%Y")
+    except ValueError:
+        try:
+            dt = datetime.strptime(f"{mmdd[:2].zfill(2)}-{mmdd[2:].zfill(2)}-{year}", "%m-%d-%Y")
+        except ValueError:
+            return f"{date_str} [INVALID]"
+    return dt.strftime("%m-%d-%Y")
+
+def misread(text, rng):
+    """Swaps some digits for the letters OCR confuses them with."""
+    swaps = {"0": "Oop", "1": "Il", "5": "S"}
+    return "".join(rng.choice(swaps[c]) if c in swaps and rng.random() < 0.15 else c for c in text)
+
+def corpus(kind, count, rng):
+    values = []
+    for _ in range(count):
+        if kind == "tin":
+            d = "".join(rng.choice("0123456789") for _ in range(12))
+            value = f"{d[:3]}-{d[3:6]}-{d[6:9]}-{d[9:]}"
+        elif kind == "zip_code":
+            value = f"{rng.randint(400, 9800):04d}" + rng.choice(["", " ", "."])
+        elif kind == "invoice_no":
+            value = rng.choice(["No. ", "N° ", "#", ""]) + f"{rng.randint(1, 999999):06d}"
+        elif kind == "currency":
+            value = rng.choice(["P", "PHP ", "₱", ""]) + f"{rng.randint(100, 9999999) / 100:,.2f}"
+        else:
+            value = rng.choice(["{m:02d}-{d:02d}-{y}", "{m}/{d}/{y}", "{m:02d} {d:02d} {y}", "{m}{d:02d}{y}"]).format(
+                m=rng.randint(1, 12), d=rng.randint(1, 28), y=rng.randint(2019, 2026))
+        values.append(misread(value, rng))
+    return values
+
+CASES = {
+    "tin": (legacy_tin, normalize.norm_tin, normalize.norm_tins),
+    "zip_code": (legacy_zip_code, normalize.norm_zip_code, normalize.norm_zip_codes),
+    "invoice_no": (legacy_digits, normalize.norm_invoice_no, normalize.norm_invoice_nos),
+    "currency": (legacy_currency, normalize.norm_currency, normalize.norm_currencies),
+    "date": (legacy_date, normalize.norm_date, normalize.norm_dates),
+}
+
+def ns_per_value(fn, values, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        # Time the parsing, not the norm_date cache
+        normalize.norm_date.cache_clear()
+        start = time.perf_counter()
+        fn(values)
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1e9 / len(values), 1)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--values", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=50, help="values per batched call")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for kind, (legacy, scalar, batched) in CASES.items():
+        values = corpus(kind, args.values, rng)
+        batches = [values[i:i + args.batch] for i in range(0, len(values), args.batch)]
+
+        # Same output as before, the batch API included
+        expected = [legacy(v) for v in values]
+        assert [scalar(v) for v in values] == expected, kind
+        assert [r for batch in batches for r in batched(batch)] == expected, kind
+
+        legacy_ns = ns_per_value(lambda vs: [legacy(v) for v in vs], values, args.repeat)
+        scalar_ns = ns_per_value(lambda vs: [scalar(v) for v in vs], values, args.repeat)
+        batch_ns = ns_per_value(lambda vs: [batched(b) for b in batches], values, args.repeat)
+        print(json.dumps({
+            "field": kind,
+            "values": len(values),
+            "legacy_ns_per_value": legacy_ns,
+            "scalar_ns_per_value": scalar_ns,
+            "batch_ns_per_value": batch_ns,
+            "scalar_speedup": round(legacy_ns / scalar_ns, 2),
+            "batch_speedup": round(legacy_ns / batch_ns, 2),
+        }))
+
+if __name__ == '__main__':
+    main()
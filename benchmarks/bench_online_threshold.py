@@ -0,0 +1,97 @@
+"""
+Sweeps the online processing size threshold over a synthetic mix of uploads
+and reports per-document latency, using the local stand-in processor. Only
+single-page uploads go online, bundles always use batch processing.
+
+Batch processing pays the operation overhead plus two GCS round trips per
+page shard (list/download of the shard JSON); online processing pays the
+online request overhead and, for PDFs, one download to count pages.
+
+Run from the repository root:
+    python -m benchmarks.bench_online_threshold
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from google.cloud import documentai
+
+import docai_batch
+from local_processor import LocalDocumentProcessorClient
+
+def make_uploads(count, seed):
+    """Mostly phone photos, some scanned PDFs of a few pages, a few large bundles."""
+    rng = random.Random(seed)
+    uploads = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.6:
+            uploads.append({"mime_type": "image/jpeg", "size": rng.randint(300_000, 4_000_000), "pages": 1})
+        elif kind < 0.9:
+            pages = rng.randint(1, 4)
+            uploads.append({"mime_type": "application/pdf", "size": pages * rng.randint(200_000, 900_000), "pages": pages})
+        else:
+            pages = rng.randint(8, 30)
+            uploads.append({"mime_type": "application/pdf", "size": pages * rng.randint(200_000, 900_000), "pages": pages})
+        uploads[-1]["gcs_uri"] = f"gs://bench/input/{i}"
+    return uploads
+
+def run_upload(client, upload, args):
+    online = docai_batch.should_process_online(upload["mime_type"], upload["size"])
+    if online and upload["mime_type"] == "application/pdf":
+        # Download to count pages
+        time.sleep(args.rtt)
+        online = upload["pages"] == 1
+
+    start = time.perf_counter()
+    if online:
+        client.process_document(documentai.ProcessRequest(
+            name="local",
+            gcs_document=documentai.GcsDocument(gcs_uri=upload["gcs_uri"], mime_type=upload["mime_type"]),
+        ))
+    else:
+        request = documentai.BatchProcessRequest(
+            name="local",
+            input_documents=docai_batch.build_input_config(gcs_input_documents=[upload]),
+        )
+        client.batch_process_documents(request).result()
+        # list + download of every page shard
+        time.sleep(2 * args.rtt * upload["pages"])
+    return time.perf_counter() - start, online
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--overhead", type=float, default=0.5, help="batch operation overhead (s)")
+    parser.add_argument("--online-overhead", type=float, default=0.08)
+    parser.add_argument("--per-page", type=float, default=0.02)
+    parser.add_argument("--rtt", type=float, default=0.02, help="one GCS round trip (s)")
+    parser.add_argument("--max-bytes", default="0,1000000,5000000,20000000")
+    args = parser.parse_args()
+
+    uploads = make_uploads(args.uploads, args.seed)
+    client = LocalDocumentProcessorClient(
+        operation_overhead=args.overhead,
+        per_document=0,
+        max_concurrent_operations=10_000,
+        online_overhead=args.online_overhead,
+        per_page=args.per_page,
+        page_counts={u["gcs_uri"]: u["pages"] for u in uploads},
+    )
+
+    for max_bytes in map(int, args.max_bytes.split(",")):
+        docai_batch.ONLINE_MAX_BYTES = max_bytes
+        samples = [run_upload(client, upload, args) for upload in uploads]
+        latencies = sorted(s[0] for s in samples)
+        print(json.dumps({
+            "online_max_bytes": max_bytes,
+            "online_share": round(sum(s[1] for s in samples) / len(samples), 2),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+            "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+        }))
+
+if __name__ == '__main__':
+    main()
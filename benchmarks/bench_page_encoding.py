@@ -0,0 +1,67 @@
+"""
+Bytes per page and encode time of a cleaned (thresholded) page for the PNG,
+JPEG and CCITT Group 4 encodings, plus the size and PDF writer time of the
+one-page PDF each one produces.
+
+Run from the repository root:
+    python -m benchmarks.bench_page_encoding --pages 5
+"""
+import argparse
+import json
+import time
+
+import io
+
+import fast_document
+import image_extract
+from pdf_stream import StreamingPdfWriter
+from benchmarks.synthetic import make_shard
+
+def make_pdf(pages):
+    out = io.BytesIO()
+    writer = StreamingPdfWriter(out)
+    for page in pages:
+        writer.add_page(page)
+    writer.close()
+    return out.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--width", type=int, default=1700)
+    parser.add_argument("--height", type=int, default=2200)
+    args = parser.parse_args()
+
+    # Thresholded pages, as they come out of the filters
+    binarized = []
+    for n in range(args.pages):
+        page = fast_document.load_document(
+            make_shard(width=args.width, height=args.height, skew=1.5, seed=n), entities=False
+        ).pages[0]
+        img, ext, scale = image_extract.decode_page(page, max_dimension=0)
+        img = image_extract.rotate_image(img, image_extract.page_skew(page))
+        img = image_extract.cv2.adaptiveThreshold(
+            img, 255, image_extract.cv2.ADAPTIVE_THRESH_GAUSSIAN_C, image_extract.cv2.THRESH_BINARY, 35, 10
+        )
+        binarized.append(img)
+
+    for encoding in ("png", "jpeg", "g4"):
+        start = time.perf_counter()
+        encoded = [image_extract.encode_page(img, ".png", encoding=encoding) for img in binarized]
+        encode_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pdf = make_pdf(encoded)
+        pdf_s = time.perf_counter() - start
+
+        print(json.dumps({
+            "encoding": encoding,
+            "pages": args.pages,
+            "kb_per_page": round(sum(map(len, encoded)) / 1024 / args.pages, 1),
+            "encode_ms_per_page": round(encode_s * 1000 / args.pages, 1),
+            "pdf_kb_per_page": round(len(pdf) / 1024 / args.pages, 1),
+            "pdf_writer_ms_per_page": round(pdf_s * 1000 / args.pages, 1),
+        }))
+
+if __name__ == '__main__':
+    main()
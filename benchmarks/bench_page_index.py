@@ -0,0 +1,132 @@
+"""
+Page index: certificates filled on one form template with different names,
+TINs and amounts must never be known pages of each other, while the same
+page resent (same file, or copied into another PDF) must be. Also the cost
+of digesting a page against rendering it at 1600px (what the perceptual
+hash needed), dict lookups at up to a million indexed pages, and a store
+round trip on local storage (one request per added document, one index per
+user).
+
+Run from the repository root:
+    python -m benchmarks.bench_page_index --certificates 50
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import fitz
+import numpy as np
+
+import page_index
+from local_storage import LocalStorageClient
+
+PAYEES = ("HARMONY TRADING INC.", "MERIDIAN FOODS CORP.", "SUNRISE HOSPITAL INC.", "PACIFIC LOGISTICS")
+
+def certificate(rng):
+    """One BIR 2307 template page filled with a random payee, TIN and amount, as PDF bytes."""
+    pdf = fitz.open()
+    page = pdf.new_page(width=612, height=1008)
+    page.insert_text((150, 60), "Certificate of Creditable Tax Withheld at Source", fontsize=12)
+    for row, label in enumerate(("Payee's Name", "TIN", "Registered Address", "Amount of Income Payments")):
+        y = 120 + 60 * row
+        page.draw_rect(fitz.Rect(40, y - 14, 572, y + 20), width=0.8)
+        page.insert_text((46, y), label, fontsize=8)
+    page.insert_text((60, 135), str(rng.choice(PAYEES)), fontsize=11)
+    page.insert_text((60, 195), "-".join(f"{rng.integers(0, 1000):03d}" for _ in range(3)) + "-000", fontsize=11)
+    page.insert_text((60, 255), "123 RIZAL AVE., MANILA", fontsize=11)
+    page.insert_text((60, 315), f"{rng.integers(1000, 999999):,}.{rng.integers(0, 100):02d}", fontsize=11)
+    data = pdf.tobytes(garbage=1, deflate=True)
+    pdf.close()
+    return data
+
+def bundle(pages):
+    """A new PDF made of the first page of each PDF, like a resent bundle."""
+    out = fitz.open()
+    for data in pages:
+        with fitz.open(stream=data, filetype="pdf") as source:
+            out.insert_pdf(source, from_page=0, to_page=0)
+    data = out.tobytes(garbage=1, deflate=True)
+    out.close()
+    return data
+
+def ms_per_page(fn, documents):
+    start = time.perf_counter()
+    for data in documents:
+        fn(data)
+    return round((time.perf_counter() - start) * 1000 / len(documents), 2)
+
+def render(data):
+    with fitz.open(stream=data, filetype="pdf") as pdf:
+        page = pdf[0]
+        zoom = 1600 / max(page.rect.width, page.rect.height)
+        page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--certificates", type=int, default=50, help="filled copies of one template")
+    parser.add_argument("--pages", default="10000,100000,1000000", help="indexed pages for the lookup timing")
+    parser.add_argument("--queries", type=int, default=10000)
+    args = parser.parse_args()
+
+    # Same template, different content: never the same page
+    rng = np.random.default_rng(0)
+    filled = [certificate(rng) for _ in range(args.certificates)]
+    digests = [page_index.page_digests(data, "application/pdf")[0] for data in filled]
+    assert len(set(digests)) == len(digests), "two different certificates share a digest"
+
+    # Same pages resent: as the same file and copied into a new bundle
+    resent = page_index.page_digests(filled[0], "application/pdf")
+    copied = page_index.page_digests(bundle(filled[:5]), "application/pdf")
+    assert resent == digests[:1] and copied == digests[:5]
+    print(json.dumps({
+        "same_template_certificates": len(filled),
+        "distinct_digests": len(set(digests)),
+        "resent_file_known": resent == digests[:1],
+        "pages_copied_into_bundle_known": copied == digests[:5],
+        "digest_ms_per_page": ms_per_page(lambda data: page_index.page_digests(data, "application/pdf"), filled),
+        "render_1600_ms_per_page": ms_per_page(render, filled),
+    }))
+
+    # Lookups
+    for pages in map(int, args.pages.split(",")):
+        index = page_index.PageDigestIndex()
+        keys = [f"{value:032x}" for value in range(pages)]
+        start = time.perf_counter()
+        for first in range(0, pages, 2):
+            index.add_document(keys[first:first + 2], {"bucket": "b", "finalized": [], "pdf": "p.pdf", "pages": 2})
+        build_s = time.perf_counter() - start
+        queries = [keys[i] for i in rng.integers(0, pages, size=args.queries)]
+        start = time.perf_counter()
+        found = sum(index.lookup(query) is not None for query in queries)
+        lookup_us = (time.perf_counter() - start) * 1e6 / len(queries)
+        print(json.dumps({
+            "pages": pages,
+            "build_s": round(build_s, 2),
+            "hit_rate": round(found / len(queries), 3),
+            "lookup_us": round(lookup_us, 3),
+        }))
+
+    # Shared store on local storage: one object per added document, one
+    # index per user, a refresh only reads the segments added since
+    with tempfile.TemporaryDirectory() as root:
+        storage_client = LocalStorageClient(root)
+        store = page_index.PageIndexStore("index", storage_client=storage_client)
+        page_index.PAGE_INDEX_REFRESH_SECONDS = 0
+        adds = []
+        for number, digest in enumerate(digests):
+            before = storage_client.requests
+            store.add("form2307", "user-a", [digest], {"bucket": "b", "finalized": [f"{number}"], "pdf": "p.pdf", "pages": 1})
+            adds.append(storage_client.requests - before)
+            store.index("form2307", "user-a")
+        assert store.index("form2307", "user-a").lookup(digests[0])["doc_id"] == 0
+        other_user = store.index("form2307", "user-b").lookup(digests[0])
+        assert other_user is None
+        print(json.dumps({
+            "store_documents": len(digests),
+            "requests_per_add_max": max(adds),
+            "other_user_match": other_user is not None,
+        }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Peak memory of stitching and uploading a many-page PDF: every page kept in
+a list, img2pdf.convert and upload_from_string (the previous path) versus
+upload_pdf_gcs writing pages from a generator into a chunked upload.
+
+Uploads go to the local storage stand-in. Each measurement runs in a fresh
+interpreter so peak RSS isn't shared between runs.
+
+Run from the repository root:
+    python -m benchmarks.bench_pdf_memory --pages 10,50,100
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import cv2
+
+from benchmarks.synthetic import make_page_image
+
+SNIPPET = r"""
+import json, os, resource, sys, time
+page_dir, mode, pages = sys.argv[1], sys.argv[2], int(sys.argv[3])
+files = sorted(os.path.join(page_dir, name) for name in os.listdir(page_dir) if name.endswith(".png"))
+
+import clients, image_extract
+from local_storage import LocalStorageClient
+storage = LocalStorageClient(os.path.join(page_dir, "gcs"))
+clients.set_client("storage", storage)
+
+def read_pages():
+    # Pages arrive one at a time, like the shard stage produces them
+    for n in range(pages):
+        with open(files[n % len(files)], "rb") as f:
+            yield f.read()
+
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+if mode == "buffered":
+    import img2pdf
+    page_list = list(read_pages())
+    pdf = img2pdf.convert(page_list)
+    blob = storage.bucket(image_extract.BUCKET_NAME).blob("form2307/bench.pdf")
+    blob.upload_from_string(pdf, content_type="application/pdf")
+    size = len(pdf)
+else:
+    image_extract.upload_pdf_gcs("bench-0.json", "form2307", read_pages())
+    size = storage.bytes_up
+wall = time.perf_counter() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "wall_s": wall,
+    "pdf_mb": size / 1024 / 1024,
+    "peak_rss_delta_mb": (after - before) / 1024,
+}))
+"""
+
+def run(page_dir, mode, pages):
+    out = subprocess.run(
+        [sys.executable, "-c", SNIPPET, page_dir, mode, str(pages)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", default="10,50,100")
+    parser.add_argument("--distinct", type=int, default=5, help="distinct page images, cycled")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as page_dir:
+        # Cleaned-looking pages: thresholded synthetic scans
+        for n in range(args.distinct):
+            img, _ = make_page_image(seed=n)
+            img = cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 35, 10)
+            cv2.imwrite(os.path.join(page_dir, f"page-{n}.png"), img)
+
+        for pages in map(int, args.pages.split(",")):
+            for mode in ("buffered", "stream"):
+                result = {k: round(v, 2) for k, v in run(page_dir, mode, pages).items()}
+                print(json.dumps({"mode": mode, "pages": pages, **result}))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Per-stage cost of the page image preprocessing on synthetic scanned forms:
+decode, deskew (angle from pages.blocks and rotation), blur, threshold and
+encode as clean_image runs them, then upload_pdf_gcs stitching the cleaned
+pages into a PDF (uploaded to the local storage stand-in).
+
+Pages are letter-size forms at each --dpi, skewed by --skew degrees with
+gaussian noise and speckle. Every resolution runs in a fresh interpreter so
+its peak RSS is its own. One JSON line per resolution: ms/page of every
+stage, the total, and peak RSS in MB.
+
+Run from the repository root:
+    python -m benchmarks.bench_preprocess --dpi 150,200,300 --pages 10
+    python -m benchmarks.bench_preprocess --dpi 300 --max-dimension 0 --encoding g4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+STAGES = ("decode", "deskew", "blur", "threshold", "encode", "stitch")
+
+def run(args):
+    """Times the stages for one resolution, in this process."""
+    import cv2
+
+    import clients
+    import image_extract
+    from local_storage import LocalStorageClient
+    from benchmarks.synthetic import make_page, page_size
+
+    width, height = page_size(args.dpi)
+    pages = [
+        make_page(width, height, skew=args.skew, seed=n, ext=args.ext, noise=args.noise, speckle=args.speckle)
+        for n in range(args.distinct)
+    ]
+    max_dimension = image_extract.preview_max_dimension() if args.max_dimension is None else args.max_dimension
+    if args.encoding:
+        image_extract.PAGE_ENCODING = args.encoding
+
+    totals = dict.fromkeys(STAGES, 0.0)
+    cleaned = []
+
+    def timed(stage, fn, *fn_args):
+        start = time.perf_counter()
+        result = fn(*fn_args)
+        totals[stage] += time.perf_counter() - start
+        return result
+
+    for n in range(args.pages):
+        page = pages[n % len(pages)]
+
+        # Same steps as clean_page -> clean_image, one at a time
+        img, ext, scale = timed("decode", image_extract.decode_page, page, max_dimension)
+        img = timed("deskew", lambda: image_extract.rotate_image(img, image_extract.page_skew(page)))
+        block_size = max(3, int(image_extract.THRESHOLD_BLOCK_SIZE * scale) | 1)
+        img = timed("blur", cv2.medianBlur, img, 1)
+        img = timed("threshold", cv2.adaptiveThreshold, img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                    cv2.THRESH_BINARY, block_size, 10)
+        cleaned.append(timed("encode", image_extract.encode_page, img, ext))
+
+    # The steps above must still be what clean_image does
+    decoded, ext, scale = image_extract.decode_page(pages[0], max_dimension)
+    assert image_extract.clean_image(decoded, image_extract.page_skew(pages[0]), ext, scale) == cleaned[0], \
+        "bench_preprocess is out of date with image_extract.clean_image"
+
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorageClient(root)
+        clients.set_client("storage", storage)
+        timed("stitch", image_extract.upload_pdf_gcs, "bench-0.json", "bench", iter(cleaned))
+        pdf_bytes = storage.bytes_up
+
+    result = {
+        "dpi": args.dpi,
+        "width": width,
+        "height": height,
+        "max_dimension": max_dimension,
+        "encoding": image_extract.PAGE_ENCODING,
+        "pages": args.pages,
+    }
+    for stage in STAGES:
+        result[f"{stage}_ms_per_page"] = round(totals[stage] * 1000 / args.pages, 2)
+    result["total_ms_per_page"] = round(sum(totals.values()) * 1000 / args.pages, 2)
+    result["pdf_kb_per_page"] = round(pdf_bytes / 1024 / args.pages, 1)
+    # ru_maxrss is in KB on Linux
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dpi", default="150,200,300", help="scan resolutions, comma separated")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--distinct", type=int, default=3, help="distinct synthetic pages, cycled")
+    parser.add_argument("--skew", type=float, default=1.5)
+    parser.add_argument("--noise", type=float, default=12.0)
+    parser.add_argument("--speckle", type=float, default=0.002)
+    parser.add_argument("--ext", default=".png", choices=(".png", ".jpg"))
+    parser.add_argument("--max-dimension", type=int, default=None,
+                        help="decode size, PREVIEW_MAX_DIMENSION/PREVIEW_DPI by default, 0 for full size")
+    parser.add_argument("--encoding", default=None, choices=("source", "png", "jpeg", "g4"),
+                        help="PAGE_ENCODING by default")
+    args = parser.parse_args()
+
+    if "," not in args.dpi:
+        args.dpi = int(args.dpi)
+        print(json.dumps(run(args)))
+        return
+
+    # One interpreter per resolution, peak RSS only ever grows
+    for dpi in args.dpi.split(","):
+        command = [sys.executable, "-m", "benchmarks.bench_preprocess", "--dpi", dpi]
+        for name in ("pages", "distinct", "skew", "noise", "speckle", "ext", "max_dimension", "encoding"):
+            value = getattr(args, name)
+            if value is not None:
+                command += [f"--{name.replace('_', '-')}", str(value)]
+        out = subprocess.run(command, capture_output=True, text=True, check=True, cwd=os.getcwd()).stdout
+        print(out.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    main()
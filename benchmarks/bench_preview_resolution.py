@@ -0,0 +1,63 @@
+"""
+CPU time, decoded pixel memory and output size per page for different
+preview sizes (PREVIEW_MAX_DIMENSION), on a scan-sized synthetic page.
+
+Run from the repository root:
+    python -m benchmarks.bench_preview_resolution --sizes 0,2200,1600,1100
+"""
+import argparse
+import json
+import time
+
+import io
+
+import fast_document
+import image_extract
+from pdf_stream import StreamingPdfWriter
+from benchmarks.synthetic import make_shard
+
+def make_pdf(pages):
+    out = io.BytesIO()
+    writer = StreamingPdfWriter(out)
+    for page in pages:
+        writer.add_page(page)
+    writer.close()
+    return out.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=2550, help="300 dpi letter")
+    parser.add_argument("--height", type=int, default=3300)
+    parser.add_argument("--sizes", default="0,2200,1600,1100", help="max dimensions, 0 = full")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for ext in (".jpg", ".png"):
+        page = fast_document.load_document(
+            make_shard(width=args.width, height=args.height, skew=1.5, ext=ext), entities=False
+        ).pages[0]
+        page.image.content
+
+        for size in map(int, args.sizes.split(",")):
+            decode_ms = clean_ms = 0.0
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                img, out_ext, scale = image_extract.decode_page(page, max_dimension=size)
+                decoded = time.perf_counter()
+                cleaned = image_extract.clean_image(img, image_extract.page_skew(page), out_ext, scale)
+                decode_ms += (decoded - start) * 1000
+                clean_ms += (time.perf_counter() - decoded) * 1000
+
+            print(json.dumps({
+                "source": ext,
+                "max_dimension": size or max(args.width, args.height),
+                "decoded_shape": list(img.shape),
+                "decoded_mb": round(img.nbytes / 1024 / 1024, 2),
+                "decode_ms": round(decode_ms / args.repeat, 1),
+                "clean_ms": round(clean_ms / args.repeat, 1),
+                "encoded_kb": round(len(cleaned) / 1024, 1),
+                "pdf_kb": round(len(make_pdf([cleaned])) / 1024, 1),
+            }))
+
+if __name__ == '__main__':
+    main()
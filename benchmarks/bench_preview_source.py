@@ -0,0 +1,76 @@
+"""
+Preview from pages.image versus rendered from the upload ("source" preview):
+shard payload size, shard parse time, and the shard stage end to end with the
+local storage stand-in adding a fixed latency per request.
+
+Run from the repository root:
+    python -m benchmarks.bench_preview_source --pages 10 --latency 0.05
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import clients
+import docai_batch
+import handle_data_2307
+import page_source
+from local_storage import LocalStorageClient
+from benchmarks.synthetic import make_shard, make_source_pdf, write_shards
+
+def parse_ms(data, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        docai_batch.load_shard(data)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per storage request")
+    args = parser.parse_args()
+
+    # One shard of each kind
+    for preview, image in (("shard", True), ("source", False)):
+        data = make_shard(image=image)
+        print(json.dumps({
+            "preview": preview,
+            "shard_kb": round(len(data) / 1024, 1),
+            "parse_ms": round(parse_ms(data), 2),
+        }))
+
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorageClient(root)
+        clients.set_client("storage", storage)
+
+        source = "gs://bench-input/upload.pdf"
+        storage.bucket("bench-input").blob("upload.pdf").upload_from_string(
+            make_source_pdf(args.pages), content_type="application/pdf"
+        )
+        destinations = {
+            "shard": write_shards(storage, "processed_output_bucket", "processed_path/form2307/1/0", args.pages),
+            "source": write_shards(storage, "processed_output_bucket", "processed_path/form2307/1/1", args.pages,
+                                   image=False),
+        }
+        storage.latency = args.latency
+
+        for preview, destination in destinations.items():
+            page_source.PREVIEW_SOURCES["form2307"] = preview
+            requests, bytes_down = storage.requests, storage.bytes_down
+            start = time.perf_counter()
+            result = docai_batch.process_documents_output(
+                destination, handle_data_2307.handle_data, "bench", "form2307", source=source,
+            )
+            wall = time.perf_counter() - start
+            assert result["status"] == "ok" and result["pages"] == args.pages, result
+            print(json.dumps({
+                "preview": preview,
+                "pages": args.pages,
+                "wall_s": round(wall, 3),
+                "ms_per_page": round(wall * 1000 / args.pages, 1),
+                "requests_per_page": round((storage.requests - requests) / args.pages, 2),
+                "kb_downloaded_per_page": round((storage.bytes_down - bytes_down) / 1024 / args.pages, 1),
+            }))
+
+if __name__ == '__main__':
+    main()
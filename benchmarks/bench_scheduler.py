@@ -0,0 +1,95 @@
+"""
+Bursty submissions against the local processor with both quotas enforced
+(concurrent operations and pages per period), sent directly with a fixed
+retry delay versus through the SubmissionScheduler.
+
+The quota period is scaled down (--period seconds instead of a minute) so the
+run stays short; pages_per_sec is the throughput against the page quota.
+
+Run from the repository root:
+    python -m benchmarks.bench_scheduler --requests 60 --threads 20
+"""
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core.exceptions import ResourceExhausted
+from google.cloud import documentai
+import argparse
+import json
+import time
+
+from docai_batch import build_input_config
+from local_processor import LocalDocumentProcessorClient
+from scheduler import SubmissionScheduler
+
+def make_request(client, index, documents):
+    return documentai.BatchProcessRequest(
+        name=client.processor_path("local", "us", "bench"),
+        input_documents=build_input_config(gcs_input_documents=[
+            {"gcs_uri": f"gs://bench/input/{index}-{i}.pdf", "mime_type": "application/pdf"}
+            for i in range(documents)
+        ]),
+    )
+
+def run(args, use_scheduler):
+    client = LocalDocumentProcessorClient(
+        operation_overhead=args.overhead,
+        per_document=0.01,
+        max_concurrent_operations=args.max_operations,
+        pages_per_period=args.pages_per_period,
+        period=args.period,
+    )
+    queue = SubmissionScheduler(
+        pages_per_period=args.pages_per_period,
+        max_in_flight=args.max_operations,
+        period=args.period,
+        base_backoff=0.1,
+        max_backoff=2.0,
+        poll_interval=0.05,
+    )
+
+    def submit(index):
+        request = make_request(client, index, args.documents)
+        if use_scheduler:
+            operation = queue.submit(client, request, pages=args.documents)
+            operation.result()
+            queue.release(operation)
+            return
+        # What a caller without the scheduler does: retry until it goes through
+        while True:
+            try:
+                operation = client.batch_process_documents(request)
+                break
+            except ResourceExhausted:
+                time.sleep(args.retry_delay)
+        operation.result()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(submit, range(args.requests)))
+    wall = time.perf_counter() - start
+
+    return {
+        "mode": "scheduler" if use_scheduler else "direct",
+        "requests": args.requests,
+        "quota_errors": client.rejected,
+        "wall_s": round(wall, 3),
+        "pages_per_sec": round(client.pages / wall, 2),
+        "quota_pages_per_sec": round(args.pages_per_period / args.period, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--documents", type=int, default=2, help="documents (pages) per request")
+    parser.add_argument("--overhead", type=float, default=0.5)
+    parser.add_argument("--max-operations", type=int, default=5)
+    parser.add_argument("--pages-per-period", type=int, default=40)
+    parser.add_argument("--period", type=float, default=2.0)
+    parser.add_argument("--retry-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for use_scheduler in (False, True):
+        print(json.dumps(run(args, use_scheduler)))
+
+if __name__ == '__main__':
+    main()
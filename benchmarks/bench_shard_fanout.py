@@ -0,0 +1,50 @@
+"""
+Per-document wall time of the shard stage for different worker counts,
+with the local storage stand-in adding a fixed latency per GCS request.
+
+Run from the repository root:
+    python -m benchmarks.bench_shard_fanout --pages 20 --latency 0.05
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import clients
+import docai_batch
+import handle_data_2307
+from local_storage import LocalStorageClient
+from benchmarks.synthetic import write_shards
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per storage request")
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorageClient(root)
+        clients.set_client("storage", storage)
+        destination = write_shards(storage, "processed_output_bucket", "processed_path/form2307/1/0", args.pages)
+        storage.latency = args.latency
+
+        for workers in map(int, args.workers.split(",")):
+            requests, bytes_down = storage.requests, storage.bytes_down
+            start = time.perf_counter()
+            result = docai_batch.process_documents_output(
+                destination, handle_data_2307.handle_data, "bench", "form2307", workers=workers,
+            )
+            wall = time.perf_counter() - start
+            assert result["status"] == "ok" and result["pages"] == args.pages, result
+            print(json.dumps({
+                "workers": workers,
+                "pages": args.pages,
+                "wall_s": round(wall, 3),
+                "ms_per_page": round(wall * 1000 / args.pages, 1),
+                "requests_per_page": round((storage.requests - requests) / args.pages, 2),
+                "kb_downloaded_per_page": round((storage.bytes_down - bytes_down) / 1024 / args.pages, 1),
+            }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures cold-start cost of the trigger module.
+
+Each mode runs in a fresh interpreter:
+- eager: imports main plus the whole extraction path up front (the old layout)
+- lazy: imports main only, the extraction path loads on the first valid event
+
+For both it reports module import time, the latency of a first event that is
+rejected (unsupported file type) and the time to load the extraction path.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+SNIPPET = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+if sys.argv[1] == "eager":
+    import extractor_caller, service_extractor, image_extract
+t1 = time.perf_counter()
+
+from cloudevents.http import CloudEvent
+event = CloudEvent(
+    {"type": "google.cloud.storage.object.v1.finalized", "source": "bench", "id": "1"},
+    {"bucket": "bench", "name": "notes.txt", "generation": "1"},
+)
+try:
+    main.trigger(event)
+except ValueError:
+    pass
+t2 = time.perf_counter()
+
+import extractor_caller, service_extractor, image_extract
+t3 = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "first_rejected_event_ms": (t2 - t1) * 1000,
+    "extraction_path_ms": (t3 - t2) * 1000,
+}))
+"""
+
+def run(mode):
+    out = subprocess.run(
+        [sys.executable, "-c", SNIPPET, mode],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    # The trigger prints its own logs, the result is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for mode in ("eager", "lazy"):
+        samples = [run(mode) for _ in range(args.runs)]
+        summary = {"mode": mode, "runs": args.runs}
+        for key in ("import_ms", "first_rejected_event_ms", "extraction_path_ms"):
+            summary[key] = round(statistics.median(s[key] for s in samples), 2)
+        print(json.dumps(summary))
+
+if __name__ == '__main__':
+    main()
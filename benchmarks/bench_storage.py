@@ -0,0 +1,87 @@
+"""
+Storage layer: requests and wall time of small metadata writes done the old
+way (upload, then patch the metadata), with metadata in the upload, and
+batched; then one document through the shard stage with the per-operation
+counters of storage.get_storage().stats().
+
+Everything runs against the local storage stand-in with a fixed latency per
+request.
+
+Run from the repository root:
+    python -m benchmarks.bench_storage --writes 50 --pages 20 --latency 0.05
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import clients
+import docai_batch
+import handle_data_2307
+import storage
+from local_storage import LocalStorageClient
+from benchmarks.synthetic import write_shards
+
+def small_writes(client, store, mode, writes):
+    """Writes `writes` small JSON objects with metadata."""
+    requests = client.requests
+    start = time.perf_counter()
+    if mode == "upload+patch":
+        for n in range(writes):
+            blob = client.bucket("bench").blob(f"patch/{n}.json")
+            blob.upload_from_string(json.dumps({"n": n}), content_type="application/json")
+            blob.metadata = {"userid": "bench"}
+            blob.patch()
+    elif mode == "single":
+        for n in range(writes):
+            store.write("bench", f"single/{n}.json", json.dumps({"n": n}), "application/json",
+                        metadata={"userid": "bench"})
+    else:
+        with store.batch() as batch:
+            for n in range(writes):
+                batch.write("bench", f"batch/{n}.json", json.dumps({"n": n}), "application/json",
+                            metadata={"userid": "bench"})
+    wall = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "writes": writes,
+        "wall_s": round(wall, 3),
+        "requests_per_write": round((client.requests - requests) / writes, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per storage request")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        client = LocalStorageClient(root)
+        clients.set_client("storage", client)
+        store = storage.get_storage()
+        destination = write_shards(client, "processed_output_bucket", "processed_path/form2307/1/0", args.pages)
+        client.latency = args.latency
+
+        for mode in ("upload+patch", "single", "batch"):
+            print(json.dumps(small_writes(client, store, mode, args.writes)))
+
+        # Fresh counters for the pipeline run
+        store = storage.Storage(client)
+        clients.set_client("storage-layer", store)
+        requests = client.requests
+        start = time.perf_counter()
+        result = docai_batch.process_documents_output(
+            destination, handle_data_2307.handle_data, "bench", "form2307",
+        )
+        wall = time.perf_counter() - start
+        assert result["status"] == "ok" and result["pages"] == args.pages, result
+        print(json.dumps({
+            "pages": args.pages,
+            "wall_s": round(wall, 3),
+            "requests_per_page": round((client.requests - requests) / args.pages, 2),
+            "stats": store.stats(),
+        }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Synthetic Document AI shards for the benchmarks.
+
+Pages are grey form-like images (ruled lines, text-like blocks, noise) with a
+matching pages.blocks layout, and a handful of 2307 entities.
+"""
+# Letter size paper, for pages generated at a given scan resolution
+PAGE_INCHES = (8.5, 11)
+
+import cv2
+import numpy as np
+from google.cloud import documentai
+
+def page_size(dpi):
+    """(width, height) in pixels of a letter page scanned at dpi."""
+    return round(PAGE_INCHES[0] * dpi), round(PAGE_INCHES[1] * dpi)
+
+def make_page_image(width=1700, height=2200, skew=0.0, seed=0, noise=12.0, speckle=0.0):
+    """
+    Returns a grayscale uint8 image that looks roughly like a scanned form,
+    plus the normalized text block boxes drawn on it.
+
+    noise is the standard deviation of the gaussian scanner noise, speckle the
+    share of pixels turned into black or white dust.
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width), 235, np.uint8)
+    boxes = []
+    y = 120
+    while y < height - 120:
+        x = 100
+        while x < width - 300:
+            w = int(rng.integers(120, 420) * width / 1700)
+            h = int(rng.integers(24, 40) * height / 2200)
+            cv2.rectangle(img, (x, y), (x + w, y + h), 40, -1)
+            boxes.append((x / width, y / height, (x + w) / width, (y + h) / height))
+            x += w + int(rng.integers(40, 120) * width / 1700)
+        cv2.line(img, (80, y + 55 * height // 2200), (width - 80, y + 55 * height // 2200), 90, 2)
+        y += max(1, 90 * height // 2200)
+
+    if skew:
+        m = cv2.getRotationMatrix2D((width // 2, height // 2), skew, 1.0)
+        img = cv2.warpAffine(img, m, (width, height), borderMode=cv2.BORDER_REPLICATE)
+
+    if noise:
+        img = np.clip(img.astype(np.float32) + rng.normal(0, noise, img.shape), 0, 255).astype(np.uint8)
+    if speckle:
+        dust = rng.random(img.shape)
+        img[dust < speckle / 2] = 0
+        img[dust > 1 - speckle / 2] = 255
+    return img, boxes
+
+def make_blocks(boxes, skew=0.0):
+    """
+    Document AI blocks for the boxes, rotated by skew degrees around the center.
+    """
+    angle = np.radians(-skew)
+    cos, sin = np.cos(angle), np.sin(angle)
+
+    def rotate(x, y):
+        x, y = x - 0.5, y - 0.5
+        return documentai.NormalizedVertex(x=x * cos - y * sin + 0.5, y=x * sin + y * cos + 0.5)
+
+    return [
+        documentai.Document.Page.Block(layout=documentai.Document.Page.Layout(
+            bounding_poly=documentai.BoundingPoly(normalized_vertices=[
+                rotate(x0, y0), rotate(x1, y0), rotate(x1, y1), rotate(x0, y1),
+            ])
+        ))
+        for x0, y0, x1, y1 in boxes
+    ]
+
+def make_entities(rows=4):
+    """A few 2307 header fields and table rows."""
+    entities = [
+        documentai.Document.Entity(type_="from_date", mention_text="01-01-2025", confidence=0.97),
+        documentai.Document.Entity(type_="to_date", mention_text="03-31-2025", confidence=0.96),
+        documentai.Document.Entity(type_="payee_tin_no", mention_text="541-331-234-000", confidence=0.93),
+        documentai.Document.Entity(type_="payee_name", mention_text="JUAN DELA CRUZ", confidence=0.91),
+        documentai.Document.Entity(type_="payor_tin_no", mention_text="123-333-221-001", confidence=0.94),
+        documentai.Document.Entity(type_="payor_name", mention_text="HARMONY HOSPITAL", confidence=0.95),
+        documentai.Document.Entity(type_="zip_code_8A", mention_text="4323", confidence=0.9),
+    ]
+    for i in range(rows):
+        entities.append(documentai.Document.Entity(
+            type_="details_monthly_income_payment_taxes",
+            mention_text="",
+            confidence=0.9,
+            properties=[
+                documentai.Document.Entity(type_="income_payment_subject", mention_text="Rentals" if i else "Total"),
+                documentai.Document.Entity(type_="atc", mention_text="WC100"),
+                documentai.Document.Entity(type_="total_quarter", mention_text="125,000.00"),
+                documentai.Document.Entity(type_="tax_withheld_quarter", mention_text="6,250.00"),
+            ],
+        ))
+    return entities
+
+def make_page(width=1700, height=2200, skew=1.5, seed=0, ext=".png", noise=12.0, speckle=0.0,
+              page_number=1, image=True):
+    """
+    One Document AI page: the encoded synthetic scan in pages.image (unless
+    image=False, like a "source" preview field mask) and its text blocks in
+    pages.blocks.
+    """
+    img, boxes = make_page_image(width, height, skew=skew, seed=seed, noise=noise, speckle=speckle)
+    if not image:
+        return documentai.Document.Page(page_number=page_number, blocks=make_blocks(boxes, skew=skew))
+    _, encoded = cv2.imencode(ext, img)
+    return documentai.Document.Page(
+        page_number=page_number,
+        image=documentai.Document.Page.Image(
+            content=encoded.tobytes(),
+            mime_type="image/png" if ext == ".png" else "image/jpeg",
+            width=width,
+            height=height,
+        ),
+        blocks=make_blocks(boxes, skew=skew),
+    )
+
+def make_shard(width=1700, height=2200, skew=1.5, seed=0, rows=4, ext=".png", page_number=1, image=True):
+    """
+    One page shard as Document AI JSON bytes (entities, pages.image, pages.blocks).
+    """
+    page = make_page(width, height, skew=skew, seed=seed, ext=ext, page_number=page_number, image=image)
+    document = documentai.Document(entities=make_entities(rows), pages=[page])
+    return documentai.Document.to_json(document).encode("utf-8")
+
+def write_shards(storage_client, bucket_name, prefix, pages, **kwargs):
+    """
+    Writes a document's page shards as "<prefix>/doc-<n>.json" and returns the
+    gs:// output destination to hand to process_documents_output.
+    """
+    bucket = storage_client.bucket(bucket_name)
+    for n in range(pages):
+        blob = bucket.blob(f"{prefix}/doc-{n}.json")
+        blob.upload_from_string(make_shard(seed=n, page_number=n + 1, **kwargs), content_type="application/json")
+    return f"gs://{bucket_name}/{prefix}/"
+
+def make_source_pdf(pages, width=1700, height=2200, dpi=200, skew=1.5, **kwargs):
+    """
+    The upload the shards of write_shards came from: one page per shard, the
+    same synthetic scans, as a PDF at dpi.
+    """
+    import io
+    from pdf_stream import StreamingPdfWriter
+
+    out = io.BytesIO()
+    writer = StreamingPdfWriter(out, dpi=dpi)
+    for n in range(pages):
+        img, _ = make_page_image(width, height, skew=skew, seed=n, **kwargs)
+        writer.add_page(cv2.imencode(".png", img)[1].tobytes())
+    writer.close()
+    return out.getvalue()
@@ -0,0 +1,106 @@
+import os
+import threading
+
+# Process-wide registry of Google API clients.
+# Every new client does a credential lookup and opens its own TLS/gRPC
+# connection, so the pipeline builds each client once per process and shares
+# it between calls and threads. Clients are keyed by process id as well, so a
+# forked worker never reuses the connections of its parent.
+#
+# The return/ function is deployed from its own folder, cloudbuild.yaml copies
+# this module next to it before deploying.
+
+_clients = {}
+# One lock per key, so a slow factory (credential lookup, connection) only
+# holds up callers of the same client. _lock guards the two dicts.
+_key_locks = {}
+_lock = threading.Lock()
+# firebase_admin keeps one default app per process, built by the first
+# Firestore client of any database
+_firebase_lock = threading.Lock()
+
+def get_client(name, factory):
+    """
+    Returns the client registered under name, building it with factory() the
+    first time. Safe to call from several threads at once.
+    """
+    key = (os.getpid(), name)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            key_lock = _key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another thread may have built it while we waited for the lock
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                with _lock:
+                    _clients[key] = client
+    return client
+
+def set_client(name, client):
+    """
+    Registers a client under name for this process, used to plug in the
+    local stand-ins (local_storage, local_processor) for benchmarks.
+    """
+    with _lock:
+        _clients[(os.getpid(), name)] = client
+
+def documentai_client(location="us"):
+    """
+    Shared DocumentProcessorServiceClient for a processor location.
+    """
+    def build():
+        from google.cloud import documentai
+        print("Connecting with the client...")
+        if location == "us":
+            # Default endpoint serves the "us" multi-region
+            return documentai.DocumentProcessorServiceClient()
+        from google.api_core.client_options import ClientOptions
+        return documentai.DocumentProcessorServiceClient(
+            client_options=ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+        )
+    return get_client(f"documentai:{location}", build)
+
+def storage_client():
+    """
+    Shared Cloud Storage client.
+    """
+    def build():
+        from google.cloud import storage
+        return storage.Client()
+    return get_client("storage", build)
+
+def firestore_client(database):
+    """
+    Shared Firestore client for a database, using the default Firebase app.
+    """
+    def build():
+        import firebase_admin
+        from firebase_admin import firestore
+        # Application Default credentials are automatically created.
+        with _firebase_lock:
+            try:
+                app = firebase_admin.get_app()
+            except ValueError:
+                app = firebase_admin.initialize_app()
+        return firestore.client(app, database)
+    return get_client(f"firestore:{database}", build)
+
+def warmup(locations=("us",), timeout=10):
+    """
+    Builds the Document AI and Storage clients and waits for the Document AI
+    gRPC channels to connect, so the first request skips the handshake.
+    """
+    storage_client()
+    for location in locations:
+        client = documentai_client(location)
+        channel = getattr(client.transport, "grpc_channel", None)
+        if channel is None:
+            continue
+        try:
+            import grpc
+            grpc.channel_ready_future(channel).result(timeout=timeout)
+        except Exception as e:
+            # Not fatal, the first request will connect on its own
+            print(f"Document AI channel warm-up failed: {e}")
@@ -0,0 +1,111 @@
+from concurrent.futures import Future
+import threading
+import time
+
+# Groups storage events that arrive close together into one Document AI
+# batch operation. Events are buffered per key (the doc type) and flushed when
+# the buffer reaches max_batch_size or when the oldest event has waited
+# max_wait_seconds, whichever comes first.
+
+class EventCoalescer:
+    """
+    Buffers items per key and hands them to flush_fn in groups.
+
+    flush_fn(key, items) must return a list with one result per item (same
+    order). A result that is an Exception is raised to that item's caller,
+    anything else is returned. If flush_fn itself raises, every caller in the
+    group gets the error.
+    """
+
+    def __init__(self, flush_fn, max_batch_size=50, max_wait_seconds=2.0):
+        self.flush_fn = flush_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+
+        # key -> list of (item, future)
+        self._buffers = {}
+        # key -> threading.Timer that flushes the key when the window closes
+        self._timers = {}
+        self._lock = threading.Lock()
+
+        # Counters, handy for logs and the benchmark
+        self.flushes = 0
+        self.items = 0
+
+    def submit(self, key, item) -> Future:
+        """
+        Adds an item to the key's buffer and returns a Future for its result.
+        """
+        future = Future()
+        ready = None
+
+        with self._lock:
+            buffer = self._buffers.setdefault(key, [])
+            buffer.append((item, future))
+            self.items += 1
+
+            if len(buffer) >= self.max_batch_size:
+                # Size limit reached, flush right away
+                ready = self._take(key)
+            elif len(buffer) == 1:
+                # First item of a new window, start the timer
+                timer = threading.Timer(self.max_wait_seconds, self._flush_key, args=(key,))
+                timer.daemon = True
+                self._timers[key] = timer
+                timer.start()
+
+        if ready:
+            # Run the flush outside the lock on its own thread so the
+            # submitting caller behaves the same as a timer flush
+            threading.Thread(target=self._run, args=(key, ready), daemon=True).start()
+
+        return future
+
+    def flush(self):
+        """
+        Flushes every buffered key immediately and waits for the results.
+        """
+        with self._lock:
+            pending = [(key, self._take(key)) for key in list(self._buffers)]
+        for key, group in pending:
+            if group:
+                self._run(key, group)
+
+    def _take(self, key):
+        # Must be called with the lock held
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        return self._buffers.pop(key, [])
+
+    def _flush_key(self, key):
+        with self._lock:
+            group = self._take(key)
+        if group:
+            self._run(key, group)
+
+    def _run(self, key, group):
+        items = [item for item, _ in group]
+        self.flushes += 1
+        print(f"Flushing {len(items)} item(s) for {key}")
+        start = time.perf_counter()
+
+        try:
+            results = self.flush_fn(key, items)
+        except Exception as e:
+            for _, future in group:
+                future.set_exception(e)
+            return
+
+        # Fan the results back out to each caller
+        for (_, future), result in zip(group, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+        # Any caller flush_fn didn't answer for gets an error instead of hanging
+        for _, future in group[len(results):]:
+            future.set_exception(ValueError("No result returned for coalesced item"))
+
+        print(f"Flushed {key} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,140 @@
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+import calendar
+import os
+import re
+
+# Date parsing shared by the handlers and the return function.
+# dateutil's parser tokenizes every string and tries each of its rules, which
+# is slow for the handful of formats the forms actually hold. Those formats
+# are matched by anchored regexes first and dateutil only parses what none
+# of them match (or what they match but isn't a real date, e.g. 13/05/2025,
+# which dateutil reads day first), so results are the same as before.
+# Results are cached, the same dates come back for every page of a batch and
+# the return function parses the dates the handlers already normalized.
+# Strings dateutil only reads part of a date from ("March 15", no year) are
+# not cached: it fills the missing parts from today, which a cached result
+# would keep returning after the day has changed.
+
+# Parsed strings kept per process
+DATE_CACHE_SIZE = int(os.environ.get("DATE_CACHE_SIZE", "4096"))
+
+DATE_FORMAT = "%m-%d-%Y"  # MM-DD-YYYY
+QUARTERS = ("1st Quarter", "2nd Quarter", "3rd Quarter", "4th Quarter")
+
+# Month names and abbreviations dateutil accepts
+MONTHS = {}
+for _number, _names in enumerate((
+    ("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"),
+    ("may",), ("jun", "june"), ("jul", "july"), ("aug", "august"),
+    ("sep", "sept", "september"), ("oct", "october"), ("nov", "november"), ("dec", "december"),
+), 1):
+    for _name in _names:
+        MONTHS[_name] = _number
+
+# Years are four digits from 1000: dateutil reads zero-padded years like 0025
+# as 25 or 2025 depending on the format, so those are left to it
+# 03-15-2025, 3/5/2025, 03.15.2025, 03 15 2025 (month first, like dateutil)
+_MDY = re.compile(r"\s*(\d{1,2})([-/. ])(\d{1,2})\2([1-9]\d{3})\s*", re.ASCII)
+# 2025-03-15, 2025/3/5
+_YMD = re.compile(r"\s*([1-9]\d{3})([-/.])(\d{1,2})\2(\d{1,2})\s*", re.ASCII)
+# March 15, 2025, Mar. 15 2025, Sept 5th, 2025
+_NAMED_MDY = re.compile(r"\s*([A-Za-z]{3,9})\.? +(\d{1,2})(?:st|nd|rd|th)?,? +([1-9]\d{3})\s*", re.ASCII)
+# 15 March 2025, 15-Mar-2025
+_NAMED_DMY = re.compile(r"\s*(\d{1,2})([- ])([A-Za-z]{3,9})\2([1-9]\d{3})\s*", re.ASCII)
+
+class ParsedDate(namedtuple("ParsedDate", "year month day quarter text")):
+    """
+    A parsed calendar date.
+
+    Fields:
+        year, month, day (int): The date.
+        quarter (int): 1 to 4.
+        text (str): The date as 'MM-DD-YYYY' (strftime, years before 1000
+            aren't zero-padded).
+
+    Dates compare in calendar order.
+    """
+    __slots__ = ()
+
+    @property
+    def quarter_label(self):
+        """'1st Quarter' to '4th Quarter'."""
+        return QUARTERS[self.quarter - 1]
+
+    def to_datetime(self):
+        return datetime(self.year, self.month, self.day)
+
+def from_parts(year, month, day):
+    """
+    ParsedDate of a year, month and day, or None when they aren't a real date.
+    """
+    if not (1 <= year <= 9999 and 1 <= month <= 12):
+        return None
+    if not 1 <= day <= calendar.monthrange(year, month)[1]:
+        return None
+    return ParsedDate(year, month, day, (month - 1) // 3 + 1, f"{month:02d}-{day:02d}-{year}")
+
+# Returned by _parse_cached for strings missing part of the date
+_PARTIAL = object()
+# Two defaults that differ in year, month and day: a string parses the same
+# with both only when it holds all three. Leap years, so "Feb 29" isn't
+# taken for a string that never parses.
+_PROBE_DEFAULTS = (datetime(4, 1, 1), datetime(8, 2, 2))
+
+def parse_date(text, fuzzy=False):
+    """
+    Parse a date the way dateutil.parser.parse does, fast paths first.
+
+    Args:
+        text (str): The date string.
+        fuzzy (bool): Skip unknown words around the date (dateutil fuzzy).
+
+    Returns:
+        ParsedDate, or None when no date can be read from the string.
+    """
+    parsed = _parse_cached(text, fuzzy)
+    if parsed is _PARTIAL:
+        # Missing parts come from today, parsed every time
+        return _dateutil_parse(text, fuzzy)
+    return parsed
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_cached(text, fuzzy):
+    parsed = _fast_path(text)
+    if parsed is not None:
+        return parsed
+
+    probes = [_dateutil_parse(text, fuzzy, default) for default in _PROBE_DEFAULTS]
+    if probes[0] != probes[1]:
+        return _PARTIAL
+    # A full date, or a string without one
+    return probes[0]
+
+# Same interface as an lru_cache'd function, for the benchmarks
+parse_date.cache_clear = _parse_cached.cache_clear
+parse_date.cache_info = _parse_cached.cache_info
+
+def _dateutil_parse(text, fuzzy, default=None):
+    from dateutil import parser
+    try:
+        dt = parser.parse(text, fuzzy=fuzzy, default=default)
+    except (ValueError, OverflowError):
+        return None
+    return from_parts(dt.year, dt.month, dt.day)
+
+def _fast_path(text):
+    match = _MDY.fullmatch(text)
+    if match:
+        return from_parts(int(match[4]), int(match[1]), int(match[3]))
+    match = _YMD.fullmatch(text)
+    if match:
+        return from_parts(int(match[1]), int(match[3]), int(match[4]))
+    match = _NAMED_MDY.fullmatch(text)
+    if match and match[1].lower() in MONTHS:
+        return from_parts(int(match[3]), MONTHS[match[1].lower()], int(match[2]))
+    match = _NAMED_DMY.fullmatch(text)
+    if match and match[3].lower() in MONTHS:
+        return from_parts(int(match[4]), MONTHS[match[3].lower()], int(match[1]))
+    return None
@@ -0,0 +1,143 @@
+from collections import defaultdict
+
+import fast_document
+
+# Declarative doc type handlers.
+# A doc type is described by a schema dict: its output fields with their
+# normalizers, the table entities and their columns, and checks run on the
+# result. compile_schema turns it once, at import, into lookup tables keyed
+# by entity type, so handling a document is one pass over its entities with
+# dict lookups instead of substring tests on every key. The entities are
+# read as fast_document records, documentai.Document entities are converted
+# from their protobuf first (fast_document.entity_records).
+#
+# Schema keys:
+#   fields: {name: normalizer or None}, in output order. Normalizers take the
+#       field text; a ValueError leaves the field blank.
+#   mention_text: fields read from mention_text even when Document AI
+#       normalized them (TINs, dates, numbers).
+#   defaults: {name: value} for fields missing from the document, "" otherwise.
+#   tables: {output key: {"entity": entity type, "columns": {column: batch
+#       normalizer or None}}}. Columns hold the property mention_text; batch
+#       normalizers (list in, list out) run once over every cell they apply to.
+#   checks: callables run on the normalized fields (logging only).
+
+class CompiledSchema:
+    """
+    A schema compiled into dispatch tables.
+
+    Args:
+        schema: Schema dict, see the module comment.
+    """
+
+    def __init__(self, schema):
+        mention_text = set(schema.get("mention_text", ()))
+        self.fields = {
+            name: (normalizer, name in mention_text)
+            for name, normalizer in schema["fields"].items()
+        }
+        defaults = schema.get("defaults", {})
+        self.defaults = {name: defaults.get(name, "") for name in self.fields}
+        self.table_keys = tuple(schema.get("tables", {}))
+        self.tables = {
+            table["entity"]: (key, tuple(table["columns"]), {
+                column: normalizer for column, normalizer in table["columns"].items() if normalizer
+            })
+            for key, table in schema.get("tables", {}).items()
+        }
+        self.checks = tuple(schema.get("checks", ()))
+
+    def handle(self, document):
+        """
+        Extracts and normalizes the schema's fields and tables from a
+        Document AI document (or fast_document.LiteDocument).
+
+        Returns:
+            dict, see handle_entities.
+        """
+        return self.handle_entities(fast_document.entity_records(document))
+
+    def handle_entities(self, entities):
+        """
+        Extracts and normalizes the schema's fields and tables from entity
+        records (fast_document.LiteEntity, or anything with the same
+        attributes).
+
+        Returns:
+            dict: The fields in schema order, confidence_average (mean of the
+            last confidence of every entity type), then one list of row
+            dicts per table.
+        """
+        fields = self.fields
+        tables = self.tables
+        raw = {}
+        confidences = {}
+        rows = {key: [] for key in self.table_keys}
+        # Batch normalizer -> cells (row, column) it applies to
+        cells = defaultdict(list)
+
+        for entity in entities:
+            entity_type = entity.type
+
+            # Table entity: one row with the known columns
+            table = tables.get(entity_type)
+            if table is not None:
+                key, columns, normalizers = table
+                row = dict.fromkeys(columns, "")
+                for prop in entity.properties:
+                    column = prop.type
+                    if column in row:
+                        row[column] = prop.mention_text
+                        normalizer = normalizers.get(column)
+                        if normalizer is not None:
+                            cells[normalizer].append((row, column))
+                rows[key].append(row)
+
+            # Every entity type counts towards the confidence average
+            key = entity_type.strip()
+            confidences[key] = round(entity.confidence, 2)
+
+            field = fields.get(key)
+            if field is not None:
+                # Prefer normalized_value, except for mention_text fields
+                normalized = entity.normalized_value
+                if normalized and not field[1]:
+                    raw[key] = normalized.text.strip()
+                else:
+                    raw[key] = entity.mention_text.strip()
+
+        # Normalize the fields, missing ones get their default
+        # Invalid values are concatenated with [INVALID] by the normalizers
+        values = {}
+        for name, (normalizer, _) in fields.items():
+            if name not in raw:
+                values[name] = self.defaults[name]
+                continue
+            try:
+                values[name] = normalizer(raw[name]) if normalizer else raw[name]
+            except ValueError as e:
+                print(f"Error normalizing field '{name}': {e}")
+                values[name] = ""
+
+        # Table cells, one call per normalizer
+        for normalizer, targets in cells.items():
+            normalized = normalizer([row[column] for row, column in targets])
+            for (row, column), value in zip(targets, normalized):
+                row[column] = value
+
+        for check in self.checks:
+            check(values)
+
+        # Get the confidence average (Currently only for field values not tables)
+        confidence = 0
+        for value in confidences.values():
+            confidence += value
+        if confidences:
+            confidence /= len(confidences)
+        values["confidence_average"] = round(confidence, 2)
+
+        return {**values, **rows}
+
+def compile_schema(schema):
+    """Compiles a schema dict, see CompiledSchema."""
+    return CompiledSchema(schema)
@@ -0,0 +1,809 @@
+# Google API exceptions for handling operation errors
+from google.api_core.exceptions import InternalServerError
+from google.api_core.exceptions import RetryError
+
+# Google Cloud libraries for Document AI
+from google.cloud import documentai
+
+# Shared Google API clients
+import clients
+
+# Shared storage layer (GCS or local directory)
+import storage
+
+# Quota-aware submission queue
+import scheduler
+
+# Lightweight shard JSON loader
+import fast_document
+
+# Preview pages from pages.image or from the upload
+import page_source
+
+# Type hints
+from typing import Callable, Optional
+
+# Worker pool for the page shards
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
+from collections import deque
+import itertools
+
+# Regex, JSON utils
+import re
+import json
+import os
+import time
+import uuid
+
+# Shared batch flow for extractor_caller and service_extractor.
+# Both extractors only differ in the processor they call and the handler that
+# turns a Document into the finalized dict, so the handler is passed in.
+
+# Online (synchronous) processing for small uploads
+# Single-page uploads up to ONLINE_MAX_BYTES skip the batch operation and the
+# shard round trips through GCS. 0 disables the fast path.
+# Only single pages: the online Document holds every page's entities, one
+# handler call over it would merge the pages of a bundle into one record,
+# where batch processing writes one finalized JSON per page.
+ONLINE_MAX_BYTES = int(os.environ.get("ONLINE_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# Page shards of one document processed at the same time
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", "4"))
+
+# Incremental outputs: process each input document of a batch as soon as it is
+# finished instead of waiting for the whole operation
+INCREMENTAL_OUTPUTS = os.environ.get("INCREMENTAL_OUTPUTS", "") == "1"
+INCREMENTAL_POLL_SECONDS = float(os.environ.get("INCREMENTAL_POLL_SECONDS", "5"))
+# Input documents post-processed at the same time (each uses SHARD_WORKERS threads)
+DOCUMENT_WORKERS = int(os.environ.get("DOCUMENT_WORKERS", "2"))
+
+# Shard JSON loader: "fast" (fast_document, page images decoded lazily)
+# or "proto" (documentai.Document.from_json)
+SHARD_LOADER = os.environ.get("SHARD_LOADER", "fast")
+
+# Where online results are written, next to the batch shards
+ONLINE_OUTPUT_BUCKET = "processed_output_bucket"
+ONLINE_OUTPUT_PREFIX = "processed_path"
+
+def build_input_config(
+    gcs_input_uri: Optional[str] = None,
+    input_mime_type: Optional[str] = None,
+    gcs_input_prefix: Optional[str] = None,
+    gcs_input_documents: Optional[list] = None,
+):
+    """
+    Builds the BatchDocumentsInputConfig for a request.
+
+    gcs_input_documents is a list of dicts with "gcs_uri" and "mime_type",
+    it is used when several uploads are coalesced into one operation.
+    """
+    if gcs_input_documents:
+        # Several documents in one operation
+        gcs_documents = documentai.GcsDocuments(documents=[
+            documentai.GcsDocument(gcs_uri=doc["gcs_uri"], mime_type=doc["mime_type"])
+            for doc in gcs_input_documents
+        ])
+        return documentai.BatchDocumentsInputConfig(gcs_documents=gcs_documents)
+
+    if gcs_input_uri:
+        # Specify specific GCS URIs to process individual documents
+        gcs_document = documentai.GcsDocument(
+            gcs_uri=gcs_input_uri, mime_type=input_mime_type
+        )
+
+        # Load GCS Input URI into a List of document files
+        gcs_documents = documentai.GcsDocuments(documents=[gcs_document])
+        return documentai.BatchDocumentsInputConfig(gcs_documents=gcs_documents)
+
+    # Specify a GCS URI Prefix to process an entire directory
+    gcs_prefix = documentai.GcsPrefix(gcs_uri_prefix=gcs_input_prefix)
+    return documentai.BatchDocumentsInputConfig(gcs_prefix=gcs_prefix)
+
+class BatchFailed(ValueError):
+    """
+    An operation that failed, was cancelled or outlived its timeout.
+
+    results holds the status of the inputs handled before it stopped (keyed
+    by input GCS URI, same as the normal return value), so a caller that
+    resubmits (backfill) only resubmits the inputs missing from it.
+    """
+    def __init__(self, message, results=None):
+        super().__init__(message)
+        self.results = results or {}
+
+def batch_process_documents(
+    handler: Callable,
+    userId: str,
+    doc_type: str,
+    project_id: str,
+    location: str,
+    processor_id: str,
+    gcs_output_uri: str,
+    processor_version_id: Optional[str] = None,
+    gcs_input_uri: Optional[str] = None,
+    input_mime_type: Optional[str] = None,
+    gcs_input_prefix: Optional[str] = None,
+    gcs_input_documents: Optional[list] = None,
+    field_mask: Optional[str] = None,
+    timeout: int = 400,
+    client=None,
+    wait: bool = True,
+    pending_store=None,
+    process_fn=None,
+    incremental: Optional[bool] = None,
+    submission_scheduler=None,
+    cancel_on_timeout: bool = False,
+) -> dict:
+    """
+    - Sends document(s) to the processor
+    - Waits for processing results
+    - Reads back the generated JSON files from GCS
+    - Extracts fields and cleaned images
+    - Stitches pages into a PDF and uploads back to GCS
+
+    Returns a dict keyed by input GCS URI with the status of each input
+    document, so coalesced callers can fan results back out per upload.
+
+    With wait=False the operation is only submitted and saved to the pending
+    store, every input gets the "submitted" status. With incremental=True
+    (INCREMENTAL_OUTPUTS by default) each input document is processed as
+    soon as it finishes instead of after the whole operation.
+
+    The request goes through the location's SubmissionScheduler, which
+    queues it while the Document AI quotas are used up.
+
+    With cancel_on_timeout=True an operation still running after timeout
+    seconds is cancelled before the error is raised, so a caller that
+    resubmits its inputs (backfill) doesn't leave it running and billing.
+    """
+
+    if client is None:
+        client = clients.documentai_client(location)
+
+    # Per-input context (userId) when documents come from different uploads
+    contexts = {doc["gcs_uri"]: doc for doc in (gcs_input_documents or [])}
+
+    # Without pages.image when the preview of this doc type comes from the upload
+    field_mask = page_source.field_mask(doc_type, field_mask)
+
+    # CONFIGURE INPUT DOCUMENTS
+    input_config = build_input_config(
+        gcs_input_uri=gcs_input_uri,
+        input_mime_type=input_mime_type,
+        gcs_input_prefix=gcs_input_prefix,
+        gcs_input_documents=gcs_input_documents,
+    )
+
+    # CONFIGURE OUTPUT LOCATION
+    gcs_output_config = documentai.DocumentOutputConfig.GcsOutputConfig(
+        gcs_uri=gcs_output_uri, field_mask=field_mask,
+        sharding_config=documentai.DocumentOutputConfig.GcsOutputConfig.ShardingConfig(
+            pages_per_shard=1
+        )
+    )
+
+    # Wrap config into DocumentOutputConfig
+    output_config = documentai.DocumentOutputConfig(gcs_output_config=gcs_output_config)
+
+    print("Connecting to the processor version...")
+    if processor_version_id:
+        # The full resource name of the processor version, e.g.:
+        # projects/{project_id}/locations/{location}/processors/{processor_id}/processorVersions/{processor_version_id}
+        name = client.processor_version_path(
+            project_id, location, processor_id, processor_version_id
+        )
+
+    else:
+        # Using default version of the processor
+        name = client.processor_path(project_id, location, processor_id)
+
+    # BUILD REQUEST AND PROCESS
+    print("Requesting...")
+    request = documentai.BatchProcessRequest(
+        name=name,
+        input_documents=input_config,
+        document_output_config=output_config,
+    )
+
+    # Start the batch process, queued until the quotas allow it
+    print("Processing...")
+    if submission_scheduler is None:
+        submission_scheduler = scheduler.get_scheduler(location)
+    # Submit-only operations don't hold a slot, nothing here would release it
+    operation = submission_scheduler.submit(
+        client, request, pages=scheduler.estimate_pages(gcs_input_documents), track=wait
+    )
+
+    if not wait:
+        # Submit only: save what the completion step needs and return,
+        # the shards are handled later by pending_operations.complete_operation
+        if pending_store is None:
+            import pending_operations
+            pending_store = pending_operations.get_store()
+        operation_name = operation.operation.name
+        pending_store.put(operation_name, {
+            "doc_type": doc_type,
+            "userId": userId,
+            "location": location,
+            "gcs_output_uri": gcs_output_uri,
+            "inputs": gcs_input_documents or [],
+        })
+        print(f"Submitted operation {operation_name}")
+        sources = list(contexts) or [gcs_input_uri or gcs_input_prefix]
+        return {source: {"status": "submitted", "operation": operation_name} for source in sources}
+
+    try:
+        return wait_for_batch(
+            operation, handler, userId, doc_type, contexts, timeout, process_fn, incremental,
+            cancel_on_timeout,
+        )
+    finally:
+        # Frees the in-flight slot without waiting for the next refresh
+        submission_scheduler.release(operation)
+
+def wait_for_batch(operation, handler, userId, doc_type, contexts, timeout,
+                   process_fn=None, incremental=None, cancel_on_timeout=False) -> dict:
+    """
+    Waits for a submitted operation and processes its outputs, either once
+    it is done or input by input (incremental).
+    """
+    if incremental is None:
+        incremental = INCREMENTAL_OUTPUTS
+    if incremental:
+        # Start on each input document as soon as Document AI finishes it
+        return consume_incrementally(
+            operation, handler, userId, doc_type, contexts, timeout, process_fn=process_fn,
+            cancel_on_timeout=cancel_on_timeout,
+        )
+
+    # Starting the operation
+    try:
+        print(f"Waiting for operation {operation.operation.name} to complete...")
+        operation.result(timeout=timeout)
+
+    # Catch exception when operation doesn't finish before timeout
+    except (RetryError, InternalServerError) as e:
+        print(e.message)
+
+    # Still running after timeout seconds
+    except concurrent.futures.TimeoutError:
+        print(f"Operation {operation.operation.name} did not finish in {timeout}s")
+        if cancel_on_timeout:
+            cancel_operation(operation)
+        raise
+
+    # Process output metadata
+    metadata = documentai.BatchProcessMetadata(operation.metadata)
+    return finish_batch(metadata, handler, userId, doc_type, contexts, process_fn=process_fn)
+
+def cancel_operation(operation):
+    """
+    Cancels a running operation, best effort: it may have finished meanwhile.
+    """
+    try:
+        operation.cancel()
+        print(f"Cancelled operation {operation.operation.name}")
+    except Exception as e:
+        print(f"Could not cancel operation {operation.operation.name}: {e}")
+
+def input_finished(process):
+    """
+    True when Document AI has finished one input of a running operation:
+    it has an output destination and a status.
+    """
+    pb = documentai.BatchProcessMetadata.IndividualProcessStatus.pb(process)
+    return bool(process.output_gcs_destination) and pb.HasField("status")
+
+def consume_incrementally(operation, handler, userId, doc_type, contexts, timeout,
+                          process_fn=None, poll_interval=None, cancel_on_timeout=False) -> dict:
+    """
+    Polls a running operation and hands each finished input document to
+    process_fn on a pool of DOCUMENT_WORKERS threads, so post-processing
+    overlaps with Document AI still working on the other inputs.
+
+    Returns:
+        dict keyed by input GCS URI with the status of each input document.
+    """
+    process_fn = process_fn or process_documents_output
+    poll_interval = poll_interval or INCREMENTAL_POLL_SECONDS
+    deadline = time.monotonic() + timeout
+
+    results = {}
+    futures = {}
+
+    print(f"Consuming operation {operation.operation.name} as inputs finish...")
+    with ThreadPoolExecutor(max_workers=DOCUMENT_WORKERS) as pool:
+        while True:
+            # done() refreshes the operation, and with it the metadata
+            finished = operation.done()
+            metadata = documentai.BatchProcessMetadata(operation.metadata)
+
+            for process in metadata.individual_process_statuses:
+                source = process.input_gcs_source
+                if source in futures or source in results:
+                    continue
+                # Once the operation is done every remaining input is final
+                if not (finished or input_finished(process)):
+                    continue
+                if process.status and process.status.code != 0:
+                    print(f"Input {source} failed: {process.status.message}")
+                    results[source] = {"status": "failed", "message": process.status.message}
+                    continue
+                if not process.output_gcs_destination:
+                    continue
+
+                print(f"Input {source} is ready")
+                futures[source] = pool.submit(
+                    process_fn,
+                    process.output_gcs_destination,
+                    handler,
+                    contexts.get(source, {}).get("userId", userId),
+                    doc_type,
+                    source=source,
+                )
+
+            if finished:
+                break
+            if time.monotonic() > deadline:
+                print(f"Operation {operation.operation.name} did not finish in {timeout}s")
+                if cancel_on_timeout:
+                    cancel_operation(operation)
+                break
+            time.sleep(poll_interval)
+
+        for source, future in futures.items():
+            try:
+                results[source] = future.result()
+            except Exception as e:
+                print(f"Input {source} failed: {e}")
+                results[source] = {"status": "failed", "message": str(e)}
+
+    # Same contract as finish_batch, after the inputs that did finish are saved
+    if not finished:
+        raise BatchFailed(f"Batch Process Failed: did not finish in {timeout}s", results)
+    if metadata.state != documentai.BatchProcessMetadata.State.SUCCEEDED:
+        raise BatchFailed(f"Batch Process Failed: {metadata.state_message}", results)
+
+    return results
+
+def finish_batch(metadata, handler, userId, doc_type, contexts=None, process_fn=None) -> dict:
+    """
+    Handles the outputs of a finished operation, one input document at a time.
+
+    Args:
+        metadata: documentai.BatchProcessMetadata of the operation.
+        contexts: dict keyed by input GCS URI with per-input context (userId).
+        process_fn: replaces process_documents_output, used by local benchmarks.
+
+    Returns:
+        dict keyed by input GCS URI with the status of each input document.
+    """
+    contexts = contexts or {}
+    process_fn = process_fn or process_documents_output
+
+    # Check if process succeeded, nothing is processed otherwise; the inputs
+    # Document AI reported as failed are passed on with the error
+    if metadata.state != documentai.BatchProcessMetadata.State.SUCCEEDED:
+        failed = {
+            process.input_gcs_source: {"status": "failed", "message": process.status.message}
+            for process in metadata.individual_process_statuses
+            if process.status and process.status.code != 0
+        }
+        raise BatchFailed(f"Batch Process Failed: {metadata.state_message}", failed)
+
+    print("Output files:")
+
+    results = {}
+
+    # One process per Input Document
+    for process in list(metadata.individual_process_statuses):
+        source = process.input_gcs_source
+        context = contexts.get(source, {})
+
+        # A single input can fail while the rest of the batch succeeds
+        if process.status and process.status.code != 0:
+            print(f"Input {source} failed: {process.status.message}")
+            results[source] = {"status": "failed", "message": process.status.message}
+            continue
+
+        results[source] = process_fn(
+            process.output_gcs_destination,
+            handler,
+            context.get("userId", userId),
+            doc_type,
+            source=source,
+        )
+
+    return results
+
+def shard_index(name):
+    """
+    Page shard number from a shard name ("<file>-12.json" -> 12), so pages
+    sort numerically instead of the listing's lexicographic order.
+    """
+    match = re.search(r"-(\d+)\.json$", name)
+    return int(match.group(1)) if match else 0
+
+class ShardContext:
+    """
+    One page shard, downloaded and parsed once.
+
+    The extraction stage (handler) and the image stage (clean_document) both
+    read the same Document, so the multi-megabyte shard JSON with its base64
+    page image crosses the network and goes through from_json only once.
+    """
+    def __init__(self, blob):
+        self.blob = blob
+        self.name = blob.name
+        self._document = None
+
+    @property
+    def document(self):
+        if self._document is None:
+            print(f"Fetching {self.name}")
+            self._document = load_shard(storage.get_storage().read_blob(self.blob))
+        return self._document
+
+def load_shard(data):
+    """
+    Parses shard JSON with the loader picked by SHARD_LOADER.
+    """
+    if SHARD_LOADER == "fast":
+        return fast_document.load_document(data)
+    return documentai.Document.from_json(data, ignore_unknown_fields=True)
+
+def process_shard(blob, bucket, userId, doc_type, handler, writer=None, source=None):
+    """
+    Extracts the fields of one page shard and returns its cleaned image.
+    writer (a storage WriteBatch) queues the finalized JSON upload, source
+    (page_source.SourceDocument) renders the page from the upload instead
+    of using pages.image.
+    """
+    # Imported here so OpenCV only loads once there is an image to clean
+    import image_stage
+
+    shard = ShardContext(blob)
+
+    # Process output JSON (extract fields + save finalized.json)
+    process_output(blob, bucket, userId, doc_type, handler, document=shard.document, writer=writer)
+
+    # Clean the page image of the same Document for the page list, on the
+    # image pool shared by every shard thread
+    if source is not None:
+        return image_stage.get_stage().clean_source_document(
+            source, shard.document, shard_index(blob.name) + 1
+        )
+    if page_source.uses_source(doc_type):
+        # pages.image was left out of the field mask, there is nothing to clean
+        raise ValueError(f"No source document to render {blob.name} from (pages.image not requested)")
+    return image_stage.get_stage().clean_document(shard.document)
+
+def process_documents_output(output_gcs_destination, handler, userId, doc_type, workers=None,
+                             source=None) -> dict:
+    """
+    Handles every shard Document AI wrote for one input document:
+    extracts fields, cleans images and stitches the pages into a PDF.
+
+    Shards run on a pool of `workers` threads (SHARD_WORKERS by default).
+    Pages are put back in shard order for the PDF, and a failed shard is
+    reported in "errors" instead of stopping the other pages.
+
+    source is the gs:// URI of the input document, the preview pages are
+    rendered from it when the doc type uses the "source" preview.
+    """
+    from image_extract import pdf_name, upload_pdf_gcs
+
+    # output_gcs_destination format: gs://BUCKET/PREFIX/OPERATION_NUMBER/INPUT_FILE_NUMBER/
+    # The Cloud Storage API requires the bucket name and URI prefix separately
+    matches = re.match(r"gs://(.*?)/(.*)", output_gcs_destination)
+    if not matches:
+        print(
+            "Could not parse output GCS destination:",
+            output_gcs_destination,
+        )
+        return {"status": "failed", "message": "Unparsable output destination"}
+
+    # Store the bucket name and prefix
+    output_bucket, output_prefix = matches.groups()
+
+    # Shared storage layer
+    store = storage.get_storage()
+
+    # Get List of Document Objects from the Output Bucket
+    output_blobs = store.list(output_bucket, prefix=output_prefix)
+
+    # Access the bucket
+    bucket = store.bucket(output_bucket)
+
+    # Document AI may output multiple JSON files per source file
+    shards = []
+    for blob in output_blobs:
+        # Document AI should only output JSON files to GCS
+        if blob.content_type != "application/json":
+            print(
+                f"Skipping non-supported file: {blob.name} - Mimetype: {blob.content_type}"
+            )
+            continue
+        # Skip already processed finalized JSONs
+        if blob.name.endswith("_finalized.json"):
+            continue
+        shards.append(blob)
+
+    if not shards:
+        print(f"No shards found in {output_gcs_destination}")
+        return {"status": "failed", "message": "No output shards"}
+
+    shards.sort(key=lambda blob: shard_index(blob.name))
+
+    workers = max(1, min(workers or SHARD_WORKERS, len(shards)))
+    errors = []
+    # Finalized JSON of every page in the PDF, in page order
+    finalized = []
+
+    # Preview pages rendered from the upload, the shards have no pages.image
+    source_document = None
+    if page_source.uses_source(doc_type):
+        if source:
+            source_document = page_source.SourceDocument(source)
+        else:
+            # The shards have no pages.image either, every shard fails with the reason
+            print(f"No source document for {output_gcs_destination}, its pages can't be rendered")
+
+    # The finalized JSONs are small, they are uploaded in the background while
+    # the shard threads go on with the images
+    writes = store.batch()
+
+    def pages():
+        # Cleaned pages in shard order, failed shards are recorded and skipped
+        for blob, page, error in iter_shard_pages(shards, bucket, userId, doc_type, handler, workers, writes,
+                                                  source_document):
+            if error is not None:
+                print(f"Shard {blob.name} failed: {error}")
+                errors.append({"shard": blob.name, "message": str(error)})
+            elif page is not None:
+                finalized.append(finalized_name(blob.name))
+                yield page
+
+    # Only start the PDF upload once there is a page to put in it
+    page_iter = pages()
+    try:
+        first = next(page_iter, None)
+        if first is None:
+            flush_writes(writes, errors)
+            return {"status": "failed", "message": "No pages processed", "errors": errors}
+
+        # Pages are written to the PDF upload as they come in, in shard order
+        print("Stitching pdf")
+        page_count = upload_pdf_gcs(shards[0].name, doc_type, itertools.chain([first], page_iter))
+        flush_writes(writes, errors)
+    finally:
+        # Stops the shard threads before the source goes away
+        page_iter.close()
+        if source_document is not None:
+            source_document.close()
+
+    return {
+        "status": "partial" if errors else "ok",
+        "output": output_gcs_destination,
+        "pages": page_count,
+        "errors": errors,
+        # Where the results of each page went (page_index records them)
+        "bucket": output_bucket,
+        "finalized": finalized,
+        "pdf": pdf_name(shards[0].name, doc_type),
+    }
+
+def flush_writes(writes, errors):
+    """Waits for the batched finalized JSON uploads, a failure goes to errors."""
+    try:
+        writes.flush()
+    except Exception as e:
+        print(f"Saving extracted fields failed: {e}")
+        errors.append({"shard": None, "message": f"Saving extracted fields failed: {e}"})
+
+def iter_shard_pages(shards, bucket, userId, doc_type, handler, workers, writer=None, source=None):
+    """
+    Runs process_shard on a pool of `workers` threads and yields
+    (blob, cleaned page, error) in shard order.
+
+    At most 2 * workers shards are started ahead of the one being read, so
+    finished pages don't pile up in memory while an earlier shard is slow.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(shards)
+        pending = deque()
+
+        def fill():
+            while len(pending) < workers * 2:
+                blob = next(remaining, None)
+                if blob is None:
+                    return
+                pending.append((blob, pool.submit(process_shard, blob, bucket, userId, doc_type, handler, writer, source)))
+
+        fill()
+        while pending:
+            blob, future = pending.popleft()
+            try:
+                page, error = future.result(), None
+            except Exception as e:
+                page, error = None, e
+            fill()
+            yield blob, page, error
+
+# Process the output
+def process_output(blob, bucket, userId, doc_type, handler, document=None, writer=None):
+    """
+    Processes a single Document AI JSON shard:
+    - Loads JSON into Document object (unless already loaded by a ShardContext)
+    - Extracts entities/fields with data handler
+    - Writes extracted fields into a new *_finalized.json in GCS
+    """
+
+    if document is None:
+        document = ShardContext(blob).document
+
+    # Call the doc type's handler for data extraction
+    final_data = handler(document)
+
+    # Save results as a new finalized JSON file
+    output_blob_name = finalized_name(blob.name)
+    write_finalized(final_data, bucket, output_blob_name, userId, doc_type, writer=writer)
+
+def finalized_name(shard_name):
+    """Name of the finalized JSON written for a shard."""
+    return shard_name.replace(".json", "_finalized.json")
+
+def write_finalized(final_data, bucket, output_blob_name, userId, doc_type, writer=None):
+    """
+    Uploads the handler's result as a *_finalized.json, which triggers the
+    send-front-end function. With a writer (storage WriteBatch) the upload
+    is queued instead of waited for.
+    """
+    writer = writer or storage.get_storage()
+
+    # Upload JSON string with extracted fields
+    # Attach metadata for traceability, sent with the upload
+    writer.write(
+        bucket.name,
+        output_blob_name,
+        json.dumps(final_data, indent=2),
+        "application/json",
+        metadata={
+            "userid" : userId,
+            "docType" : doc_type,
+        },
+    )
+
+    print(f"Extracted fields saved to: gs://{bucket.name}/{output_blob_name}")
+
+def should_process_online(mime_type, size):
+    """
+    Decides if an upload is small enough for the synchronous process_document
+    call. PDFs are also checked to be a single page in process_online.
+
+    Args:
+        mime_type: Detected mime type of the upload.
+        size: Object size in bytes from the storage event, None if unknown.
+    """
+    if ONLINE_MAX_BYTES <= 0 or size is None:
+        return False
+    return int(size) <= ONLINE_MAX_BYTES
+
+def count_pdf_pages(content):
+    """
+    Page count of a PDF, None when it can't be read.
+    """
+    try:
+        import fitz
+        with fitz.open(stream=content, filetype="pdf") as pdf:
+            return pdf.page_count
+    except Exception as e:
+        print(f"Could not count PDF pages: {e}")
+        return None
+
+def process_online(
+    handler: Callable,
+    userId: str,
+    doc_type: str,
+    project_id: str,
+    location: str,
+    processor_id: str,
+    gcs_input_uri: str,
+    input_mime_type: str,
+    processor_version_id: Optional[str] = None,
+    field_mask: Optional[str] = None,
+    client=None,
+    content: Optional[bytes] = None,
+) -> Optional[dict]:
+    """
+    Processes a small single-page upload with the online process_document
+    request. The returned Document goes straight to the handler and the
+    image stage, so no shard JSON is written to or read back from GCS.
+    content is the upload's bytes when the caller already has them (page
+    index check), otherwise PDFs are downloaded here.
+
+    Returns:
+        Status dict like process_documents_output, or None when the upload
+        turned out to have more than one page (the caller falls back to
+        batch processing, which writes one finalized JSON per page).
+    """
+    from image_extract import pdf_name, upload_pdf_gcs
+    import image_stage
+
+    if client is None:
+        client = clients.documentai_client(location)
+
+    # Without pages.image when the preview of this doc type comes from the upload
+    field_mask = page_source.field_mask(doc_type, field_mask)
+
+    if processor_version_id:
+        name = client.processor_version_path(project_id, location, processor_id, processor_version_id)
+    else:
+        name = client.processor_path(project_id, location, processor_id)
+
+    matches = re.match(r"gs://(.*?)/(.*)", gcs_input_uri)
+    input_bucket, input_name = matches.groups()
+
+    if input_mime_type == "application/pdf":
+        # PDFs need a page count, download once and send the bytes inline
+        if content is None:
+            content = storage.get_storage().read(input_bucket, input_name)
+        pages = count_pdf_pages(content)
+        if pages != 1:
+            print(f"{gcs_input_uri} has {pages} pages, using batch processing")
+            return None
+        request = documentai.ProcessRequest(
+            name=name,
+            raw_document=documentai.RawDocument(content=content, mime_type=input_mime_type),
+            field_mask=field_mask,
+        )
+    elif content is not None:
+        # Already downloaded, sent inline like a PDF
+        request = documentai.ProcessRequest(
+            name=name,
+            raw_document=documentai.RawDocument(content=content, mime_type=input_mime_type),
+            field_mask=field_mask,
+        )
+    else:
+        # Images are a single page, Document AI reads them from GCS directly
+        request = documentai.ProcessRequest(
+            name=name,
+            gcs_document=documentai.GcsDocument(gcs_uri=gcs_input_uri, mime_type=input_mime_type),
+            field_mask=field_mask,
+        )
+
+    print(f"Processing {gcs_input_uri} online...")
+    document = client.process_document(request=request).document
+
+    # Name the outputs like a batch shard ("<file>-0.json") so send-front-end
+    # and upload_pdf_gcs derive the same document and PDF names
+    stem = re.sub(r"\.[^./]+$", "", input_name.rsplit("/", 1)[-1])
+    output_name = f"{ONLINE_OUTPUT_PREFIX}/{doc_type}/online/{uuid.uuid4().hex}/{stem}-0.json"
+
+    final_data = handler(document)
+    output_bucket = storage.get_storage().bucket(ONLINE_OUTPUT_BUCKET)
+    write_finalized(final_data, output_bucket, finalized_name(output_name), userId, doc_type)
+
+    # The single page of this Document
+    if page_source.uses_source(doc_type):
+        # Rendered from the upload, the PDF bytes are reused when already downloaded
+        source_document = page_source.SourceDocument(gcs_input_uri, input_mime_type, content)
+        try:
+            pdf_list = image_stage.get_stage().clean_source_pages(source_document, document.pages)
+        finally:
+            source_document.close()
+    else:
+        pdf_list = image_stage.get_stage().clean_pages(document.pages)
+    print("Stitching pdf")
+    upload_pdf_gcs(output_name, doc_type, pdf_list)
+
+    return {
+        "status": "ok",
+        "output": f"gs://{ONLINE_OUTPUT_BUCKET}/{output_name}",
+        "pages": len(pdf_list),
+        # One page, one finalized JSON, same as a batch shard
+        "bucket": ONLINE_OUTPUT_BUCKET,
+        "finalized": [finalized_name(output_name)],
+        "pdf": pdf_name(output_name, doc_type),
+    }
@@ -0,0 +1,153 @@
+import base64
+import json
+
+# Lightweight loader for Document AI shard JSON.
+# documentai.Document.from_json builds the whole proto-plus tree, including
+# the page image, which is base64-decoded up front even when the caller only
+# wants entities. This loader parses the JSON with the C json module, keeps
+# only the subtrees the pipeline reads (entities, pages.image, pages.blocks)
+# and exposes them through small __slots__ objects with the same attribute
+# names as the proto-plus types, so handle_data and the image stage accept
+# either. Page image bytes are only decoded when .content is first read.
+# entity_records builds the same entity records from a documentai.Document.
+
+class LiteNormalizedValue:
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+class LiteEntity:
+    """Same attributes the handlers read from documentai.Document.Entity."""
+    __slots__ = ("type", "mention_text", "confidence", "normalized_value", "properties")
+
+    def __init__(self, raw):
+        self.type = raw.get("type", "")
+        self.mention_text = raw.get("mentionText", "")
+        self.confidence = raw.get("confidence", 0.0)
+        normalized = raw.get("normalizedValue")
+        # Missing or empty normalized_value is falsy, like the proto message
+        self.normalized_value = LiteNormalizedValue(normalized.get("text", "")) if normalized else None
+        self.properties = [LiteEntity(prop) for prop in raw.get("properties", ())]
+
+    @classmethod
+    def from_pb(cls, pb):
+        """Record of a raw Document.Entity protobuf (not the proto-plus wrapper)."""
+        entity = cls.__new__(cls)
+        # proto-plus builds the descriptor, "type" is renamed there too
+        entity.type = pb.type_
+        entity.mention_text = pb.mention_text
+        entity.confidence = pb.confidence
+        # Set but empty is falsy too, like the proto-plus message
+        normalized = pb.normalized_value if pb.HasField("normalized_value") else None
+        entity.normalized_value = LiteNormalizedValue(normalized.text) if normalized and normalized.ListFields() else None
+        entity.properties = [cls.from_pb(prop) for prop in pb.properties]
+        return entity
+
+class LiteVertex:
+    __slots__ = ("x", "y")
+
+    def __init__(self, raw):
+        self.x = raw.get("x", 0.0)
+        self.y = raw.get("y", 0.0)
+
+class LiteBoundingPoly:
+    __slots__ = ("normalized_vertices",)
+
+    def __init__(self, raw):
+        self.normalized_vertices = [LiteVertex(v) for v in raw.get("normalizedVertices", ())]
+
+class LiteLayout:
+    __slots__ = ("bounding_poly",)
+
+    def __init__(self, raw):
+        self.bounding_poly = LiteBoundingPoly(raw.get("boundingPoly") or {})
+
+class LiteBlock:
+    __slots__ = ("layout",)
+
+    def __init__(self, raw):
+        self.layout = LiteLayout(raw.get("layout") or {})
+
+class LazyImage:
+    """
+    Page image whose base64 content is decoded on first access.
+    release() drops both the encoded and decoded copies.
+    """
+    __slots__ = ("mime_type", "width", "height", "_encoded", "_content")
+
+    def __init__(self, raw):
+        self.mime_type = raw.get("mimeType", "")
+        self.width = raw.get("width", 0)
+        self.height = raw.get("height", 0)
+        self._encoded = raw.get("content")
+        self._content = None
+
+    def __bool__(self):
+        return bool(self._encoded or self._content)
+
+    @property
+    def content(self):
+        if self._content is None and self._encoded:
+            self._content = base64.b64decode(self._encoded)
+            # The decoded bytes are all we need from now on
+            self._encoded = None
+        return self._content or b""
+
+    def release(self):
+        self._encoded = None
+        self._content = None
+
+class LitePage:
+    __slots__ = ("page_number", "image", "blocks")
+
+    def __init__(self, raw, include_image=True, include_blocks=True):
+        self.page_number = raw.get("pageNumber", 0)
+        image = raw.get("image") if include_image else None
+        self.image = LazyImage(image) if image else None
+        self.blocks = [LiteBlock(b) for b in raw.get("blocks", ())] if include_blocks else []
+
+class LiteDocument:
+    __slots__ = ("entities", "pages")
+
+    def __init__(self, entities, pages):
+        self.entities = entities
+        self.pages = pages
+
+def entity_records(document):
+    """
+    document.entities as LiteEntity records.
+
+    Every attribute read through a proto-plus wrapper marshals a new value,
+    and the handlers read each entity several times. Documents from
+    documentai (online results, SHARD_LOADER=proto) are converted in one pass
+    over the underlying protobuf instead. LiteDocument entities already are
+    records and are returned as they are.
+    """
+    if isinstance(document, LiteDocument):
+        return document.entities
+    pb = getattr(type(document), "pb", None)
+    if pb is None:
+        return document.entities
+    return [LiteEntity.from_pb(entity) for entity in pb(document).entities]
+
+def load_document(data, entities=True, images=True, blocks=True):
+    """
+    Parses Document AI JSON into a LiteDocument.
+
+    Args:
+        data: Shard JSON (bytes or str).
+        entities: Build the entity records.
+        images: Keep page images (decoded lazily on first .content access).
+        blocks: Keep pages.blocks layout geometry.
+    """
+    raw = json.loads(data)
+    entity_list = [LiteEntity(e) for e in raw.get("entities", ())] if entities else []
+
+    pages = []
+    if images or blocks:
+        pages = [LitePage(p, include_image=images, include_blocks=blocks) for p in raw.get("pages", ())]
+
+    # Drop the parsed JSON (and with it any subtree we didn't keep)
+    del raw
+    return LiteDocument(entity_list, pages)
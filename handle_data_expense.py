@@ -1 +1,22 @@
-# TODO
+import doc_schema
+import service_invoice_data_handler
+
+# Expense receipt handler.
+# There is no expense receipt processor yet (main.trigger still sends them to
+# the 2307 extractor). The return function already reads Date, Item_Table
+# and Item_Table_2 of expense receipts with calculateForServiceInvoice, so
+# the schema starts as the Service Invoice one. Override fields and tables
+# here once the processor is trained, e.g.
+#   SCHEMA["fields"] = {**SCHEMA["fields"], "Receipt_No": norm_invoice_no}
+SCHEMA = dict(service_invoice_data_handler.SCHEMA)
+_SCHEMA = doc_schema.compile_schema(SCHEMA)
+
+def handle_data(document):
+    """
+    Main handler for extracting and normalizing field values
+    from a Document AI `document` object for expense receipts.
+
+    Returns:
+        dict: Header fields, confidence_average, Item_Table and Item_Table_2.
+    """
+    return _SCHEMA.handle(document)
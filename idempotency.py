@@ -0,0 +1,325 @@
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from abc import ABC, abstractmethod
+from collections import deque
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+# Storage triggers are delivered at least once, so the same upload can reach
+# the function more than once. Before any work starts, the trigger claims a
+# lease on the event key. A duplicate that finds a live lease is dropped (or,
+# on the same instance, waits for the first one and shares its result).
+# A lease that is never completed expires, so a crashed attempt can be retried.
+# A completed (DONE) lease is kept for its TTL after completion, long enough
+# to drop the platform's redeliveries, and then expires too.
+
+# Claim outcomes
+CLAIMED = "claimed"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+
+def event_key(event, data):
+    """
+    Builds the idempotency key of a storage event.
+
+    The object generation identifies one version of one upload, so it is used
+    when present. Otherwise fall back to the CloudEvent id, which is stable
+    across redeliveries of the same event.
+    """
+    generation = data.get("generation")
+    if generation:
+        return f"{data.get('bucket')}/{data.get('name')}#{generation}"
+    return f"event:{event['id']}"
+
+class LeaseStore(ABC):
+    """
+    Interface for lease stores.
+
+    claim() must be atomic: when two callers race on a new key only one of
+    them gets CLAIMED.
+    """
+    @abstractmethod
+    def claim(self, key, owner, ttl):
+        """Returns CLAIMED, IN_FLIGHT (live lease) or DONE (completed less than ttl ago)."""
+
+    @abstractmethod
+    def complete(self, key, owner):
+        """Marks owner's lease DONE for another ttl."""
+
+    @abstractmethod
+    def release(self, key, owner):
+        """Drops owner's unfinished lease so a retry can claim it."""
+
+class InMemoryLeaseStore(LeaseStore):
+    """
+    Lease store for a single process, used for local tests and as the default.
+
+    DONE leases are kept for their TTL after completion (long enough to drop
+    the platform's redeliveries) and then evicted, so a warm instance doesn't
+    keep one entry per upload it ever handled.
+    """
+
+    def __init__(self):
+        self._leases = {}
+        # (expires_at, key) of DONE leases, in completion order
+        self._done = deque()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # Called with the lock held. TTLs are per guard, so completion order
+        # is (near enough) expiry order and the scan stops at the first live one
+        while self._done and self._done[0][0] <= now:
+            _, key = self._done.popleft()
+            lease = self._leases.get(key)
+            if lease and lease["state"] == DONE and lease["expires_at"] <= now:
+                del self._leases[key]
+
+    def claim(self, key, owner, ttl):
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            lease = self._leases.get(key)
+            if lease:
+                if lease["state"] == DONE:
+                    return DONE
+                if lease["expires_at"] > now:
+                    return IN_FLIGHT
+            self._leases[key] = {"owner": owner, "state": IN_FLIGHT, "expires_at": now + ttl, "ttl": ttl}
+            return CLAIMED
+
+    def complete(self, key, owner):
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            lease = self._leases.get(key)
+            if lease and lease["owner"] == owner:
+                lease["state"] = DONE
+                lease["expires_at"] = now + lease["ttl"]
+                self._done.append((lease["expires_at"], key))
+
+    def release(self, key, owner):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease["owner"] == owner and lease["state"] != DONE:
+                del self._leases[key]
+
+class SQLiteLeaseStore(LeaseStore):
+    """
+    Lease store backed by a SQLite file, shared by every process on one machine.
+
+    Expired DONE leases are deleted by claim(), like the in-memory store evicts them.
+    """
+
+    def __init__(self, path=":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "key TEXT PRIMARY KEY, owner TEXT, state TEXT, expires_at REAL, ttl REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS leases_expiry ON leases (state, expires_at)")
+
+    def claim(self, key, owner, ttl):
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock so the read + write is atomic
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM leases WHERE state = ? AND expires_at <= ?", (DONE, now)
+                )
+                row = self._conn.execute(
+                    "SELECT state, expires_at FROM leases WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[0] == DONE:
+                    result = DONE
+                elif row and row[1] > now:
+                    result = IN_FLIGHT
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO leases (key, owner, state, expires_at, ttl) VALUES (?, ?, ?, ?, ?)",
+                        (key, owner, IN_FLIGHT, now + ttl, ttl),
+                    )
+                    result = CLAIMED
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def complete(self, key, owner):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE leases SET state = ?, expires_at = ? + ttl WHERE key = ? AND owner = ?",
+                (DONE, time.time(), key, owner),
+            )
+
+    def release(self, key, owner):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM leases WHERE key = ? AND owner = ? AND state != ?", (key, owner, DONE)
+            )
+
+class GcsLeaseStore(LeaseStore):
+    """
+    Lease store shared by every function instance, one small JSON object per key.
+
+    Creation uses if_generation_match=0 so only one writer can create a lease,
+    and takeover of an expired lease is guarded by the generation that was read.
+
+    A DONE lease expires ttl seconds after completion, the next claim takes it
+    over. Objects nobody claims again are not deleted here: give the bucket a
+    lifecycle rule deleting them after a day (longer than any TTL), see README.
+    """
+
+    def __init__(self, bucket_name, prefix="leases", storage_client=None):
+        # Shared storage layer, imported here so the in-memory stores don't need it
+        import storage
+        self.storage = storage.Storage(storage_client) if storage_client else storage.get_storage()
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def _blob(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.storage.blob(self.bucket_name, f"{self.prefix}/{digest}.json")
+
+    def _write(self, blob, owner, state, expires_at, ttl, if_generation_match=None):
+        self.storage.write_blob(
+            blob,
+            json.dumps({"owner": owner, "state": state, "expires_at": expires_at, "ttl": ttl}),
+            "application/json",
+            if_generation_match=if_generation_match,
+        )
+
+    def _read(self, blob):
+        """
+        Reads a lease and the generation it was read at (set on blob).
+
+        Returns:
+            The lease dict, None when it is gone or changed while reading.
+        """
+        try:
+            self.storage.reload_blob(blob)
+            return json.loads(self.storage.read_blob(blob, if_generation_match=blob.generation))
+        except (NotFound, PreconditionFailed):
+            return None
+
+    def _held(self, key, owner):
+        """
+        The lease blob, at the generation that was read, and the lease when
+        owner still holds it. None when it expired and was taken over (or is gone).
+        """
+        blob = self._blob(key)
+        lease = self._read(blob)
+        if lease is None or lease.get("owner") != owner or lease.get("state") == DONE:
+            print(f"Lease of {key} is no longer held by {owner}")
+            return None, None
+        return blob, lease
+
+    def claim(self, key, owner, ttl):
+        now = time.time()
+        blob = self._blob(key)
+        try:
+            self._write(blob, owner, IN_FLIGHT, now + ttl, ttl, if_generation_match=0)
+            return CLAIMED
+        except PreconditionFailed:
+            pass
+
+        # Someone created the lease first, see what state it is in
+        lease = self._read(blob)
+        if lease is None:
+            # It changed under us, treat it as busy
+            return IN_FLIGHT
+        if lease.get("expires_at", 0) > now:
+            return DONE if lease.get("state") == DONE else IN_FLIGHT
+
+        # Expired lease (unfinished, or done more than its ttl ago), take it
+        # over unless someone else beat us to it
+        try:
+            self._write(blob, owner, IN_FLIGHT, now + ttl, ttl, if_generation_match=blob.generation)
+            return CLAIMED
+        except PreconditionFailed:
+            return IN_FLIGHT
+
+    # complete and release only touch the lease at the generation where owner
+    # holds it, a stale owner (its lease expired and was taken over) must not
+    # mark the new owner's lease done or delete it
+
+    def complete(self, key, owner):
+        blob, lease = self._held(key, owner)
+        if blob is None:
+            return
+        ttl = lease.get("ttl", 0)
+        try:
+            self._write(blob, owner, DONE, time.time() + ttl, ttl, if_generation_match=blob.generation)
+        except PreconditionFailed:
+            print(f"Lease of {key} changed before it was completed")
+
+    def release(self, key, owner):
+        blob, _ = self._held(key, owner)
+        if blob is None:
+            return
+        try:
+            self.storage.delete_blob(blob, if_generation_match=blob.generation)
+        except (NotFound, PreconditionFailed):
+            pass
+
+class IdempotencyGuard:
+    """
+    Runs a function at most once per key.
+
+    Duplicates on the same instance join the in-flight call and get its
+    result. Duplicates elsewhere see the lease and are dropped (run returns None).
+    """
+
+    def __init__(self, store, ttl=900):
+        self.store = store
+        self.ttl = ttl
+        # key -> {"event": threading.Event, "result": ..., "error": ...}
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn):
+        with self._lock:
+            waiter = self._local.get(key)
+            if waiter is None:
+                waiter = {"event": threading.Event(), "result": None, "error": None}
+                self._local[key] = waiter
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            # Same upload is already running here, share its outcome
+            print(f"Joining in-flight processing of {key}")
+            waiter["event"].wait()
+            if waiter["error"]:
+                raise waiter["error"]
+            return waiter["result"]
+
+        owner = str(uuid.uuid4())
+        try:
+            state = self.store.claim(key, owner, self.ttl)
+            if state != CLAIMED:
+                print(f"Duplicate event for {key} ({state}), skipping")
+                return None
+
+            try:
+                result = fn()
+            except Exception:
+                # Free the key so the platform's retry can run it again
+                self.store.release(key, owner)
+                raise
+            self.store.complete(key, owner)
+            waiter["result"] = result
+            return result
+        except Exception as e:
+            waiter["error"] = e
+            raise
+        finally:
+            waiter["event"].set()
+            with self._lock:
+                self._local.pop(key, None)
@@ -1,57 +1,169 @@
 
 
-from google.cloud import storage
 from google.cloud import documentai
-import img2pdf
+import storage
+from pdf_stream import StreamingPdfWriter, DEFAULT_DPI
 import cv2, numpy as np
 import base64
 import re
 import json
+import os
 import uuid
 
 
 # The target bucket for final PDF uploads (change if deploying to another bucket)
 BUCKET_NAME = "document_img_bucket"
 
-# Reuse a storage client across functions
-storage_client = storage.Client()
+# Storage layer shared with the rest of the pipeline, built on first use so
+# importing this module doesn't do a credential lookup
+def get_storage():
+    return storage.get_storage()
 
-def deskew_using_layout(img, pages):
+# Preview resolution
+# The stitched PDF is only shown on screen, so pages can be decoded and cleaned
+# below the scan resolution. PREVIEW_MAX_DIMENSION caps the longest side in
+# pixels, PREVIEW_DPI caps it at that DPI for a page whose long side is
+# PREVIEW_PAGE_INCHES (13 in, a folio BIR form). 0 keeps the full resolution.
+PREVIEW_MAX_DIMENSION = int(os.environ.get("PREVIEW_MAX_DIMENSION", "0"))
+PREVIEW_DPI = int(os.environ.get("PREVIEW_DPI", "0"))
+PREVIEW_PAGE_INCHES = float(os.environ.get("PREVIEW_PAGE_INCHES", "13"))
+
+# Encoding of the cleaned pages embedded in the PDF
+# "source": PNG or JPEG, same as the Document AI page image
+# "png" / "jpeg": always that format
+# "g4": 1 bit per pixel CCITT Group 4 TIFF, which the PDF writer embeds without
+#       re-encoding. The pages are black and white after thresholding, so
+#       nothing is lost and the PDF is a fraction of the size.
+PAGE_ENCODING = os.environ.get("PAGE_ENCODING", "source")
+
+# Adaptive threshold neighbourhood at full resolution, scaled with the page
+THRESHOLD_BLOCK_SIZE = 35
+
+# Reduced decode modes, libjpeg scales JPEGs down while decoding
+REDUCED_MODES = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+def preview_max_dimension():
     """
-    Deskews an image using Document AI layout metadata.
-    
-    img: grayscale OpenCV image
-    page: document.pages[i] from Document AI
+    Longest side in pixels for cleaned pages, 0 for full resolution.
+    """
+    limits = [limit for limit in (
+        PREVIEW_MAX_DIMENSION,
+        int(PREVIEW_DPI * PREVIEW_PAGE_INCHES),
+    ) if limit > 0]
+    return min(limits) if limits else 0
+
+# PDF upload
+# PDFs up to PDF_UPLOAD_CHUNK_MB go up in a single request. Bigger ones switch to
+# a resumable upload sent in chunks of that size, so only one chunk and the
+# page being written are held in memory.
+PDF_UPLOAD_CHUNK_MB = int(os.environ.get("PDF_UPLOAD_CHUNK_MB", "8"))
+
+# Deskew settings
+# Pages whose median block angle is below this (degrees) are left as they are,
+# a full INTER_CUBIC resample isn't worth a fraction of a degree
+DESKEW_TOLERANCE_DEGREES = float(os.environ.get("DESKEW_TOLERANCE_DEGREES", "0.1"))
+# Blocks tilted more than this (vertical text, stamps) don't count towards the skew
+DESKEW_MAX_ANGLE = float(os.environ.get("DESKEW_MAX_ANGLE", "45"))
+
+def block_angles(blocks):
+    """
+    Angle in degrees of the top edge of every block, computed for all blocks at once.
+
+    blocks: page.blocks from Document AI (proto or fast_document)
     """
+    # Gather every vertex into one array, with the vertex count of each block
+    counts = []
+    coords = []
+    for block in blocks:
+        vertices = block.layout.bounding_poly.normalized_vertices
+        counts.append(len(vertices))
+        coords.extend((v.x, v.y) for v in vertices)
+
+    if not coords:
+        return np.empty(0)
+
+    points = np.asarray(coords, dtype=np.float64)
+    counts = np.asarray(counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
     angles = []
-     # Collect angles of each text block from its bounding polygon
-    for block in pages.blocks:
-        bbox = sorted(block.layout.bounding_poly.normalized_vertices,
-                      key=lambda v: (v.y, v.x))  # Sort vertices row by row
-        if len(bbox) >= 2:
-            
-            dx = bbox[1].x - bbox[0].x
-            dy = bbox[1].y - bbox[0].y
-            angle = np.degrees(np.arctan2(dy, dx))
-            angles.append(angle)
-   
+    # Blocks are nearly always quads, group by vertex count to get (blocks, k, 2) arrays
+    for k in np.unique(counts[counts >= 2]):
+        polys = points[starts[counts == k][:, None] + np.arange(k)]
+
+        # First two vertices sorted row by row (y, then x): the top edge
+        order = np.lexsort((polys[..., 0], polys[..., 1]), axis=-1)[:, :2]
+        top = np.take_along_axis(polys, order[..., None], axis=1)
+        dx = top[:, 1, 0] - top[:, 0, 0]
+        dy = top[:, 1, 1] - top[:, 0, 1]
+
+        # Point every edge to the right so a page tilted either way gives a
+        # small angle instead of one close to 180
+        flip = np.where(dx < 0, -1.0, 1.0)
+        angles.append(np.degrees(np.arctan2(dy * flip, dx * flip)))
+
+    return np.concatenate(angles) if angles else np.empty(0)
+
+def skew_angle(angles):
+    """
+    Median block angle after dropping outliers, None when no block is usable.
+    """
+    angles = angles[np.abs(angles) <= DESKEW_MAX_ANGLE]
+    if not angles.size:
+        return None
+
+    median = np.median(angles)
+    # Drop angles more than 3 (scaled) median absolute deviations away
+    mad = np.median(np.abs(angles - median))
+    if mad > 0:
+        angles = angles[np.abs(angles - median) <= 3 * 1.4826 * mad]
+        median = np.median(angles)
+    return float(median)
+
+def page_skew(page):
+    """
+    Skew angle of a page from its blocks, None when it has no usable block.
+    """
+    return skew_angle(block_angles(page.blocks))
+
+def rotate_image(img, angle):
+    """
+    Rotates a grayscale image by the skew angle found in its layout.
+    Returns the image unchanged for no angle or one below the tolerance.
+    """
     # If no angles found, skip deskewing
-    if not angles:
+    if angle is None:
         print("not angles")
         return img
-        
-    # Use median angle for stability against outliers
-    avg_angle = np.median(angles)  
+
+    # Already straight, skip the resample
+    if abs(angle) < DESKEW_TOLERANCE_DEGREES:
+        return img
+
     (h, w) = img.shape
     center = (w // 2, h // 2)
     
     # Create rotation matrix (negative angle = clockwise)
-    M = cv2.getRotationMatrix2D(center, -avg_angle, 1.0) #type: ignore
+    M = cv2.getRotationMatrix2D(center, -angle, 1.0) #type: ignore
     print("returning fixed rotation")
     return cv2.warpAffine(img, M, (w, h),
                           flags=cv2.INTER_CUBIC,
                           borderMode=cv2.BORDER_REPLICATE)
 
+def deskew_using_layout(img, pages):
+    """
+    Deskews an image using Document AI layout metadata.
+    
+    img: grayscale OpenCV image
+    page: document.pages[i] from Document AI
+    """
+    # Angles of every text block from its bounding polygon, in one pass
+    return rotate_image(img, page_skew(pages))
+
 def clean_img(blob):
     """
     Cleans and deskews image(s) embedded in a Document AI JSON blob.
@@ -64,61 +176,204 @@ def clean_img(blob):
     """
      # Load Document object from JSON blob
     document = documentai.Document.from_json(
-        blob.download_as_bytes()
+        get_storage().read_blob(blob)
     )
+    return clean_document(document)
+
+def clean_document(document):
+    """
+    Cleans the first page with an image in an already loaded Document.
 
+    Returns:
+        Encoded image bytes (PNG/JPEG) for the first valid page found.
+    """
     # Iterate through all pages in the document
-    for i, page in enumerate(document.pages, start=1):
-        img_info = page.image
-        if img_info and img_info.content:
-
-             # Decode base64 or raw bytes content
-            if(isinstance(img_info.content, bytes)):
-                img_bytes = img_info.content
-            else:
-                img_bytes = base64.b64decode(img_info.content)
-            
-            # Choose extension based on mime type
-            mime_type = page.image.mime_type # Example: image/png
-            ext = ".png" #png by default
-            if("jpeg" in mime_type.lower() or "jpg" in mime_type.lower()):
-                ext = ".jpg"
-                print("Entered the if statement, the extension is: ", ext)
-            
-            # Converts bytes to numpy array and then to grayscale image
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-
-            # Deskewing the image using layout info
-            print("Deskewing now")
-            img = deskew_using_layout(img, page)
-
-            # Apply Preprocessing filters
-            img = cv2.medianBlur(img, 1)
-            img = cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                        cv2.THRESH_BINARY, 35, 10)
-            print("DONE PREPROCESSING")
-
-            # Encode cleaned image back into bytes and return it 
-            _, final_img = cv2.imencode(ext, img)
-            new_pdf = (final_img.tobytes())
-            return new_pdf
-    
-def upload_pdf_gcs(filename, docType, page_list):
+    for page in document.pages:
+        cleaned = clean_page(page)
+        if cleaned is not None:
+            return cleaned
 
+def clean_pages(document):
     """
-    Stitches processed image pages into a PDF and uploads to GCS.
+    Cleans every page with an image, used when one Document holds the
+    whole file (online processing) instead of one page per shard.
+
+    Returns:
+        List of encoded image bytes, in page order.
+    """
+    return [cleaned for cleaned in map(clean_page, document.pages) if cleaned is not None]
+
+def clean_page(page):
+    """
+    Deskews and binarizes one Document AI page image.
+
+    Returns:
+        Encoded image bytes (PNG/JPEG), or None when the page has no image.
+    """
+    decoded = decode_page(page)
+    if decoded is None:
+        return None
+    img, ext, scale = decoded
+
+    # Deskewing the image using layout info
+    print("Deskewing now")
+    return clean_image(img, page_skew(page), ext, scale)
+
+def decode_page(page, max_dimension=None):
+    """
+    Decodes a page image to grayscale, no larger than the preview size.
 
     Args:
-        filename: Source filename (usually JSON blob name).
-        docType: Document type (used as prefix in GCS).
-        page_list: List of image bytes to stitch into PDF.
+        page: document.pages[i] from Document AI.
+        max_dimension: Longest side in pixels, preview_max_dimension() by default.
+
+    Returns:
+        (image, extension for re-encoding, scale against the original image),
+        or None when the page has no image.
+    """
+    img_info = page.image
+    if not (img_info and img_info.content):
+        return None
+
+     # Decode base64 or raw bytes content
+    if(isinstance(img_info.content, bytes)):
+        img_bytes = img_info.content
+    else:
+        img_bytes = base64.b64decode(img_info.content)
+
+    # Choose extension based on mime type
+    mime_type = page.image.mime_type # Example: image/png
+    ext = ".png" #png by default
+    if("jpeg" in mime_type.lower() or "jpg" in mime_type.lower()):
+        ext = ".jpg"
+        print("Entered the if statement, the extension is: ", ext)
+
+    img, scale = decode_bytes(img_bytes, max(img_info.width or 0, img_info.height or 0), max_dimension)
+    return img, ext, scale
+
+def decode_bytes(img_bytes, long_side=0, max_dimension=None):
+    """
+    Decodes an encoded image to grayscale, no larger than the preview size.
+
+    Args:
+        img_bytes: PNG/JPEG/TIFF bytes.
+        long_side: Longest side of the encoded image when known (picks a reduced decode).
+        max_dimension: Longest side in pixels, preview_max_dimension() by default.
+
+    Returns:
+        (image, scale against the original image)
+    """
+    if max_dimension is None:
+        max_dimension = preview_max_dimension()
+
+    # Pick the largest reduced decode that still leaves the page at least
+    # max_dimension long, the width/height come from the Document AI metadata
+    flags = cv2.IMREAD_GRAYSCALE
+    if max_dimension and long_side > max_dimension:
+        for factor, mode in REDUCED_MODES:
+            if long_side / factor >= max_dimension:
+                flags = mode
+                break
+
+    # Converts bytes to numpy array and then to grayscale image
+    nparr = np.frombuffer(img_bytes, np.uint8)
+    img = cv2.imdecode(nparr, flags)
+    if not long_side:
+        long_side = max(img.shape)
+
+    img = shrink_image(img, max_dimension)
+    return img, min(1.0, max(img.shape) / long_side)
+
+def shrink_image(img, max_dimension):
+    """
+    Resizes an image down so its longest side is max_dimension (0 to keep it).
+    """
+    # Finish with a resize down to the target before the filters run
+    if max_dimension and max(img.shape) > max_dimension:
+        ratio = max_dimension / max(img.shape)
+        img = cv2.resize(img, (max(1, round(img.shape[1] * ratio)), max(1, round(img.shape[0] * ratio))),
+                         interpolation=cv2.INTER_AREA)
+    return img
+
+def clean_image(img, angle, ext, scale=1.0):
+    """
+    Rotates, filters and encodes a decoded grayscale page image.
+
+    Args:
+        img: Grayscale image from decode_page.
+        angle: Skew angle from page_skew (None to not rotate).
+        ext: ".png" or ".jpg".
+        scale: Size of img against the original page image, from decode_page.
+    """
+    img = rotate_image(img, angle)
+
+    # Same neighbourhood on the page at any resolution (odd, at least 3)
+    block_size = max(3, int(THRESHOLD_BLOCK_SIZE * scale) | 1)
+
+    # Apply Preprocessing filters
+    img = cv2.medianBlur(img, 1)
+    img = cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                cv2.THRESH_BINARY, block_size, 10)
+    print("DONE PREPROCESSING")
+
+    # Encode cleaned image back into bytes and return it
+    return encode_page(img, ext)
+
+def encode_page(img, ext, encoding=None):
+    """
+    Encodes a binarized page for the PDF.
+
+    Args:
+        img: Thresholded grayscale image (0 or 255).
+        ext: Extension of the source page image, used by the "source" encoding.
+        encoding: PAGE_ENCODING by default.
+    """
+    encoding = encoding or PAGE_ENCODING
+    if encoding == "g4":
+        return encode_g4(img)
+    if encoding == "png":
+        ext = ".png"
+    elif encoding == "jpeg":
+        ext = ".jpg"
+
+    _, final_img = cv2.imencode(ext, img)
+    return final_img.tobytes()
+
+def encode_g4(img, dpi=None):
+    """
+    Packs a binarized page to 1 bit per pixel and compresses it as a
+    single-strip CCITT Group 4 TIFF (only single strips are embedded as is).
+
+    Args:
+        img: Thresholded grayscale image (0 or 255).
+        dpi: Resolution written to the TIFF (the PDF page size comes from
+            it), PREVIEW_DPI or DEFAULT_DPI by default.
+    """
+    from PIL import Image
+    import io
+
+    dpi = dpi or PREVIEW_DPI or DEFAULT_DPI
+
+    bilevel = Image.fromarray(img).convert("1", dither=Image.Dither.NONE)
+    out = io.BytesIO()
+    height = img.shape[0]
+    bilevel.save(
+        out,
+        format="TIFF",
+        compression="group4",
+        # One strip for the whole page
+        strip_size=((img.shape[1] + 7) // 8) * height + 1,
+        tiffinfo={278: height},
+        # Without resolution tags Pillow reads the TIFF back at 1 dpi
+        dpi=(dpi, dpi),
+    )
+    return out.getvalue()
+
+def pdf_name(filename, docType):
+    """
+    Object name of the stitched PDF in BUCKET_NAME for a shard JSON name
+    ("path/file-0.json" -> "<docType>/file.pdf").
     """
-    
-    storage_client = storage.Client()
-    
-    # Bucket where final PDFs will be stored
-    bucket = storage_client.bucket(BUCKET_NAME) 
     # Convert JSON filename to PDF filename
     output_blob = filename.replace(".json", ".pdf")
 
@@ -132,39 +387,68 @@ def upload_pdf_gcs(filename, docType, page_list):
     # Add doctype as the prefix for organization
     output_blob = f"{docType}/{output_blob}"
     print("Applied the docType: ", output_blob )
+    return output_blob
 
-    # Stitch all images into a single PDF
-    new_pdf = img2pdf.convert(page_list)
+def upload_pdf_gcs(filename, docType, page_list):
 
-    # Upload to GCS
-    image_blob = bucket.blob(output_blob)
-    image_blob.upload_from_string(new_pdf, content_type="application/pdf")
-    print(f"sucessfully uploaded image in: {bucket.name}/{output_blob}")
+    """
+    Stitches processed image pages into a PDF and uploads to GCS.
+
+    Args:
+        filename: Source filename (usually JSON blob name).
+        docType: Document type (used as prefix in GCS).
+        page_list: Image bytes to stitch into PDF, any iterable. Pages are
+            written as they are read, so a generator keeps memory flat.
+
+    Returns:
+        Number of pages in the PDF.
+    """
+    
+    output_blob = pdf_name(filename, docType)
 
     # Generate access token 
     token = str(uuid.uuid4())
 
-    # Add url metadata 
-    image_blob.metadata = {
-        "firebaseStorageDownloadTokens": token
-    }
-    image_blob.patch()
-    print("Done adding metadata")
+    # Stitch the images into a single PDF, written and uploaded page by page
+    # The url metadata goes with the upload itself, no second request
+    # At a preview DPI the pages keep their paper size instead of the 96 dpi default
+    upload = get_storage().open_writer(
+        BUCKET_NAME,
+        output_blob,
+        "application/pdf",
+        metadata={"firebaseStorageDownloadTokens": token},
+        chunk_size=PDF_UPLOAD_CHUNK_MB * 1024 * 1024,
+    )
+    writer = StreamingPdfWriter(upload, dpi=PREVIEW_DPI or None)
+    for page in page_list:
+        writer.add_page(page)
+    writer.close()
+
+    # Upload to GCS
+    upload.close()
+    print(f"sucessfully uploaded image in: {BUCKET_NAME}/{output_blob}")
+    return writer.pages
 
 if __name__ == '__main__':
 
-    # For local testing purposes
+    # For local testing purposes: cleans one scanned image from GCS and
+    # uploads it as a one-page PDF. No layout, so the page isn't deskewed.
+    # See benchmarks/bench_preprocess.py for timings on synthetic pages.
     # GCS setup
     
-    bucket = storage_client.bucket("practice_sample_training")
+    bucket = get_storage().bucket("practice_sample_training")
     blob = bucket.blob("arayyy moo _24.jpg")
     print("The initial bucket: ", bucket)
     print("The initial blob: ", blob)
     
-    result = preprocess(src_bucket=bucket.name, blob=blob.name, mime_type="image/jpg")
+    page = documentai.Document.Page(image=documentai.Document.Page.Image(
+        content=get_storage().read_blob(blob),
+        mime_type="image/jpeg",
+    ))
+    result = [clean_page(page)]
     # # Load Document JSON
     # document = documentai.Document.from_json(blob.download_as_bytes())
-    # result = clean_img(blob)
+    # result = [clean_img(blob)]
     
     upload_pdf_gcs(blob.name, "sample", result)
     print("process done")
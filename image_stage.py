@@ -0,0 +1,172 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+
+import image_extract
+
+# CPU-bound image cleaning (deskew, filters, encode) on a pool shared by every
+# shard thread of the process, sized to the cores instead of to the shards.
+# - "thread" (default): OpenCV releases the GIL in imdecode, warpAffine,
+#   medianBlur, adaptiveThreshold and imencode, so threads run in parallel
+#   without copying anything.
+# - "process": pages are decoded here, the decoded pixels go to the workers
+#   through shared memory (no pickling of the image), and only the skew angle,
+#   the shape and the small encoded result cross the process boundary.
+# Results come back in submission order for upload_pdf_gcs.
+# Pages come either from pages.image in the Document AI output or, with the
+# "source" preview (page_source.py), rendered from the upload itself.
+
+# Workers for the image stage, the number of cores by default
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "0")) or os.cpu_count() or 1
+# "thread" or "process"
+IMAGE_POOL = os.environ.get("IMAGE_POOL", "thread")
+
+def _attach(name):
+    """Opens a shared memory block created by the parent without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers every attach with the resource tracker. Pool
+        # workers share the parent's tracker, where the block is already
+        # registered, so this is a no-op; unregistering here would drop the
+        # parent's registration and fail its unlink() in the tracker.
+        return shared_memory.SharedMemory(name=name)
+
+def _clean_shared(name, shape, angle, ext, scale):
+    """
+    Worker side of the process pool: cleans the decoded page held in shared memory.
+    """
+    shm = _attach(name)
+    # A view on the shared pages, nothing is copied in
+    img = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    try:
+        return image_extract.clean_image(img, angle, ext, scale)
+    finally:
+        # The view must go before the block can be closed
+        del img
+        shm.close()
+
+class ImageStage:
+    """
+    Cleans page images on a pool of `workers`.
+
+    Args:
+        workers: Pool size, IMAGE_WORKERS by default.
+        mode: "thread" or "process", IMAGE_POOL by default.
+    """
+    def __init__(self, workers=None, mode=None):
+        self.workers = max(1, workers or IMAGE_WORKERS)
+        self.mode = mode or IMAGE_POOL
+        if self.mode == "process":
+            # spawn: the shard threads of the parent make fork unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+
+    def submit(self, page):
+        """
+        Queues one page, returns a Future for its encoded image (None without image).
+        """
+        if self.mode != "process":
+            return self._pool.submit(image_extract.clean_page, page)
+
+        decoded = image_extract.decode_page(page)
+        if decoded is None:
+            future = Future()
+            future.set_result(None)
+            return future
+        img, ext, scale = decoded
+        return self.submit_decoded(img, image_extract.page_skew(page), ext, scale)
+
+    def submit_decoded(self, img, angle, ext, scale=1.0):
+        """
+        Queues an already decoded page (decode_page, page_source), returns a
+        Future for its encoded image.
+        """
+        if self.mode != "process":
+            return self._pool.submit(image_extract.clean_image, img, angle, ext, scale)
+
+        # Copy the decoded pixels into shared memory once, the worker maps them
+        shm = shared_memory.SharedMemory(create=True, size=max(1, img.nbytes))
+        np.ndarray(img.shape, dtype=np.uint8, buffer=shm.buf)[...] = img
+        future = self._pool.submit(_clean_shared, shm.name, img.shape, angle, ext, scale)
+
+        def release(_):
+            shm.close()
+            shm.unlink()
+        future.add_done_callback(release)
+        return future
+
+    def submit_source(self, source, page, page_number=None):
+        """
+        Queues a page rendered from the upload (page_source.SourceDocument),
+        deskewed with the blocks of the Document AI page. Returns a Future
+        for its encoded image (None when the upload has no such page).
+        """
+        number = getattr(page, "page_number", 0) or page_number or 1
+        rendered = source.render(number)
+        if rendered is None:
+            future = Future()
+            future.set_result(None)
+            return future
+        img, ext, scale = rendered
+        angle = image_extract.page_skew(page) if page is not None else None
+        return self.submit_decoded(img, angle, ext, scale)
+
+    def clean_pages(self, pages):
+        """
+        Cleans pages in parallel.
+
+        Returns:
+            List of encoded images in page order, pages without image left out.
+        """
+        futures = [self.submit(page) for page in pages]
+        return [cleaned for cleaned in (f.result() for f in futures) if cleaned is not None]
+
+    def clean_document(self, document):
+        """
+        Same as image_extract.clean_document (first page with an image) on the pool.
+        """
+        for page in document.pages:
+            cleaned = self.submit(page).result()
+            if cleaned is not None:
+                return cleaned
+
+    def clean_source_pages(self, source, pages):
+        """
+        clean_pages for pages rendered from the upload.
+        """
+        futures = [self.submit_source(source, page, number) for number, page in enumerate(pages, 1)]
+        return [cleaned for cleaned in (f.result() for f in futures) if cleaned is not None]
+
+    def clean_source_document(self, source, document, page_number=None):
+        """
+        clean_document for a shard whose page is rendered from the upload.
+        page_number is used when the shard carries no page number.
+        """
+        for page in document.pages or [None]:
+            cleaned = self.submit_source(source, page, page_number).result()
+            if cleaned is not None:
+                return cleaned
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+_stage = None
+_stage_lock = threading.Lock()
+
+def get_stage():
+    """
+    Returns the image stage shared by this process.
+    """
+    global _stage
+    with _stage_lock:
+        if _stage is None:
+            _stage = ImageStage()
+        return _stage
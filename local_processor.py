@@ -0,0 +1,199 @@
+from google.api_core.exceptions import NotFound, ResourceExhausted
+from google.cloud import documentai
+from google.longrunning import operations_pb2
+import concurrent.futures
+import itertools
+import threading
+import time
+
+# Local stand-in for documentai.DocumentProcessorServiceClient.
+# It doesn't run OCR, it only models what matters for throughput: every
+# operation pays a fixed long-running-operation overhead, every document adds
+# a processing cost, and only max_concurrent_operations may run at once
+# (the Document AI concurrent batch operation quota). An optional page budget
+# per period models the pages-per-minute quota, both raise ResourceExhausted.
+# Operations can be waited on (operation.result) or polled with
+# get_operation, like the real long-running operations API.
+
+class LocalOperationHandle:
+    """Mimics the `operation.operation` attribute of a google.api_core Operation."""
+    def __init__(self, name):
+        self.name = name
+
+class LocalOperation:
+    """
+    Mimics the google.api_core Operation returned by batch_process_documents.
+
+    Inputs are processed one after another, so each input document finishes
+    at its own time. metadata reflects the inputs finished so far, like the
+    refreshed metadata of a running Document AI operation.
+    """
+    def __init__(self, name, statuses, done_at):
+        self.operation = LocalOperationHandle(name)
+        # (finish time, IndividualProcessStatus) per input
+        self._statuses = statuses
+        self.done_at = done_at
+        self.cancelled = False
+
+    @property
+    def metadata(self):
+        # A cancelled operation stops where it was, its later inputs never finish
+        now = min(time.monotonic(), self.done_at)
+        finished = self.done()
+        if self.cancelled:
+            state = documentai.BatchProcessMetadata.State.CANCELLED
+        elif finished:
+            state = documentai.BatchProcessMetadata.State.SUCCEEDED
+        else:
+            state = documentai.BatchProcessMetadata.State.RUNNING
+        return documentai.BatchProcessMetadata(
+            state=state,
+            individual_process_statuses=[
+                status if finished_at <= now
+                else documentai.BatchProcessMetadata.IndividualProcessStatus(
+                    input_gcs_source=status.input_gcs_source
+                )
+                for finished_at, status in self._statuses
+            ],
+        )
+
+    def done(self):
+        return time.monotonic() >= self.done_at
+
+    def result(self, timeout=None):
+        remaining = self.done_at - time.monotonic()
+        if timeout is not None and remaining > timeout:
+            # Same error as google.api_core when the operation outlives timeout
+            time.sleep(timeout)
+            raise concurrent.futures.TimeoutError(f"Operation {self.operation.name} timed out")
+        if remaining > 0:
+            time.sleep(remaining)
+        return None
+
+    def cancel(self):
+        # Stops the operation now, it no longer counts as in flight
+        self.cancelled = True
+        self.done_at = min(self.done_at, time.monotonic())
+        return True
+
+class LocalDocumentProcessorClient:
+    """
+    Fake processor client with a simple latency model.
+
+    Args:
+        operation_overhead: seconds every operation costs regardless of size.
+        per_document: seconds added per input document.
+        max_concurrent_operations: quota, extra submissions raise ResourceExhausted.
+        output_uri: gs:// prefix written into output_gcs_destination.
+        online_overhead: seconds per online process_document call.
+        per_page: seconds per page, for both batch and online processing.
+        page_counts: pages per input gcs_uri, 1 when missing.
+        pages_per_period: batch pages accepted per period, 0 for no page quota.
+        period: seconds of the page quota window (60 for pages per minute).
+    """
+
+    def __init__(self, operation_overhead=1.0, per_document=0.05,
+                 max_concurrent_operations=5, output_uri="gs://local_output/processed_path",
+                 online_overhead=0.5, per_page=0.0, page_counts=None,
+                 pages_per_period=0, period=60.0):
+        self.operation_overhead = operation_overhead
+        self.per_document = per_document
+        self.max_concurrent_operations = max_concurrent_operations
+        self.output_uri = output_uri.rstrip("/")
+        self.online_overhead = online_overhead
+        self.per_page = per_page
+        self.page_counts = page_counts or {}
+        self.pages_per_period = pages_per_period
+        self.period = period
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # operation name -> LocalOperation
+        self._operations = {}
+        # (submit time, pages) of accepted operations, for the page quota
+        self._accepted = []
+
+        # Counters for the benchmarks
+        self.operations = 0
+        self.documents = 0
+        self.pages = 0
+        self.rejected = 0
+
+    @property
+    def in_flight(self):
+        now = time.monotonic()
+        return sum(1 for op in self._operations.values() if op.done_at > now)
+
+    def processor_path(self, project_id, location, processor_id):
+        return f"projects/{project_id}/locations/{location}/processors/{processor_id}"
+
+    def processor_version_path(self, project_id, location, processor_id, processor_version_id):
+        return (f"{self.processor_path(project_id, location, processor_id)}"
+                f"/processorVersions/{processor_version_id}")
+
+    def batch_process_documents(self, request):
+        documents = list(request.input_documents.gcs_documents.documents)
+        pages = sum(self.page_counts.get(doc.gcs_uri, 1) for doc in documents)
+
+        with self._lock:
+            if self.in_flight >= self.max_concurrent_operations:
+                self.rejected += 1
+                raise ResourceExhausted("Too many concurrent batch operations")
+            if self.pages_per_period:
+                now = time.monotonic()
+                self._accepted = [(t, p) for t, p in self._accepted if t > now - self.period]
+                if sum(p for _, p in self._accepted) + pages > self.pages_per_period:
+                    self.rejected += 1
+                    raise ResourceExhausted("Pages per minute quota exceeded")
+                self._accepted.append((now, pages))
+            self.operations += 1
+            self.documents += len(documents)
+            self.pages += pages
+            op_id = next(self._ids)
+
+            # Every input gets its own output folder, same layout as Document AI,
+            # and finishes after the inputs before it
+            start = time.monotonic() + self.operation_overhead
+            statuses = []
+            for index, doc in enumerate(documents):
+                pages = self.page_counts.get(doc.gcs_uri, 1)
+                start += self.per_document + self.per_page * pages
+                statuses.append((start, documentai.BatchProcessMetadata.IndividualProcessStatus(
+                    input_gcs_source=doc.gcs_uri,
+                    output_gcs_destination=f"{self.output_uri}/{op_id}/{index}/",
+                    status={"code": 0},
+                )))
+
+            name = f"projects/local/locations/us/operations/{op_id}"
+            operation = LocalOperation(name, statuses, start)
+            self._operations[name] = operation
+        return operation
+
+    def process_document(self, request):
+        """
+        Online request, blocks for the online overhead plus the page cost and
+        returns a ProcessResponse with an empty page per input page.
+        """
+        uri = request.gcs_document.gcs_uri if request.gcs_document else None
+        pages = self.page_counts.get(uri, 1)
+        time.sleep(self.online_overhead + self.per_page * pages)
+        with self._lock:
+            self.documents += 1
+        document = documentai.Document(
+            pages=[documentai.Document.Page(page_number=i + 1) for i in range(pages)]
+        )
+        return documentai.ProcessResponse(document=document)
+
+    def get_operation(self, request):
+        """
+        Returns a google.longrunning Operation, done once the latency has passed.
+        """
+        name = request["name"] if isinstance(request, dict) else request.name
+        local = self._operations.get(name)
+        if local is None:
+            raise NotFound(f"Operation {name} not found")
+
+        operation = operations_pb2.Operation(name=name, done=local.done())
+        if operation.done:
+            operation.metadata.Pack(documentai.BatchProcessMetadata.pb(local.metadata))
+        return operation
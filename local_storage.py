@@ -0,0 +1,237 @@
+import mimetypes
+import os
+import threading
+import time
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+# Local stand-in for google.cloud.storage.Client, backed by a directory.
+# It covers the calls the pipeline makes (list_blobs, bucket, blob,
+# download_as_bytes, upload_from_string, open("wb"), patch, delete) and can add a fixed
+# latency per request to model GCS round trips in benchmarks.
+#
+# Layout: <root>/<bucket>/<object name>, metadata lives in memory. Files that
+# are already in a bucket directory when it is first used are picked up, so a
+# local run (STORAGE_ROOT, see storage.py) can start from documents copied in.
+
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.metadata = None
+        self.content_type = None
+        self.generation = None
+        self.size = None
+
+    @property
+    def _path(self):
+        return os.path.join(self.bucket._path, self.name)
+
+    def _load_info(self):
+        info = self.bucket._info.get(self.name)
+        if info:
+            self.content_type = info["content_type"]
+            self.generation = info["generation"]
+            self.metadata = dict(info["metadata"]) if info["metadata"] else None
+            self.size = info["size"]
+        return info
+
+    def exists(self):
+        self.bucket.client._request()
+        return os.path.exists(self._path)
+
+    def reload(self):
+        self.bucket.client._request()
+        if not self._load_info():
+            raise NotFound(f"{self.bucket.name}/{self.name}")
+
+    def download_as_bytes(self, if_generation_match=None, **kwargs):
+        self.bucket.client._request()
+        info = self.bucket._info.get(self.name)
+        if info is None:
+            raise NotFound(f"{self.bucket.name}/{self.name}")
+        if if_generation_match is not None and info["generation"] != if_generation_match:
+            raise PreconditionFailed(f"{self.bucket.name}/{self.name}")
+        with open(self._path, "rb") as f:
+            data = f.read()
+        self.bucket.client.bytes_down += len(data)
+        return data
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None, **kwargs):
+        self.bucket.client._request()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self.bucket._lock:
+            info = self.bucket._info.get(self.name)
+            current = info["generation"] if info else 0
+            if if_generation_match is not None and current != if_generation_match:
+                raise PreconditionFailed(f"{self.bucket.name}/{self.name}")
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(self._path, "wb") as f:
+                f.write(data)
+            self.generation = current + 1
+            self.content_type = content_type or "application/octet-stream"
+            self.size = len(data)
+            self.bucket._info[self.name] = {
+                "content_type": self.content_type,
+                "generation": self.generation,
+                "metadata": dict(self.metadata) if self.metadata else None,
+                "size": self.size,
+            }
+        self.bucket.client.bytes_up += len(data)
+
+    def open(self, mode="wb", content_type=None, chunk_size=None, **kwargs):
+        """
+        Write-only streaming upload, like the resumable BlobWriter: one
+        request per chunk, the object appears on close.
+        """
+        if mode != "wb":
+            raise ValueError("LocalBlob.open only supports 'wb'")
+        return LocalBlobWriter(self, content_type, chunk_size or 100 * 1024 * 1024)
+
+    def patch(self):
+        self.bucket.client._request()
+        with self.bucket._lock:
+            info = self.bucket._info.get(self.name)
+            if info is None:
+                raise NotFound(f"{self.bucket.name}/{self.name}")
+            info["metadata"] = dict(self.metadata) if self.metadata else None
+
+    def delete(self, if_generation_match=None, **kwargs):
+        self.bucket.client._request()
+        with self.bucket._lock:
+            info = self.bucket._info.get(self.name)
+            if info is None:
+                raise NotFound(f"{self.bucket.name}/{self.name}")
+            if if_generation_match is not None and info["generation"] != if_generation_match:
+                raise PreconditionFailed(f"{self.bucket.name}/{self.name}")
+            del self.bucket._info[self.name]
+            os.remove(self._path)
+
+class LocalBlobWriter:
+    """Streams to a temporary file next to the object, renamed into place on close."""
+
+    def __init__(self, blob, content_type, chunk_size):
+        self.blob = blob
+        self.content_type = content_type
+        self.chunk_size = chunk_size
+        self.size = 0
+        self._pending = 0
+        # Start of the resumable session
+        blob.bucket.client._request()
+        os.makedirs(os.path.dirname(blob._path), exist_ok=True)
+        self._tmp_path = f"{blob._path}.upload-{id(self)}"
+        self._file = open(self._tmp_path, "wb")
+
+    def write(self, data):
+        self._file.write(data)
+        self.size += len(data)
+        self._pending += len(data)
+        # One request per full chunk
+        while self._pending >= self.chunk_size:
+            self._pending -= self.chunk_size
+            self.blob.bucket.client._request()
+        return len(data)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        self.blob.bucket.client._request()
+        blob = self.blob
+        with blob.bucket._lock:
+            info = blob.bucket._info.get(blob.name)
+            os.replace(self._tmp_path, blob._path)
+            blob.generation = (info["generation"] if info else 0) + 1
+            blob.content_type = self.content_type or "application/octet-stream"
+            blob.size = self.size
+            blob.bucket._info[blob.name] = {
+                "content_type": blob.content_type,
+                "generation": blob.generation,
+                "metadata": dict(blob.metadata) if blob.metadata else None,
+                "size": blob.size,
+            }
+        blob.bucket.client.bytes_up += self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class LocalBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._path = os.path.join(client.root, name)
+        # object name -> content_type, generation, metadata, size
+        self._info = client._objects.setdefault(name, {})
+        self._lock = client._lock
+
+    def blob(self, name):
+        blob = LocalBlob(self, name)
+        blob._load_info()
+        return blob
+
+    def get_blob(self, name):
+        self.client._request()
+        blob = LocalBlob(self, name)
+        return blob if blob._load_info() else None
+
+    def list_blobs(self, prefix=""):
+        return self.client.list_blobs(self.name, prefix=prefix)
+
+class LocalStorageClient:
+    """
+    Args:
+        root: Directory that holds one sub-directory per bucket.
+        latency: Seconds added to every request, to model GCS round trips.
+    """
+    def __init__(self, root, latency=0.0):
+        self.root = root
+        self.latency = latency
+        self._objects = {}
+        self._lock = threading.RLock()
+
+        # Counters for the benchmarks
+        self.requests = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def bucket(self, name):
+        with self._lock:
+            if name not in self._objects:
+                self._objects[name] = self._scan(name)
+        return LocalBucket(self, name)
+
+    def _scan(self, bucket_name):
+        """Info for the files already in a bucket directory."""
+        info = {}
+        bucket_path = os.path.join(self.root, bucket_name)
+        for directory, _, files in os.walk(bucket_path):
+            for file_name in files:
+                if ".upload-" in file_name:
+                    # Left over from an interrupted streaming upload
+                    continue
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(path, bucket_path).replace(os.sep, "/")
+                info[name] = {
+                    "content_type": mimetypes.guess_type(name)[0] or "application/octet-stream",
+                    "generation": 1,
+                    "metadata": None,
+                    "size": os.path.getsize(path),
+                }
+        return info
+
+    def list_blobs(self, bucket_name, prefix=""):
+        self._request()
+        bucket = self.bucket(bucket_name)
+        with self._lock:
+            names = sorted(name for name in bucket._info if name.startswith(prefix or ""))
+        return [bucket.blob(name) for name in names]
@@ -1,9 +1,98 @@
 import functions_framework
 from cloudevents.http import CloudEvent
 from detect_mime_type import detect_mime_type
-import extractor_caller
-import service_extractor 
+from coalescer import EventCoalescer
+from idempotency import IdempotencyGuard, InMemoryLeaseStore, GcsLeaseStore, event_key
 import json
+import os
+
+# Event coalescing (opt-in)
+# When COALESCE_WINDOW_SECONDS is above 0, uploads arriving on the same instance
+# within the window are sent to Document AI as one batch operation instead of
+# one operation each. Only useful when the function is deployed with --concurrency > 1.
+COALESCE_WINDOW_SECONDS = float(os.environ.get("COALESCE_WINDOW_SECONDS", "0"))
+COALESCE_MAX_BATCH = int(os.environ.get("COALESCE_MAX_BATCH", "50"))
+
+# Non-blocking operations (opt-in)
+# With ASYNC_OPERATIONS=1 the trigger only submits the Document AI operation and
+# saves its context to the pending store (PENDING_OPERATIONS_BUCKET). The shards are
+# processed by completeTrigger (output bucket events) or pollTrigger (scheduler).
+ASYNC_OPERATIONS = os.environ.get("ASYNC_OPERATIONS", "") == "1"
+
+def flush_batch(key, items):
+    """
+    Sends one coalesced group to the extractor for its doc type and converts
+    failed inputs into exceptions for their callers.
+    """
+    doc_type, bucket = key
+    if doc_type == "service_invoice":
+        import service_extractor
+        results = service_extractor.main_batch(bucket, items, doc_type, wait=not ASYNC_OPERATIONS)
+    else:
+        import extractor_caller
+        results = extractor_caller.main_batch(items, doc_type, wait=not ASYNC_OPERATIONS)
+
+    return [
+        result if result and result.get("status") in ("ok", "partial", "submitted")
+        else ValueError(f"Processing failed for {item['input']}: {(result or {}).get('message')}")
+        for item, result in zip(items, results)
+    ]
+
+coalescer = EventCoalescer(
+    flush_batch,
+    max_batch_size=COALESCE_MAX_BATCH,
+    max_wait_seconds=COALESCE_WINDOW_SECONDS,
+)
+
+# Idempotency
+# The in-memory store only catches duplicates that land on the same instance.
+# Set IDEMPOTENCY_BUCKET to share leases across instances through GCS.
+IDEMPOTENCY_BUCKET = os.environ.get("IDEMPOTENCY_BUCKET")
+# Seconds before an unfinished lease can be taken over by a retry
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", "900"))
+
+# ASYNC_OPERATIONS needs it: completeTrigger runs once per shard on whichever
+# instance gets the event, only a shared lease keeps two of them from
+# finishing the same operation (duplicate finalized JSONs and Firestore docs)
+if ASYNC_OPERATIONS and not IDEMPOTENCY_BUCKET:
+    raise RuntimeError("ASYNC_OPERATIONS=1 requires IDEMPOTENCY_BUCKET for shared completion leases")
+
+if IDEMPOTENCY_BUCKET:
+    lease_store = GcsLeaseStore(IDEMPOTENCY_BUCKET)
+else:
+    lease_store = InMemoryLeaseStore()
+guard = IdempotencyGuard(lease_store, ttl=IDEMPOTENCY_TTL)
+
+# Known pages (opt-in)
+# With PAGE_INDEX_BUCKET set, every upload's pages are hashed and looked up in
+# the page index of its doc type before Document AI is called. An upload whose
+# pages were all processed before gets those results again (page_index.py).
+PAGE_INDEX_BUCKET = os.environ.get("PAGE_INDEX_BUCKET")
+
+# Cold start
+# The extractors (and through them OpenCV, numpy, img2pdf and the Document AI
+# client) are imported inside the handlers, so an instance can reject an
+# unsupported file without loading them. Set WARMUP_ON_START=1 to import them
+# and open the Google API connections while the instance starts instead of
+# on the first event.
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "") == "1"
+
+def warmup():
+    """
+    Imports the extraction path and pre-builds the Document AI and Storage
+    clients so the first event doesn't pay for them.
+    """
+    import clients
+    import extractor_caller
+    import service_extractor
+    import image_extract
+    import image_stage
+
+    clients.warmup({extractor_caller.LOCATION, service_extractor.LOCATION})
+    print("Warm-up complete")
+
+if WARMUP_ON_START:
+    warmup()
 
 # Cloud Function entrypoint that gets triggered by a CloudEvent
 @functions_framework.cloud_event
@@ -51,25 +140,65 @@ def trigger(event: CloudEvent):
     if mime_type == None:
         raise ValueError("Invalid file type")
     
+    # Object size, used to pick online processing for small uploads
+    size = data.get("size")
+
+    # Claim the event before any work so duplicate deliveries don't rerun it
+    guard.run(
+        event_key(event, data),
+        lambda: process_upload(bucket, name, mime_type, userId, doc_type, size),
+    )
+
+def process_upload(bucket, name, mime_type, userId, doc_type, size=None):
+    """
+    Runs one upload through the extractor for its doc type.
+    """
+    import docai_batch
+
+    # Uploads made of known pages are answered from the page index
+    check = check_known_pages(bucket, name, mime_type, userId, doc_type)
+    if check is not None and check.replayed:
+        print("Process Complete (known pages)")
+        return
+    # Bytes the page index check downloaded, the online path reuses them
+    content = check.content if check is not None else None
+
+    # Small uploads go through the online fast path, no point batching them
+    if COALESCE_WINDOW_SECONDS > 0 and not docai_batch.should_process_online(mime_type, size):
+        # Wait for this upload's result so a failure still fails this event
+        item = {"input": name, "mime_type": mime_type, "userId": userId}
+        result = coalescer.submit((doc_type, bucket), item).result()
+        record_pages(check, result)
+        print("Process Complete")
+        return
+
     try:
         # Call function according to its doc_type
 
         # use extractor_caller.main if its 2307
         if doc_type == "form2307":
-            extractor_caller.main(
+            import extractor_caller
+            results = extractor_caller.main(
             mime_type=mime_type,
             input=name,
             userId=userId,
             doc_type=doc_type,
+            wait=not ASYNC_OPERATIONS,
+            size=size,
+            content=content,
             )
         # Use service_extractor.main if its service invoice
         elif doc_type == "service_invoice":
-            service_extractor.main(
+            import service_extractor
+            results = service_extractor.main(
                 mime_type=mime_type,
                 bucket=bucket,
                 input=name,
                 userId=userId,
                 doc_type=doc_type,
+                wait=not ASYNC_OPERATIONS,
+                size=size,
+                content=content,
             )
 
         # TODO: AFTER CREATING THE EXTRACTOR FOR EXPENSE RECEIPT CREATE THE ELIF
@@ -77,16 +206,99 @@ def trigger(event: CloudEvent):
         # Lastly the exepense receipt 
         else:
             # Default to form 2307 extractor
-            extractor_caller.main(
+            import extractor_caller
+            results = extractor_caller.main(
             mime_type=mime_type,
             input=name,
             userId=userId,
             doc_type=doc_type,
+            wait=not ASYNC_OPERATIONS,
+            size=size,
+            content=content,
             )
             
     # if any of them failed, raise an error
     # These will be seen in the Cloud Function logs, same with the print statements
+    # Quota errors (ResourceExhausted) are not ValueErrors, they reach the
+    # runtime as they are so a retry policy can tell them apart
     except ValueError as e:
-        raise ValueError(f"You have some error: {ValueError}") 
+        raise ValueError(f"You have some error: {e}") from e
 
+    # One upload, one result (a submitted one is indexed by record_operation_pages)
+    record_pages(check, next(iter((results or {}).values()), None))
     print("Process Complete")
+
+def check_known_pages(bucket, name, mime_type, userId, doc_type):
+    """
+    Looks the upload's pages up in the page index (PAGE_INDEX_BUCKET).
+    Returns a page_index.UploadCheck, or None when the index is off or
+    the check failed (the upload is then processed as usual).
+    """
+    if not PAGE_INDEX_BUCKET:
+        return None
+    import page_index
+    try:
+        return page_index.check_upload(page_index.get_store(PAGE_INDEX_BUCKET), bucket, name, mime_type, userId, doc_type)
+    except Exception as e:
+        print(f"Page index check failed, processing normally: {e}")
+        return None
+
+def record_pages(check, result):
+    """Adds a processed upload's pages to the page index, never fails the upload."""
+    if check is None:
+        return
+    try:
+        check.record(result)
+    except Exception as e:
+        print(f"Could not add pages to the page index: {e}")
+
+def record_operation_pages(context, results):
+    """
+    Adds the pages of a finished ASYNC_OPERATIONS operation to the page
+    index, like record_pages does for the uploads that were waited on.
+    """
+    if not PAGE_INDEX_BUCKET:
+        return
+    import page_index
+    inputs = {doc["gcs_uri"]: doc for doc in context.get("inputs", [])}
+    for source, result in (results or {}).items():
+        try:
+            bucket, name = source[len("gs://"):].split("/", 1)
+            userId = inputs.get(source, {}).get("userId", context.get("userId"))
+            page_index.record_upload(page_index.get_store(PAGE_INDEX_BUCKET), bucket, name,
+                                     detect_mime_type(name), userId, context["doc_type"], result)
+        except Exception as e:
+            print(f"Could not add pages of {source} to the page index: {e}")
+
+# Completion step for ASYNC_OPERATIONS, triggered by shards landing in the output bucket
+@functions_framework.cloud_event
+def completeTrigger(event: CloudEvent):
+    import pending_operations
+
+    data = event.data
+    name = data.get("name") or ""
+
+    # Only Document AI shards can finish an operation
+    if not name.endswith(".json") or name.endswith("_finalized.json"):
+        return
+
+    # The shard's operation record is read by its id, no listing
+    store = pending_operations.get_store()
+    operation_name = pending_operations.find_by_output(name, store)
+    if operation_name is None:
+        return
+
+    # No-op while the operation is still running, a later shard or the poll finishes it.
+    # The guard's GCS lease lets only one instance finish it.
+    pending_operations.complete_operation(operation_name, store, guard=guard,
+                                          on_results=record_operation_pages)
+
+# Completion step for ASYNC_OPERATIONS, called on a schedule (Cloud Scheduler)
+@functions_framework.http
+def pollTrigger(request):
+    import pending_operations
+
+    summary = pending_operations.poll_pending(pending_operations.get_store(), guard=guard,
+                                              on_results=record_operation_pages)
+    print("Poll summary: ", summary)
+    return json.dumps(summary)
@@ -0,0 +1,265 @@
+from functools import lru_cache
+
+import dates
+
+# Normalizers shared by the form handlers.
+# OCR misreads are fixed and the characters that aren't kept are deleted by
+# one bytes.translate over the UTF-8 encoded text, with tables built at
+# import. bytes.translate is a plain table lookup whatever the text holds,
+# unlike str.translate which is only fast for pure ASCII strings. Non-ASCII
+# bytes are always deleted, which is what the currency class [^0-9.] did; for
+# digits the old str.isdigit filter kept other scripts' digits, so the rare
+# non-ASCII text still goes through the str path.
+#
+# Every normalizer also has a batched form taking and returning a list. The
+# batch is joined into one string, translated once and split again, which
+# saves the per-call overhead when a backfill normalizes whole columns.
+
+# Common OCR misreads in numeric fields
+OCR_MISREADS = {"O": "0", "o": "0", "I": "1", "l": "1", "S": "5", "p": "0"}
+OCR_TABLE = str.maketrans(OCR_MISREADS)
+
+# Joins the values of a batch, deleted by neither table
+_SEPARATOR = "\x1f"
+
+_OCR_BYTES = bytes.maketrans(
+    "".join(OCR_MISREADS).encode(), "".join(OCR_MISREADS.values()).encode()
+)
+
+def _delete_bytes(keep):
+    """Every byte but keep and the OCR misreads (bytes.translate deletes before mapping)."""
+    keep = set(keep.encode()) | set("".join(OCR_MISREADS).encode())
+    return bytes(b for b in range(256) if b not in keep)
+
+_NON_DIGIT_BYTES = _delete_bytes("0123456789")
+_NON_CURRENCY_BYTES = _delete_bytes("0123456789.")
+_NON_DIGIT_BATCH_BYTES = _delete_bytes("0123456789" + _SEPARATOR)
+_NON_CURRENCY_BATCH_BYTES = _delete_bytes("0123456789." + _SEPARATOR)
+
+def ocr_digits(text):
+    """
+    Digits of a string after fixing OCR misreads (O→0, I→1, S→5, etc.).
+
+    Args:
+        text (str): Raw OCR text.
+
+    Returns:
+        str: The digits, possibly empty.
+    """
+    if text.isascii():
+        return text.encode().translate(_OCR_BYTES, _NON_DIGIT_BYTES).decode()
+    # Same filter as before for the rare non-ASCII text: str.isdigit keeps
+    # other scripts' digits and superscripts, which regex \d doesn't match
+    return "".join(filter(str.isdigit, text.translate(OCR_TABLE)))
+
+def ocr_digits_many(values):
+    """
+    ocr_digits of every value.
+
+    Args:
+        values (list[str]): Raw OCR texts.
+
+    Returns:
+        list[str]: The digits of each value, in order.
+    """
+    return _translate_many(values, _NON_DIGIT_BATCH_BYTES, ocr_digits, non_ascii_digits=True)
+
+def norm_tin(num):
+    """
+    Normalize TIN (Tax Identification Number).
+    - Replace OCR misreads.
+    - Keep only digits.
+    - Return as integer.
+
+    Args:
+        num (str): The TIN string to normalize.
+
+    Returns:
+        int: The normalized TIN.
+
+    Raises:
+        ValueError: When the string has no digits.
+    """
+    return int(ocr_digits(num))
+
+def norm_tins(values):
+    """
+    norm_tin of every value, None for values without digits.
+    """
+    return [int(digits) if digits else None for digits in ocr_digits_many(values)]
+
+def norm_zip_code(zip_code):
+    """
+    Normalize ZIP code strings to a standard 4-digit format.
+    - Replace common OCR misreads (O→0, I→1, S→5, etc.)
+    - Keep only digits
+    - If not 4 digits, append [INVALID]
+
+    Args:
+        zip_code (str): The ZIP code string to normalize.
+
+    Returns:
+        str: The normalized ZIP code string in 'XXXX' format.
+    """
+    return _zip_code(ocr_digits(zip_code))
+
+def norm_zip_codes(values):
+    """
+    norm_zip_code of every value.
+    """
+    return [_zip_code(digits) for digits in ocr_digits_many(values)]
+
+def _zip_code(digits):
+    return digits if len(digits) == 4 else digits + " [INVALID]"
+
+def norm_invoice_no(invoice_no):
+    """
+    Normalize invoice numbers.
+    - Replace OCR misreads.
+    - Keep only digits.
+    - Return cleaned invoice number as string.
+
+    Args:
+        invoice_no (str): The invoice number to normalize
+
+    Returns:
+        str: Normalized value of invoice number.
+    """
+    return ocr_digits(invoice_no)
+
+def norm_invoice_nos(values):
+    """
+    norm_invoice_no of every value.
+    """
+    return ocr_digits_many(values)
+
+def norm_currency(currency):
+    """
+    Normalize currency received
+    - Replace OCR misreads (O→0, I→1, etc.)
+    - Strip out non-numeric/non-decimal characters
+    - Returns cleaned numeric string
+
+    Args:
+        currency (str): The amount to be normalized
+
+    Returns:
+        str: The normalized amount.
+    """
+    return currency.encode().translate(_OCR_BYTES, _NON_CURRENCY_BYTES).decode()
+
+def norm_currencies(values):
+    """
+    norm_currency of every value.
+    """
+    return _translate_many(values, _NON_CURRENCY_BATCH_BYTES, norm_currency)
+
+@lru_cache(maxsize=dates.DATE_CACHE_SIZE)
+def norm_date(date_str):
+    """
+    Normalize date strings to 'MM-DD-YYYY' format (BIR Form 2307).
+    - Replaces common OCR misreads.
+    - Extracts year (last 4 digits) and infers month/day from remaining part.
+    - Attempts multiple parsing strategies if first fails.
+    - Returns [INVALID] if cannot parse.
+
+    Args:
+        date_str (str): The date string to normalize.
+
+    Returns:
+        str: The normalized date string in 'MM-DD-YYYY' format.
+    """
+    date_str = date_str.translate(OCR_TABLE)
+    return _date(date_str, ocr_digits(date_str))
+
+def norm_dates(values):
+    """
+    norm_date of every value, None for values that raise.
+    """
+    results = []
+    for date_str in values:
+        try:
+            results.append(norm_date(date_str))
+        except ValueError:
+            results.append(None)
+    return results
+
+def _date(date_str, date):
+    # Handles 3-1-2025, 03-1-2025, 03-01-2025, 312025
+    if len(date) < 6 or len(date) > 8:
+        return f"{date} [INVALID]"
+
+    year = date[-4:]
+    mmdd = date[:-4]
+
+    # Infer month/day from remaining digits
+    if len(mmdd) == 4:
+        month = mmdd[:2]
+        day = mmdd[2:]
+    else:
+        month = mmdd[:1]
+        day = mmdd[1:]
+
+    # Validate Date, trying the alternate split if the first isn't a real date
+    parsed = dates.from_parts(int(year), int(month), int(day))
+    if parsed is None:
+        parsed = dates.from_parts(int(year), int(mmdd[:2]), int(mmdd[2:] or 0))
+    if parsed is None:
+        return f"{date_str} [INVALID]"
+    return parsed.text
+
+def norm_date_fuzzy(date_str):
+    """
+    Normalize date strings to 'MM-DD-YYYY' format (Service Invoice).
+    Parsed by the dates engine, which falls back to fuzzy dateutil parsing
+    for messy inputs.
+
+    Args:
+        date_str (str): The date string to normalize.
+
+    Returns:
+        str: The normalized date string in 'MM-DD-YYYY' format.
+
+    Raises:
+        ValueError: When no date can be read from the string.
+    """
+    parsed = dates.parse_date(date_str, fuzzy=True)
+    if parsed is None:
+        raise ValueError(f"Unknown date format: {date_str}")
+    return parsed.text
+
+def norm_dates_fuzzy(values):
+    """
+    norm_date_fuzzy of every value, None for values that raise.
+    """
+    results = []
+    for date_str in values:
+        try:
+            results.append(norm_date_fuzzy(date_str))
+        except ValueError:
+            results.append(None)
+    return results
+
+def _translate_many(values, delete, scalar, non_ascii_digits=False):
+    """
+    Normalizes a batch in one pass over the joined values.
+
+    Args:
+        values: The raw texts.
+        delete: Bytes deleted from the joined batch (all but the separator
+            and the kept characters).
+        scalar: Normalizer of one value, for the values the batch pass
+            can't handle.
+        non_ascii_digits: Non-ASCII digits are kept, so values with
+            non-ASCII text are redone with scalar.
+    """
+    if not values:
+        return []
+    joined = _SEPARATOR.join(values)
+    parts = joined.encode().translate(_OCR_BYTES, delete).decode().split(_SEPARATOR)
+    if len(parts) != len(values):
+        # A value held the separator itself
+        return [scalar(value) for value in values]
+    if non_ascii_digits and not joined.isascii():
+        return [part if value.isascii() else scalar(value) for value, part in zip(values, parts)]
+    return parts
@@ -0,0 +1,356 @@
+from google.api_core.exceptions import PreconditionFailed
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import storage
+
+# Known pages, found before the Document AI call.
+# Users often upload the same certificate twice (the same file resent, or a
+# PDF resent with pages that were already processed). Every page of an upload
+# gets a digest of its content, looked up in a dict of the pages the same
+# user had processed before.
+#
+# Only identical content counts. Certificates filled on the same form
+# template look alike (a perceptual hash puts them a few bits apart), and
+# before Document AI there is no OCR text to tell them apart, so a similar
+# page is never taken for a known one; rescans and photos are processed.
+# A PDF page's digest covers what it draws: its content stream, its text,
+# the images and form XObjects it uses and its size and rotation, so the
+# same page copied into another PDF keeps its digest. An image upload is
+# one page, digested as its bytes. Nothing is rendered.
+#
+# When every page of an upload is a known page, its results are replayed: the
+# earlier finalized JSONs are copied under the new upload's name (which
+# triggers send-front-end as usual) and the PDF is put together from the
+# earlier PDFs' pages. Anything else goes through Document AI and, once it
+# succeeds, its pages are added to the index.
+#
+# There is one index per user and doc type, results are never replayed to
+# another user. It is stored as append-only segments, one small JSON object
+# per indexed document under "<prefix>/<doc_type>/<user key>/" in the index
+# bucket: adding a document is one new object, and an instance refreshing its
+# copy only downloads the segments it hasn't seen.
+
+# Seconds an instance keeps its copy of an index before checking for new segments
+PAGE_INDEX_REFRESH_SECONDS = float(os.environ.get("PAGE_INDEX_REFRESH_SECONDS", "60"))
+
+def _digest():
+    return hashlib.blake2b(digest_size=16)
+
+def page_digests(content, mime_type):
+    """
+    Content digest (hex) of every page of an upload, in page order.
+
+    Args:
+        content: The upload's bytes.
+        mime_type: Its mime type, PDFs are digested page by page.
+    """
+    if mime_type != "application/pdf":
+        digest = _digest()
+        digest.update(content)
+        return [digest.hexdigest()]
+
+    import fitz
+    import page_source
+
+    digests = []
+    with page_source.fitz_lock:
+        with fitz.open(stream=content, filetype="pdf") as pdf:
+            for page in pdf:
+                digest = _digest()
+                digest.update(repr((tuple(page.rect), page.rotation)).encode("ascii"))
+                digest.update(page.read_contents())
+                # Decoded text: subset fonts can reuse the same codes for other glyphs
+                digest.update(page.get_text().encode("utf-8"))
+                xrefs = [image[0] for image in page.get_images(full=True)]
+                xrefs += [xobject[0] for xobject in page.get_xobjects()]
+                for xref in xrefs:
+                    digest.update(pdf.xref_stream(xref) or b"")
+                digests.append(digest.hexdigest())
+    return digests
+
+class PageDigestIndex:
+    """Pages of processed documents keyed by content digest."""
+
+    def __init__(self):
+        # digest -> (doc_id, page), the latest document wins
+        self.pages = {}
+        # One record per document: where its results are
+        self.documents = []
+
+    def __len__(self):
+        return len(self.pages)
+
+    def add_document(self, digests, record):
+        """
+        Adds the pages of one document.
+
+        Args:
+            digests: page_digests of the document, in page order.
+            record: Where the document's results are (dict, saved with the segment).
+
+        Returns:
+            The document number.
+        """
+        doc_id = len(self.documents)
+        self.documents.append(record)
+        for page, digest in enumerate(digests):
+            self.pages[digest] = (doc_id, page)
+        return doc_id
+
+    def lookup(self, digest):
+        """
+        The indexed page with this digest.
+
+        Returns:
+            dict with "document" (its record), "doc_id" and "page" (0-based),
+            or None for a page that wasn't processed before.
+        """
+        entry = self.pages.get(digest)
+        if entry is None:
+            return None
+        doc_id, page = entry
+        return {"document": self.documents[doc_id], "doc_id": doc_id, "page": page}
+
+def user_key(userId):
+    """Folder of a user's index, the userId isn't used as an object name as is."""
+    return hashlib.sha256(userId.encode("utf-8")).hexdigest()[:32]
+
+class PageIndexStore:
+    """
+    One PageDigestIndex per user and doc type in a bucket, saved as one
+    segment object per document and cached by every instance.
+
+    Args:
+        bucket_name: Bucket holding the indexes.
+        prefix: Folder of the index objects.
+        storage_client: Storage client, the shared storage layer by default.
+    """
+
+    def __init__(self, bucket_name, prefix="page_index", storage_client=None):
+        self.storage = storage.Storage(storage_client) if storage_client else storage.get_storage()
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # folder -> [index, segment names loaded, loaded at]
+        self._cache = {}
+
+    def _folder(self, doc_type, userId):
+        return f"{self.prefix}/{doc_type}/{user_key(userId)}/"
+
+    def index(self, doc_type, userId):
+        """
+        The user's index for a doc type. When the cached copy is older than
+        PAGE_INDEX_REFRESH_SECONDS the folder is listed and the new segments
+        are read into it.
+        """
+        folder = self._folder(doc_type, userId)
+        with self._lock:
+            cached = self._cache.get(folder)
+            if cached and time.monotonic() - cached[2] < PAGE_INDEX_REFRESH_SECONDS:
+                return cached[0]
+            if cached is None:
+                cached = [PageDigestIndex(), set(), 0.0]
+
+            # Segments sort by creation time, documents keep their order
+            for blob in sorted(self.storage.list(self.bucket_name, prefix=folder), key=lambda b: b.name):
+                if blob.name in cached[1]:
+                    continue
+                try:
+                    segment = json.loads(self.storage.read_blob(blob))
+                except Exception as e:
+                    # Left for the next refresh
+                    print(f"Could not read page index segment {blob.name}: {e}")
+                    continue
+                cached[0].add_document(segment["digests"], segment["record"])
+                cached[1].add(blob.name)
+            cached[2] = time.monotonic()
+            self._cache[folder] = cached
+            return cached[0]
+
+    def add(self, doc_type, userId, digests, record):
+        """
+        Adds one document to the user's index as a new segment object.
+        Nothing existing is read or rewritten, so concurrent writers don't conflict.
+        """
+        name = f"{self._folder(doc_type, userId)}{time.time_ns():020d}-{uuid.uuid4().hex}.json"
+        try:
+            self.storage.write(self.bucket_name, name, json.dumps({"digests": digests, "record": record}),
+                               "application/json", if_generation_match=0)
+        except PreconditionFailed:
+            print(f"Page index segment {name} already exists")
+            return False
+        return True
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(bucket_name):
+    """Returns this process's PageIndexStore for a bucket."""
+    with _stores_lock:
+        if bucket_name not in _stores:
+            _stores[bucket_name] = PageIndexStore(bucket_name)
+        return _stores[bucket_name]
+
+def replayable(matches):
+    """
+    True when the earlier results cover the upload: every page matched, and
+    pages of documents with a single finalized JSON (online results) only
+    replay as that whole document.
+    """
+    if not matches or any(match is None for match in matches):
+        return False
+    for match in matches:
+        record = match["document"]
+        if len(record["finalized"]) != record["pages"]:
+            # One finalized JSON for every page: same document, same pages, same order
+            same = [m for m in matches if m["doc_id"] == match["doc_id"]]
+            if len(matches) != record["pages"] or len(same) != len(matches) \
+                    or [m["page"] for m in matches] != list(range(record["pages"])):
+                return False
+    return True
+
+def replay(matches, name, userId, doc_type):
+    """
+    Writes the earlier results of the matched pages for a new upload.
+
+    Returns:
+        Status dict like docai_batch.process_documents_output.
+    """
+    import docai_batch
+    import image_extract
+    import page_source
+
+    store = storage.get_storage()
+
+    # Same naming as a Document AI shard so send-front-end and the PDF agree
+    stem = re.sub(r"\.[^./]+$", "", name.rsplit("/", 1)[-1])
+    output_prefix = f"{docai_batch.ONLINE_OUTPUT_PREFIX}/{doc_type}/known/{uuid.uuid4().hex}/{stem}"
+    pdf_blob = image_extract.pdf_name(f"{output_prefix}-0.json", doc_type)
+
+    # PDF from the earlier PDFs' pages
+    import fitz
+    sources = {}
+    with page_source.fitz_lock:
+        pdf = fitz.open()
+        try:
+            for match in matches:
+                record = match["document"]
+                if record["pdf"] not in sources:
+                    sources[record["pdf"]] = fitz.open(
+                        stream=store.read(image_extract.BUCKET_NAME, record["pdf"]), filetype="pdf"
+                    )
+                pdf.insert_pdf(sources[record["pdf"]], from_page=match["page"], to_page=match["page"])
+            data = pdf.tobytes(garbage=1, deflate=True)
+        finally:
+            pdf.close()
+            for source in sources.values():
+                source.close()
+    store.write(image_extract.BUCKET_NAME, pdf_blob, data, "application/pdf",
+                metadata={"firebaseStorageDownloadTokens": str(uuid.uuid4())})
+
+    # Finalized JSONs, which trigger send-front-end for the new upload
+    finalized = []
+    with store.batch() as writes:
+        copied = set()
+        for number, match in enumerate(matches):
+            record = match["document"]
+            per_page = len(record["finalized"]) == record["pages"]
+            source_name = record["finalized"][match["page"] if per_page else 0]
+            if source_name in copied:
+                continue
+            copied.add(source_name)
+            output_name = docai_batch.finalized_name(f"{output_prefix}-{number}.json")
+            writes.write(
+                docai_batch.ONLINE_OUTPUT_BUCKET,
+                output_name,
+                store.read(record["bucket"], source_name),
+                "application/json",
+                metadata={"userid": userId, "docType": doc_type},
+            )
+            finalized.append(output_name)
+
+    print(f"Replayed {len(matches)} known page(s) into {pdf_blob}")
+    return {
+        "status": "ok",
+        "output": f"gs://{docai_batch.ONLINE_OUTPUT_BUCKET}/{output_prefix}",
+        "pages": len(matches),
+        "known": True,
+        "bucket": docai_batch.ONLINE_OUTPUT_BUCKET,
+        "finalized": finalized,
+        "pdf": pdf_blob,
+    }
+
+class UploadCheck:
+    """
+    Outcome of looking an upload's pages up: replayed (nothing left to do)
+    or not, in which case record() adds the pages once they are processed.
+    content holds the downloaded upload, so processing doesn't download it again.
+    """
+
+    def __init__(self, store, doc_type, userId, digests, content=None, result=None):
+        self.store = store
+        self.doc_type = doc_type
+        self.userId = userId
+        self.digests = digests
+        self.content = content
+        self.result = result
+
+    @property
+    def replayed(self):
+        return self.result is not None
+
+    def record(self, result):
+        """Indexes the upload's pages after a successful run."""
+        if self.replayed or not self.digests or not result or result.get("status") != "ok":
+            return
+        if result.get("pages") != len(self.digests) or not result.get("finalized"):
+            # Pages without image or skipped: positions wouldn't line up
+            print("Page count differs from the upload, not indexing it")
+            return
+        self.store.add(self.doc_type, self.userId, self.digests, {
+            "bucket": result["bucket"],
+            "finalized": result["finalized"],
+            "pdf": result["pdf"],
+            "pages": result["pages"],
+        })
+
+def record_upload(store, bucket, name, mime_type, userId, doc_type, result):
+    """
+    Adds the pages of an upload processed without waiting for it (operations
+    finished later by pending_operations), digesting the upload again.
+    """
+    if not userId or not result or result.get("status") != "ok":
+        return
+    content = storage.get_storage().read(bucket, name)
+    UploadCheck(store, doc_type, userId, page_digests(content, mime_type)).record(result)
+
+def check_upload(store, bucket, name, mime_type, userId, doc_type):
+    """
+    Digests the pages of an upload and replays the user's earlier results
+    when all of them are known (same content as pages they uploaded before).
+
+    Returns:
+        UploadCheck
+    """
+    if not userId:
+        # The index is per user, nothing to look up or add to
+        return UploadCheck(store, doc_type, userId, [])
+
+    start = time.perf_counter()
+    content = storage.get_storage().read(bucket, name)
+    digests = page_digests(content, mime_type)
+    index = store.index(doc_type, userId)
+    matches = [index.lookup(digest) for digest in digests]
+    known = sum(match is not None for match in matches)
+    print(f"{known}/{len(digests)} known page(s) in {name} ({(time.perf_counter() - start) * 1000:.1f} ms)")
+
+    if not replayable(matches):
+        return UploadCheck(store, doc_type, userId, digests, content)
+    return UploadCheck(store, doc_type, userId, digests, content,
+                       result=replay(matches, name, userId, doc_type))
@@ -0,0 +1,139 @@
+from detect_mime_type import detect_mime_type
+import os
+import re
+import threading
+
+# Preview pages rendered from the uploaded file.
+# By default the image stage cleans pages.image from the Document AI shards,
+# so every shard carries a base64 copy of its page (several MB) that has to be
+# downloaded and parsed. With the "source" preview the field mask drops
+# pages.image: the shards only hold entities and pages.blocks, and each page
+# is rendered from the original upload instead (PyMuPDF for PDFs, OpenCV for
+# images). Deskewing only needs the blocks geometry, which is normalized and
+# so holds at whatever size the page is rendered.
+# That assumes Document AI's page frame is the rendered upload's: same
+# orientation and bounds. A page Document AI rotated or cropped (EXIF
+# orientation, /Rotate or a CropBox it reads differently) gets blocks that
+# don't line up with the render, and its deskew angle is off.
+# Without the upload's URI there is nothing to render: those shards fail
+# (docai_batch.process_shard) rather than fall back to the missing pages.image.
+
+# "shard" (pages.image from the Document AI output) or "source" (the upload)
+PREVIEW_SOURCE = os.environ.get("PREVIEW_SOURCE", "shard")
+# Per doc type overrides, e.g. "form2307=source,service_invoice=shard"
+PREVIEW_SOURCES = dict(
+    item.strip().split("=", 1)
+    for item in os.environ.get("PREVIEW_SOURCES", "").split(",")
+    if "=" in item
+)
+# Resolution PDF pages are rendered at before the preview size is applied
+SOURCE_RENDER_DPI = int(os.environ.get("SOURCE_RENDER_DPI", "200"))
+
+# MuPDF isn't thread safe, every PyMuPDF call of the process goes through this lock
+fitz_lock = threading.Lock()
+
+def uses_source(doc_type):
+    """True when the preview of this doc type is rendered from the upload."""
+    return PREVIEW_SOURCES.get(doc_type, PREVIEW_SOURCE) == "source"
+
+def field_mask(doc_type, mask):
+    """
+    The field mask to request for a doc type: pages.image is left out when
+    its preview comes from the upload.
+    """
+    if not mask or not uses_source(doc_type):
+        return mask
+    return ",".join(field for field in mask.split(",") if field.strip() != "pages.image")
+
+class SourceDocument:
+    """
+    An uploaded file, rendered page by page for the preview.
+
+    Args:
+        gcs_uri: gs:// URI of the upload, downloaded on the first render.
+        mime_type: Mime type of the upload, detected from the name by default.
+        content: The file bytes when they are already in memory.
+    """
+
+    def __init__(self, gcs_uri=None, mime_type=None, content=None):
+        self.gcs_uri = gcs_uri
+        self.mime_type = (mime_type or detect_mime_type(gcs_uri or "") or "").lower()
+        self.content = content
+        self._lock = threading.Lock()
+        self._pdf = None
+
+    def _load(self):
+        with self._lock:
+            if self.content is None:
+                import storage
+                bucket_name, name = re.match(r"gs://(.*?)/(.*)", self.gcs_uri).groups()
+                print(f"Fetching source {self.gcs_uri}")
+                self.content = storage.get_storage().read(bucket_name, name)
+            return self.content
+
+    def page_count(self):
+        """Pages in the upload, images count as one."""
+        content = self._load()
+        if self.mime_type != "application/pdf":
+            return 1
+        import fitz
+        with fitz_lock:
+            if self._pdf is None:
+                self._pdf = fitz.open(stream=content, filetype="pdf")
+            return self._pdf.page_count
+
+    def render(self, page_number, max_dimension=None):
+        """
+        Grayscale image of one page, no larger than the preview size.
+
+        Args:
+            page_number: 1-based page number, as in page.page_number.
+            max_dimension: Longest side in pixels, preview_max_dimension() by default.
+
+        Returns:
+            (image, extension for re-encoding, scale against the full render),
+            or None when the file has no such page.
+        """
+        import image_extract
+
+        if max_dimension is None:
+            max_dimension = image_extract.preview_max_dimension()
+        content = self._load()
+
+        if self.mime_type == "application/pdf":
+            return self._render_pdf(content, page_number, max_dimension)
+
+        # Images are a single page, decoded like a Document AI page image
+        if page_number != 1:
+            return None
+        ext = ".jpg" if ("jpeg" in self.mime_type or "jpg" in self.mime_type) else ".png"
+        img, scale = image_extract.decode_bytes(content, max_dimension=max_dimension)
+        return img, ext, scale
+
+    def _render_pdf(self, content, page_number, max_dimension):
+        import fitz
+        import numpy as np
+
+        with fitz_lock:
+            if self._pdf is None:
+                self._pdf = fitz.open(stream=content, filetype="pdf")
+            if not 1 <= page_number <= self._pdf.page_count:
+                return None
+            page = self._pdf[page_number - 1]
+
+            # Render straight at the preview size instead of resizing afterwards
+            zoom = SOURCE_RENDER_DPI / 72
+            full_side = max(page.rect.width, page.rect.height) * zoom
+            if max_dimension and full_side > max_dimension:
+                zoom *= max_dimension / full_side
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+            img = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.stride)[:, :pix.width].copy()
+
+        return img, ".png", min(1.0, max(img.shape) / full_side)
+
+    def close(self):
+        with fitz_lock:
+            if self._pdf is not None:
+                self._pdf.close()
+                self._pdf = None
+        self.content = None
@@ -0,0 +1,193 @@
+import io
+import struct
+import zlib
+
+# Incremental PDF writer for the stitched page PDFs.
+# img2pdf.convert needs every page up front and builds the whole PDF in
+# memory. StreamingPdfWriter writes each page (image, content stream, page
+# object) to the output as soon as it is added and only keeps the byte
+# offsets for the cross-reference table, so memory doesn't grow with the
+# page count. Pages are embedded without re-encoding where PDF allows it:
+# - JPEG: DCTDecode, as is
+# - PNG (8-bit or 1-bit gray/RGB, not interlaced): the IDAT zlib data with
+#   PNG predictors, as is
+# - single-strip CCITT Group 4 TIFF (PAGE_ENCODING=g4): CCITTFaxDecode, as is
+# Anything else is decoded with Pillow and deflated.
+
+# Page size when the image carries no DPI, same default as img2pdf
+DEFAULT_DPI = 96
+
+class StreamingPdfWriter:
+    """
+    Writes a PDF with one full-page image per page.
+
+    Args:
+        out: Binary file-like object, only write() is used.
+        dpi: Fixed DPI for the page size, otherwise the image's DPI (or 96).
+    """
+
+    def __init__(self, out, dpi=None):
+        self.out = out
+        self.dpi = dpi
+        self.pages = 0
+        self._position = 0
+        # Object number -> byte offset
+        self._offsets = {}
+        # Page object numbers, in order
+        self._kids = []
+        # 1 = catalog, 2 = page tree (written on close)
+        self._next_id = 3
+        self._closed = False
+
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.out.write(data)
+        self._position += len(data)
+
+    def _object(self, number, body, stream=None):
+        self._offsets[number] = self._position
+        self._write(f"{number} 0 obj\n".encode("ascii"))
+        self._write(body)
+        if stream is not None:
+            self._write(b"\nstream\n")
+            self._write(stream)
+            self._write(b"\nendstream")
+        self._write(b"\nendobj\n")
+
+    def add_page(self, image_bytes):
+        """
+        Appends a page showing one encoded image (JPEG, PNG or G4 TIFF).
+        """
+        image = embed_image(image_bytes)
+        dpi_x, dpi_y = (self.dpi, self.dpi) if self.dpi else image["dpi"]
+        width_pt = image["width"] * 72.0 / dpi_x
+        height_pt = image["height"] * 72.0 / dpi_y
+
+        image_id, content_id, page_id = self._next_id, self._next_id + 1, self._next_id + 2
+        self._next_id += 3
+
+        self._object(image_id, image["dict"] + f" /Length {len(image['data'])} >>".encode("ascii"),
+                     image["data"])
+        # Drop the page data as soon as it is written
+        del image["data"]
+
+        content = f"q {width_pt:.4f} 0 0 {height_pt:.4f} 0 0 cm /Im0 Do Q".encode("ascii")
+        self._object(content_id, f"<< /Length {len(content)} >>".encode("ascii"), content)
+
+        self._object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.4f} {height_pt:.4f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode("ascii"))
+
+        self._kids.append(page_id)
+        self.pages += 1
+
+    def close(self):
+        """
+        Writes the page tree, catalog, cross-reference table and trailer.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        kids = " ".join(f"{kid} 0 R" for kid in self._kids)
+        self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._kids)} >>".encode("ascii"))
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_at = self._position
+        size = self._next_id
+        lines = [f"xref\n0 {size}\n".encode("ascii"), b"0000000000 65535 f \n"]
+        for number in range(1, size):
+            lines.append(f"{self._offsets[number]:010d} 00000 n \n".encode("ascii"))
+        self._write(b"".join(lines))
+        self._write(
+            f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode("ascii")
+        )
+
+def embed_image(data):
+    """
+    Image XObject for encoded image bytes.
+
+    Returns:
+        dict with "width", "height", "dpi", "dict" (the XObject dictionary
+        without Length and the closing >>) and "data" (the stream).
+    """
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    width, height = img.size
+    dpi = _dpi(img)
+
+    if img.format == "JPEG" and img.mode in ("L", "RGB"):
+        return _xobject(width, height, dpi, _colorspace(img.mode), 8, "/DCTDecode", None, data)
+
+    if img.format == "PNG":
+        passthrough = _png_idat(data)
+        if passthrough is not None:
+            bits, colors, idat = passthrough
+            parms = f"<< /Predictor 15 /Colors {colors} /BitsPerComponent {bits} /Columns {width} >>"
+            return _xobject(width, height, dpi, "/DeviceGray" if colors == 1 else "/DeviceRGB",
+                            bits, "/FlateDecode", parms, idat)
+
+    if img.format == "TIFF" and img.info.get("compression") == "group4":
+        offsets = img.tag_v2.get(273)
+        counts = img.tag_v2.get(279)
+        if offsets and len(offsets) == 1:
+            # PhotometricInterpretation 0 (WhiteIsZero) is stored inverted
+            black_is_1 = "false" if img.tag_v2.get(262) == 0 else "true"
+            parms = f"<< /K -1 /Columns {width} /Rows {height} /BlackIs1 {black_is_1} >>"
+            return _xobject(width, height, dpi, "/DeviceGray", 1, "/CCITTFaxDecode", parms,
+                            data[offsets[0]:offsets[0] + counts[0]])
+
+    # Fallback: raw pixels, deflated
+    if img.mode not in ("1", "L", "RGB"):
+        img = img.convert("RGB" if "A" in img.mode or img.mode in ("P", "CMYK") else "L")
+    bits = 1 if img.mode == "1" else 8
+    return _xobject(width, height, dpi, _colorspace(img.mode), bits, "/FlateDecode", None,
+                    zlib.compress(img.tobytes(), 6))
+
+def _xobject(width, height, dpi, colorspace, bits, filter_name, parms, data):
+    body = (f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace {colorspace} /BitsPerComponent {bits} /Filter {filter_name}")
+    if parms:
+        body += f" /DecodeParms {parms}"
+    return {"width": width, "height": height, "dpi": dpi, "dict": body.encode("ascii"), "data": data}
+
+def _colorspace(mode):
+    return "/DeviceRGB" if mode == "RGB" else "/DeviceGray"
+
+def _dpi(img):
+    # A TIFF without resolution tags reads as (1, 1) dpi
+    if img.format == "TIFF" and 282 not in img.tag_v2:
+        return float(DEFAULT_DPI), float(DEFAULT_DPI)
+    dpi = img.info.get("dpi")
+    if dpi and dpi[0] and dpi[1]:
+        return float(dpi[0]), float(dpi[1])
+    return float(DEFAULT_DPI), float(DEFAULT_DPI)
+
+def _png_idat(data):
+    """
+    (bit depth, colors, concatenated IDAT data) for PNGs PDF can read as
+    is, None for the rest (palette, alpha, 16-bit, interlaced).
+    """
+    position = 8
+    header = None
+    idat = []
+    while position + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[position:position + 8])
+        chunk = data[position + 8:position + 8 + length]
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif kind == b"IDAT":
+            idat.append(chunk)
+        elif kind == b"IEND":
+            break
+        position += 12 + length
+
+    if header is None:
+        return None
+    _, _, bits, color_type, _, _, interlace = header
+    if interlace or bits not in (1, 8) or color_type not in (0, 2) or (color_type == 2 and bits != 8):
+        return None
+    return bits, 1 if color_type == 0 else 3, b"".join(idat)
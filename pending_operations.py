@@ -0,0 +1,262 @@
+from google.cloud import documentai
+from google.api_core.exceptions import NotFound
+import clients
+import storage
+import json
+import os
+import re
+import sqlite3
+import threading
+
+# Non-blocking Document AI operations.
+# In submit-only mode the trigger starts the batch operation and saves its
+# context (doc type, userId, output prefix, inputs) here instead of waiting.
+# complete_operation() later picks the operation up once it is done, either
+# from a scheduled poll or from the output-bucket event of one of its shards.
+# Records are keyed by operation id, the number in the shard paths, so a shard
+# event fetches its operation's record directly (find(op_id)) instead of
+# listing the store.
+
+# Bucket holding pending operation records, shared by every instance.
+# Without it records are kept in memory, which only works for local runs.
+PENDING_OPERATIONS_BUCKET = os.environ.get("PENDING_OPERATIONS_BUCKET")
+
+# complete_operation outcomes
+COMPLETED = "completed"
+RUNNING = "running"
+# Finished by another poller/event (lease held or done, record gone)
+SKIPPED = "skipped"
+
+class InMemoryPendingStore:
+    """Pending store for a single process, used for local runs."""
+
+    def __init__(self):
+        # operation id -> (name, context)
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def put(self, name, context):
+        with self._lock:
+            self._records[operation_id(name)] = (name, dict(context))
+
+    def get(self, name):
+        record = self.find(operation_id(name))
+        return record[1] if record and record[0] == name else None
+
+    def find(self, op_id):
+        with self._lock:
+            return self._records.get(op_id)
+
+    def delete(self, name):
+        with self._lock:
+            self._records.pop(operation_id(name), None)
+
+    def list(self):
+        with self._lock:
+            return list(self._records.values())
+
+class SQLitePendingStore:
+    """Pending store backed by a SQLite file, for local tests across processes."""
+
+    def __init__(self, path=":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending_by_id (op_id TEXT PRIMARY KEY, name TEXT, context TEXT)"
+            )
+
+    def put(self, name, context):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pending_by_id (op_id, name, context) VALUES (?, ?, ?)",
+                (operation_id(name), name, json.dumps(context)),
+            )
+
+    def get(self, name):
+        record = self.find(operation_id(name))
+        return record[1] if record and record[0] == name else None
+
+    def find(self, op_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, context FROM pending_by_id WHERE op_id = ?", (op_id,)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def delete(self, name):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pending_by_id WHERE op_id = ?", (operation_id(name),))
+
+    def list(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT name, context FROM pending_by_id").fetchall()
+        return [(name, json.loads(context)) for name, context in rows]
+
+class GcsPendingStore:
+    """
+    Pending store with one JSON object per operation in a GCS bucket,
+    named PREFIX/OPERATION_ID.json.
+    """
+
+    def __init__(self, bucket_name, prefix="pending_operations", storage_client=None):
+        self.storage = storage.Storage(storage_client) if storage_client else storage.get_storage()
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def _blob(self, op_id):
+        return self.storage.blob(self.bucket_name, f"{self.prefix}/{op_id}.json")
+
+    def put(self, name, context):
+        self.storage.write_blob(
+            self._blob(operation_id(name)),
+            json.dumps({"name": name, "context": context}),
+            "application/json",
+        )
+
+    def get(self, name):
+        record = self.find(operation_id(name))
+        return record[1] if record and record[0] == name else None
+
+    def find(self, op_id):
+        try:
+            record = json.loads(self.storage.read_blob(self._blob(op_id)))
+        except NotFound:
+            return None
+        return record["name"], record["context"]
+
+    def delete(self, name):
+        try:
+            self.storage.delete_blob(self._blob(operation_id(name)))
+        except NotFound:
+            pass
+
+    def list(self):
+        records = []
+        for blob in self.storage.list(self.bucket_name, prefix=f"{self.prefix}/"):
+            try:
+                record = json.loads(self.storage.read_blob(blob))
+            except NotFound:
+                # Completed by someone else while listing
+                continue
+            records.append((record["name"], record["context"]))
+        return records
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """
+    Returns the pending store for this instance (GCS when configured).
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            if PENDING_OPERATIONS_BUCKET:
+                _store = GcsPendingStore(PENDING_OPERATIONS_BUCKET)
+            else:
+                _store = InMemoryPendingStore()
+        return _store
+
+def operation_id(operation_name):
+    """projects/.../locations/us/operations/123 -> 123"""
+    return operation_name.rsplit("/", 1)[-1]
+
+def find_by_output(object_name, store):
+    """
+    Finds the pending operation that wrote an output shard.
+
+    Shards are written to PREFIX/OPERATION_ID/INPUT_FILE_NUMBER/name.json,
+    the record is read by that id (one request, whatever else is pending).
+    """
+    match = re.search(r"(?:^|/)(\d+)/\d+/[^/]+\.json$", object_name)
+    if not match:
+        return None
+    record = store.find(match.group(1))
+    return record[0] if record else None
+
+def handler_for(doc_type):
+    """
+    Data handler used for a doc type, same routing as main.trigger.
+    """
+    if doc_type == "service_invoice":
+        import service_invoice_data_handler
+        return service_invoice_data_handler.handle_data
+    import handle_data_2307
+    return handle_data_2307.handle_data
+
+def complete_operation(name, store, client=None, guard=None, process_fn=None, on_results=None):
+    """
+    Finishes a pending operation if Document AI is done with it.
+
+    Args:
+        name: Full operation name.
+        store: Pending store holding the operation context.
+        client: Document AI client, the shared one for the location by default.
+        guard: IdempotencyGuard so concurrent pollers/events only process
+            an operation once. It must share its leases between instances
+            (GcsLeaseStore) when completion runs on more than one.
+        process_fn: Passed to docai_batch.finish_batch.
+        on_results: Called with (context, results) once the outputs are
+            processed, main uses it to add the pages to the page index.
+
+    Returns:
+        COMPLETED when this call finished the operation, RUNNING while
+        Document AI is still on it, SKIPPED when another call finished it
+        or is finishing it.
+    """
+    import docai_batch
+
+    context = store.get(name)
+    if context is None:
+        return SKIPPED
+
+    client = client or clients.documentai_client(context.get("location", "us"))
+    operation = client.get_operation(request={"name": name})
+    if not operation.done:
+        print(f"Operation {name} still running")
+        return RUNNING
+
+    def finish():
+        metadata = documentai.BatchProcessMetadata.deserialize(operation.metadata.value)
+        # A failed operation won't succeed on a retry, log it and drop it
+        if metadata.state != documentai.BatchProcessMetadata.State.SUCCEEDED:
+            print(f"Operation {name} failed: {metadata.state_message or operation.error.message}")
+        else:
+            contexts = {doc["gcs_uri"]: doc for doc in context.get("inputs", [])}
+            results = docai_batch.finish_batch(
+                metadata,
+                handler_for(context["doc_type"]),
+                context.get("userId"),
+                context["doc_type"],
+                contexts,
+                process_fn=process_fn,
+            )
+            if on_results:
+                on_results(context, results)
+        store.delete(name)
+        return COMPLETED
+
+    if guard:
+        # None when the lease is held or done elsewhere
+        return guard.run(f"operation:{name}", finish) or SKIPPED
+    return finish()
+
+def poll_pending(store, client=None, guard=None, process_fn=None, on_results=None):
+    """
+    Checks every pending operation once.
+
+    Returns:
+        dict with the number of completed, still running, skipped (finished
+        by another call) and failed operations.
+    """
+    summary = {COMPLETED: 0, RUNNING: 0, SKIPPED: 0, "failed": 0}
+    for name, _ in store.list():
+        try:
+            summary[complete_operation(name, store, client=client, guard=guard,
+                                       process_fn=process_fn, on_results=on_results)] += 1
+        except Exception as e:
+            # Leave it in the store, the next poll retries it
+            print(f"Completing {name} failed: {e}")
+            summary["failed"] += 1
+    return summary
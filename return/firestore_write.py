@@ -1,21 +1,22 @@
 # Uses firebase admin to bypass the security rules of the firebase
-import firebase_admin
-from firebase_admin import firestore
+# The Firebase app and Firestore client come from the shared client registry
+import clients
 from typing import Optional
 import re
 
-# Application Default credentials are automatically created.
-# Initialize Firebase App + Firestore Client
-app = firebase_admin.initialize_app()
 # "extracted-data-db" is the name of the database
-db = firestore.client(app, "extracted-data-db")
+DATABASE = "extracted-data-db"
+
+def get_db():
+    # Shared Firestore client, built once per instance
+    return clients.firestore_client(DATABASE)
 
 # This function gives the document a unique name
 def check_for_doc(collection, docname):
     """ Will check firestore if the file already exists
         if it does, it will add an incrementation (1), (2) etc.
     """
-    collection_ref = db.collection(collection)
+    collection_ref = get_db().collection(collection)
     counter = 1
     name = docname
 
@@ -44,7 +45,7 @@ def write_to_firestore(data, prefix: str, collection):
         print("Writing to database")
         
         # Write the document to a specified collection
-        doc_ref = db.collection(collection).document(docname)
+        doc_ref = get_db().collection(collection).document(docname)
         doc_ref.set(data)
         
         # Attach a pdf name, this is used for locating the PDF for preview
@@ -52,7 +53,7 @@ def write_to_firestore(data, prefix: str, collection):
     else:
         # Default to "user" collection if none provided
         print("Writing to user Collection")
-        doc_ref = db.collection("user").document(docname)
+        doc_ref = get_db().collection("user").document(docname)
         doc_ref.set(data)
         doc_ref.set({"pdf_name" : f"{pdf_name}.pdf"}, merge=True)
 
@@ -1,5 +1,4 @@
-from datetime import datetime
-from dateutil import parser
+import dates
 
 # Adds a "quarter" field to the given document data
 # Quarters:
@@ -15,26 +14,14 @@ def quarter(data: dict) -> dict:
     
     # Process if the date exist
     if (date):
-        # Parse the date string into a datetime obj
-        dateToCompare = parser.parse(str(date))
-        print(dateToCompare)
+        # Parse the date string, the quarter comes precomputed
+        dateToCompare = dates.parse_date(str(date))
+        if dateToCompare is None:
+            raise ValueError(f"Unknown date format: {date}")
+        print(dateToCompare.text)
+        print("The month is", dateToCompare.month)
 
-        # Extract month from the parsed date
-        month = int(dateToCompare.month)
-        print("The month is", month)
-
-        # Determine which quarter the month belong
-        if(month >= 1 and month <= 3):
-            data['quarter'] = "1st Quarter"
-        elif(month >= 4 and month <= 6):
-            data['quarter'] = "2nd Quarter"
-        elif(month >= 7 and month <= 9):
-            data['quarter'] = "3rd Quarter"
-        elif(month >= 10 and month <= 12):
-            data['quarter'] = "4th Quarter"
-        else:
-            data['quarter'] = ""
-        
+        data['quarter'] = dateToCompare.quarter_label
         return data
     else:
         print("No date available to parse")
@@ -1,6 +1,6 @@
 import functions_framework
 from cloudevents.http import CloudEvent
-from google.cloud import storage
+import storage
 from calc_field import calculateTable, calculateForServiceInvoice
 from getquarter import quarter
 from isSecondPage import isRelevant
@@ -27,10 +27,8 @@ def sendTrigger(event: CloudEvent):
 
     print(name)
 
-    # Initialize Storage clients to get the blob
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(name)
+    # Shared storage layer to get the blob
+    blob = storage.get_storage().blob(bucket_name, name)
 
     # Retrieve metadata set during earlier processing
     metadata = data.get('metadata') or {}
@@ -42,7 +40,7 @@ def sendTrigger(event: CloudEvent):
 
     # Load JSON document from GCS
     print(f"Fetching {blob.name}")
-    bytes = blob.download_as_bytes()
+    bytes = storage.get_storage().read_blob(blob)
     document = json.loads(bytes)
 
     # Clean up file name (remove folder prefix + suffix like -0_finalized.json)
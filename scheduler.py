@@ -0,0 +1,286 @@
+from google.api_core.exceptions import ResourceExhausted
+import os
+import random
+import threading
+import time
+
+# Quota-aware submission of Document AI batch operations.
+# Document AI limits concurrent batch operations and pages per minute per
+# project and region. Instead of sending every request straight away and
+# failing on ResourceExhausted, submissions go through a SubmissionScheduler:
+# - at most `limit` operations of this process are in flight (operations
+#   only submitted, whose completion runs elsewhere, free their slot once
+#   accepted),
+# - a token bucket spends pages against the pages-per-minute quota,
+# - a ResourceExhausted answer lowers both limits (other instances share the
+#   quota) and the request is retried after a jittered backoff,
+# - after a run of successful submissions the limits creep back up.
+# Callers queue (block) until their request can go out or max_wait_seconds pass.
+
+# Pages per minute allowed for batch submissions, 0 disables the page budget
+DOCAI_PAGES_PER_MINUTE = int(os.environ.get("DOCAI_PAGES_PER_MINUTE", "0"))
+# Concurrent batch operations this process may have running
+DOCAI_MAX_IN_FLIGHT = int(os.environ.get("DOCAI_MAX_IN_FLIGHT", "5"))
+# Seconds a submission may wait in the queue before the quota error is raised
+DOCAI_QUEUE_SECONDS = float(os.environ.get("DOCAI_QUEUE_SECONDS", "300"))
+# Page estimate for inputs whose page count isn't known before submitting
+PAGES_PER_DOCUMENT = int(os.environ.get("PAGES_PER_DOCUMENT", "2"))
+
+class SubmissionScheduler:
+    """
+    Queues batch_process_documents calls under an in-flight cap and a
+    pages-per-period token bucket, adapting both to quota errors.
+
+    Args:
+        pages_per_period: Page budget per period, 0 for no page budget.
+        max_in_flight: Upper bound for operations in flight.
+        period: Token bucket period in seconds (60 for pages per minute).
+        max_wait_seconds: How long submit() may queue before giving up.
+        base_backoff: First backoff after a quota error, doubled per retry.
+        max_backoff: Cap for a single backoff.
+        recover_after: Successful submissions before the limits go back up.
+        poll_interval: How often a waiting submit checks running operations.
+    """
+
+    def __init__(self, pages_per_period=0, max_in_flight=5, period=60.0,
+                 max_wait_seconds=300.0, base_backoff=1.0, max_backoff=60.0,
+                 recover_after=5, poll_interval=1.0):
+        self.pages_per_period = pages_per_period
+        self.max_in_flight = max(1, max_in_flight)
+        self.period = period
+        self.max_wait_seconds = max_wait_seconds
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.recover_after = recover_after
+        self.poll_interval = poll_interval
+
+        self._cond = threading.Condition()
+        # Operations submitted by this process and not known to be done
+        self._in_flight = []
+        # Slots taken by submissions that are on the wire
+        self._submitting = 0
+        # One caller refreshes the operations at a time, outside the lock
+        self._pruning = False
+
+        # Adaptive limits, lowered on quota errors
+        self.limit = self.max_in_flight
+        self.rate_scale = 1.0
+        self._successes = 0
+
+        # Token bucket, starts full
+        self._tokens = float(pages_per_period)
+        self._refilled_at = time.monotonic()
+
+        # Counters for logs and the benchmark
+        self.submitted = 0
+        self.quota_errors = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self, now):
+        if not self.pages_per_period:
+            return
+        rate = self.pages_per_period * self.rate_scale / self.period
+        self._tokens = min(self.pages_per_period, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    # Operation.done() refreshes the operation (an RPC), so operations are only
+    # polled when at the cap, by one caller at a time. The caller snapshots them
+    # with the lock held (_start_prune), leaves the `with` block and polls them
+    # (_finish_prune), so submit/release don't queue behind the RPCs.
+
+    def _start_prune(self):
+        """
+        Called with the lock held. Returns the operations to poll, None when
+        another caller is already polling or nothing is in flight.
+        """
+        if self._pruning or not self._in_flight:
+            return None
+        self._pruning = True
+        return list(self._in_flight)
+
+    def _finish_prune(self, snapshot):
+        """
+        Called without the lock. Polls the snapshot, then drops the
+        operations that are done.
+        """
+        done = set()
+        try:
+            done = {id(op) for op in snapshot if _is_done(op)}
+        finally:
+            with self._cond:
+                self._pruning = False
+                if done:
+                    self._in_flight = [op for op in self._in_flight if id(op) not in done]
+                    self._cond.notify_all()
+
+    def _acquire(self, pages, deadline):
+        """
+        Blocks until a slot and the pages are available, then takes them.
+        """
+        # A request bigger than the whole bucket waits for a full bucket
+        need = min(pages, self.pages_per_period) if self.pages_per_period else 0
+        start = time.monotonic()
+        while True:
+            # At the cap: poll the running operations, outside the lock
+            snapshot = None
+            with self._cond:
+                if len(self._in_flight) + self._submitting >= self.limit:
+                    snapshot = self._start_prune()
+            if snapshot is not None:
+                self._finish_prune(snapshot)
+
+            with self._cond:
+                now = time.monotonic()
+                self._refill(now)
+
+                has_slot = len(self._in_flight) + self._submitting < self.limit
+                has_pages = self._tokens >= need
+
+                if has_slot and has_pages:
+                    self._tokens -= need
+                    self._submitting += 1
+                    self.waited_seconds += now - start
+                    return
+
+                if now >= deadline:
+                    waiting_for = f"{pages} pages" if has_slot else "an operation slot"
+                    raise ResourceExhausted(
+                        f"Document AI quota: waited {self.max_wait_seconds}s for {waiting_for}"
+                    )
+
+                wait = self.poll_interval
+                if has_slot and not has_pages:
+                    rate = self.pages_per_period * self.rate_scale / self.period
+                    wait = (need - self._tokens) / rate
+                self._cond.wait(timeout=max(0.01, min(wait, deadline - now)))
+
+    def _on_success(self, operation, track):
+        with self._cond:
+            self._submitting -= 1
+            if track:
+                self._in_flight.append(operation)
+            else:
+                self._cond.notify_all()
+            self.submitted += 1
+            self._successes += 1
+            if self._successes >= self.recover_after:
+                self._successes = 0
+                self.limit = min(self.max_in_flight, self.limit + 1)
+                self.rate_scale = min(1.0, self.rate_scale * 1.25)
+
+    def _on_quota_error(self, pages):
+        with self._cond:
+            self._submitting -= 1
+            self.quota_errors += 1
+            self._successes = 0
+            snapshot = self._start_prune()
+        if snapshot is not None:
+            self._finish_prune(snapshot)
+
+        with self._cond:
+            # The quota is shared with other instances, what is running now is
+            # what fits. Both limits go down and recover slowly.
+            self.limit = max(1, min(self.limit - 1, len(self._in_flight)))
+            self.rate_scale = max(0.1, self.rate_scale * 0.5)
+            # The pages weren't used, give them back
+            if self.pages_per_period:
+                self._tokens = min(self.pages_per_period, self._tokens + min(pages, self.pages_per_period))
+            self._cond.notify_all()
+
+    def _on_error(self):
+        with self._cond:
+            self._submitting -= 1
+            self._cond.notify_all()
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff for the attempt-th quota error in a row."""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def submit(self, client, request, pages=1, track=True):
+        """
+        Calls client.batch_process_documents(request) once the in-flight cap
+        and page budget allow it, retrying quota errors with backoff.
+
+        Args:
+            client: Document AI client.
+            request: documentai.BatchProcessRequest.
+            pages: Estimated pages in the request, spent from the page budget.
+            track: Count the operation against the in-flight cap until it is
+                released or seen done. False for submit-only callers, whose
+                operations complete in another invocation: their slot frees
+                as soon as the request is accepted, the concurrent operation
+                quota is then enforced by Document AI's quota errors.
+
+        Returns:
+            The operation returned by the client.
+
+        Raises:
+            ResourceExhausted: when the request couldn't go out within max_wait_seconds.
+        """
+        deadline = time.monotonic() + self.max_wait_seconds
+        attempt = 0
+        while True:
+            self._acquire(pages, deadline)
+            try:
+                operation = client.batch_process_documents(request)
+            except ResourceExhausted:
+                self._on_quota_error(pages)
+                delay = self.backoff(attempt)
+                attempt += 1
+                if time.monotonic() + delay >= deadline:
+                    raise
+                print(f"Document AI quota reached, retrying in {delay:.1f}s "
+                      f"(limit {self.limit} operations, {self.rate_scale:.0%} page rate)")
+                time.sleep(delay)
+                continue
+            except Exception:
+                self._on_error()
+                raise
+            self._on_success(operation, track)
+            return operation
+
+    def release(self, operation):
+        """Marks an operation as finished so its slot frees up right away."""
+        with self._cond:
+            self._in_flight = [op for op in self._in_flight if op is not operation]
+            self._cond.notify_all()
+
+    @property
+    def in_flight(self):
+        with self._cond:
+            return len(self._in_flight) + self._submitting
+
+def _is_done(operation):
+    try:
+        return operation.done()
+    except Exception as e:
+        # Can't tell, keep counting it until the next check
+        print(f"Could not refresh operation: {e}")
+        return False
+
+def estimate_pages(gcs_input_documents=None):
+    """
+    Pages to budget for a request: the "pages" of each input when known,
+    PAGES_PER_DOCUMENT otherwise.
+    """
+    if not gcs_input_documents:
+        return PAGES_PER_DOCUMENT
+    return sum(doc.get("pages") or PAGES_PER_DOCUMENT for doc in gcs_input_documents)
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(location="us"):
+    """
+    Returns this process's scheduler for a location (quotas are per region).
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(location)
+        if scheduler is None:
+            scheduler = SubmissionScheduler(
+                pages_per_period=DOCAI_PAGES_PER_MINUTE,
+                max_in_flight=DOCAI_MAX_IN_FLIGHT,
+                max_wait_seconds=DOCAI_QUEUE_SECONDS,
+            )
+            _schedulers[location] = scheduler
+        return scheduler
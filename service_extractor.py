@@ -1,24 +1,30 @@
-# Google API exceptions for handling operation errors
-from google.api_core.exceptions import InternalServerError
-from google.api_core.exceptions import RetryError
-
-# Google Cloud libraries for Document AI and Storage
-from google.cloud import documentai
-from google.cloud import storage
-
-# Import image processing helpers
-from image_extract import clean_img, upload_pdf_gcs
+# Shared Document AI batch flow
+import docai_batch
 
 # Type hints
 from typing import Optional
 
-# Regex, JSON utils
-import re
-import json
-
 # Handler for extracted service invoice data
 import service_invoice_data_handler
 
+# Project ID
+PROJECT_ID = "medtax-ocr-prototype"
+
+# Service Invoice Parser processor ID
+PROCESSOR_ID = "100eafc3a81f4960"
+
+# For a specific version of the parser
+# If not included in the argument, the default version will be used
+PROCESSOR_VERSION_ID = "6d9f64e0bc83f261"
+
+# Processor location. For example: "us" or "eu".
+LOCATION = "us"
+
+# Field mask specifies which data to get from json so it doesnt load everything
+# This Field mask only extract entities, images, blocks (reduces payload size)
+# pages.image is dropped for doc types whose preview is rendered from the upload (page_source.py)
+FIELD_MASK = "entities,pages.image,pages.blocks"
+
 def batch_process_documents(
     userId: str,
     doc_type: str,
@@ -30,9 +36,11 @@ def batch_process_documents(
     gcs_input_uri: Optional[str] = None,
     input_mime_type: Optional[str] = None,
     gcs_input_prefix: Optional[str] = None,
+    gcs_input_documents: Optional[list] = None,
     field_mask: Optional[str] = None,
     timeout: int = 400,
-) -> None:
+    wait: bool = True,
+) -> dict:
     """
     - Sends document(s) to the processor
     - Waits for processing results
@@ -40,237 +48,155 @@ def batch_process_documents(
     - Extracts fields and cleaned images
     - Stitches pages into a PDF and uploads back to GCS
 
+    With wait=False the operation is only submitted, the shards are handled
+    later by pending_operations.complete_operation.
+
     This function is mostly from the documentation sample code with some modifications
     link to the documentation: https://cloud.google.com/document-ai/docs/send-request#batch-process
     """
-    
-    print("Connecting with the client...")
-    client = documentai.DocumentProcessorServiceClient()
-
-    # CONFIGURE INPUT DOCUMENTS
-    if gcs_input_uri:
-        # Specify specific GCS URIs to process individual documents
-        gcs_document = documentai.GcsDocument(
-            gcs_uri=gcs_input_uri, mime_type=input_mime_type
-        )
-
-        # Load GCS Input URI into a List of document files
-        gcs_documents = documentai.GcsDocuments(documents=[gcs_document])
-        input_config = documentai.BatchDocumentsInputConfig(gcs_documents=gcs_documents)
-
-    else:
-        # Specify a GCS URI Prefix to process an entire directory
-        gcs_prefix = documentai.GcsPrefix(gcs_uri_prefix=gcs_input_prefix)
-        input_config = documentai.BatchDocumentsInputConfig(gcs_prefix=gcs_prefix)
-
-    # CONFIGURE OUTPUT LOCATION
-    gcs_output_config = documentai.DocumentOutputConfig.GcsOutputConfig(
-        gcs_uri=gcs_output_uri, field_mask=field_mask,  
-        sharding_config=documentai.DocumentOutputConfig.GcsOutputConfig.ShardingConfig(
-            pages_per_shard=1
-        )
-    )
-
-    # Wrap config into DocumentOutputConfig
-    output_config = documentai.DocumentOutputConfig(gcs_output_config=gcs_output_config)
-
-    print("Connecting to the processor version...")
-    if processor_version_id:
-        # The full resource name of the processor version, e.g.:
-        # projects/{project_id}/locations/{location}/processors/{processor_id}/processorVersions/{processor_version_id}
-        name = client.processor_version_path(
-            project_id, location, processor_id, processor_version_id
-        )
-
-    else:
-        # Using default version of the processor
-        name = client.processor_path(project_id, location, processor_id)
-
-    # BUILD REQUEST AND PROCESS
-    print("Requesting...")
-    request = documentai.BatchProcessRequest(
-        name=name,
-        input_documents=input_config,
-        document_output_config=output_config,
+    return docai_batch.batch_process_documents(
+        handler=service_invoice_data_handler.handle_data,
+        userId=userId,
+        doc_type=doc_type,
+        project_id=project_id,
+        location=location,
+        processor_id=processor_id,
+        gcs_output_uri=gcs_output_uri,
+        processor_version_id=processor_version_id,
+        gcs_input_uri=gcs_input_uri,
+        input_mime_type=input_mime_type,
+        gcs_input_prefix=gcs_input_prefix,
+        gcs_input_documents=gcs_input_documents,
+        field_mask=field_mask,
+        timeout=timeout,
+        wait=wait,
     )
 
-    # Start the batch process
-    print("Processing...")
-    operation = client.batch_process_documents(request)
-
-    # Starting the operation
-    try:
-        
-        print(f"Waiting for operation {operation.operation.name} to complete...")
-        operation.result(timeout=timeout)
-
-    # Catch exception when operation doesn't finish before timeout
-    except (RetryError, InternalServerError) as e:
-        print(e.message)
-    
-    # Process output metadata
-    metadata = documentai.BatchProcessMetadata(operation.metadata)
-    # Check if process succeeded
-    if metadata.state != documentai.BatchProcessMetadata.State.SUCCEEDED:
-        raise ValueError(f"Batch Process Failed: {metadata.state_message}")
-
-    print("Output files:")
-    
-    # Loop through processed documents
-    
-    # One process per Input Document
-    for process in list(metadata.individual_process_statuses):
-         # Collect processed image pages into a list 
-        pdf_list = []
-
-        # output_gcs_destination format: gs://BUCKET/PREFIX/OPERATION_NUMBER/INPUT_FILE_NUMBER/
-        # The Cloud Storage API requires the bucket name and URI prefix separately
-        matches = re.match(r"gs://(.*?)/(.*)", process.output_gcs_destination)
-        if not matches:
-            print(
-                "Could not parse output GCS destination:",
-                process.output_gcs_destination,
-            )
-            continue
-
-        # Store the bucket name and prefix
-        output_bucket, output_prefix = matches.groups()
-       
-        # Initialize storage client
-        storage_client = storage.Client(output_bucket)
-
-        # Get List of Document Objects from the Output Bucket
-        output_blobs = storage_client.list_blobs(output_bucket, prefix=output_prefix)
-
-        # Access the bucket
-        bucket = storage_client.bucket(output_bucket)
-
-        # Document AI may output multiple JSON files per source file
-        
-        # Loop through all output JSON Files
-        for blob in output_blobs:
-            # Document AI should only output JSON files to GCS
-            if blob.content_type != "application/json":
-                print(
-                    f"Skipping non-supported file: {blob.name} - Mimetype: {blob.content_type}"
-                )
-                continue
-            # Skip already processed finalized JSONs
-            if blob.name.endswith("_finalized.json"):
-                continue
-            # Process output JSON (extract fields + save finalized.json)
-            process_output(blob, bucket, userId, doc_type)
-            
-            # Clean image from blob and add to page list
-            pdf_list.append(clean_img(blob=blob))
-    
-        # After processing all blobs for one input doc, stitch into PDF
-        print("Stitching pdf")
-        upload_pdf_gcs(blob.name, doc_type, pdf_list)
-            
-# Process the output 
-def process_output(blob, bucket, userId, doc_type):
+# Process the output
+def process_output(blob, bucket, userId, doc_type, document=None):
     """
     Processes a single Document AI JSON shard:
-    - Loads JSON into Document object
+    - Loads JSON into Document object (unless a parsed document is passed)
     - Extracts entities/fields with data handler
     - Writes extracted fields into a new *_finalized.json in GCS
     """
+    docai_batch.process_output(blob, bucket, userId, doc_type, service_invoice_data_handler.handle_data, document=document)
 
-    print(f"Fetching {blob.name}")
-    document = documentai.Document.from_json(
-        blob.download_as_bytes(),
-        ignore_unknown_fields=True
-    )
+def main_batch(bucket, inputs, doc_type, wait=True):
+    """
+    Runs several uploads through one Document AI operation.
 
-    # Call handler for service_invoice data extraction
-    final_data = service_invoice_data_handler.handle_data(document)
+    Args:
+        bucket: Bucket the uploads landed in.
+        inputs: list of dicts with "input" (object name), "mime_type" and "userId".
+        doc_type: Document type shared by every input.
+        wait: False to only submit the operation.
 
-     # Save results as a new finalized JSON file
-    output_blob_name = blob.name.replace(".json", "_finalized.json")
-    text_blob = bucket.blob(output_blob_name)
-    # Attach metadata for traceability
-    text_blob.metadata = {
-        "userid" : userId,
-        "docType" : doc_type,
-    }
+    Returns:
+        list with the status of each input, in the same order as inputs.
+    """
 
-    # Upload JSON string with extracted fields
-    text_blob.upload_from_string(
-        json.dumps(final_data, indent=2),
-        content_type="application/json"
-    )
+    # Path to the output
+    gcs_output_uri = f"gs://processed_output_bucket/processed_path/{doc_type}"
 
-    print(f"Extracted fields saved to: gs://{bucket.name}/{output_blob_name}")
+    # Path to input documents
+    gcs_input_documents = [
+        {
+            "gcs_uri": f"gs://{bucket}/{item['input']}",
+            "mime_type": item["mime_type"],
+            "userId": item.get("userId"),
+        }
+        for item in inputs
+    ]
 
+    print(f"Starting the process for {len(gcs_input_documents)} document(s)...")
+
+    results = batch_process_documents(
+        userId=None,
+        doc_type=doc_type,
+        project_id=PROJECT_ID,
+        location=LOCATION,
+        processor_id=PROCESSOR_ID,
+        gcs_output_uri=gcs_output_uri,
+        # processor_version_id=PROCESSOR_VERSION_ID,
+        gcs_input_documents=gcs_input_documents,
+        field_mask=FIELD_MASK,
+        wait=wait,
+    )
 
-def main(mime_type, bucket, input, userId, doc_type):
+    # One result per input, in the same order as inputs
+    return [results.get(doc["gcs_uri"]) for doc in gcs_input_documents]
+
+def main(mime_type, bucket, input, userId, doc_type, wait=True, size=None, content=None):
     """
     Entrypoint for running document extraction.
     - Configures project, processor, paths
-    - Calls batch_process_documents
+    - Small uploads (size in bytes from the event) use online processing,
+      with the upload's bytes when the caller already downloaded them (content)
+    - Calls batch_process_documents (wait=False only submits it)
     """
-    
+
     print(mime_type)
     print("The input location is " , input)
     print(bucket)
 
-    # Project ID
-    project_id = "medtax-ocr-prototype"               
-
-     # Service Invoice Parser processor ID
-    processor_id = "100eafc3a81f4960"      
-    
-    # For a specific version of the parser
-    # If not included in the argument, the default version will be used
-    processor_version_id = "6d9f64e0bc83f261"         
-
-    # Processor location. For example: "us" or "eu". 
-    location = "us"        
-    
     # Path to the output
     gcs_output_uri = f"gs://processed_output_bucket/processed_path/{doc_type}"
-    
+
     # Path to input document (single file)
-    gcs_input_uri = f"gs://{bucket}/{input}"    
+    gcs_input_uri = f"gs://{bucket}/{input}"
 
     # MIME type of input file
     input_mime_type = mime_type
-    
-    # Field mask specifies which data to get from json so it doesnt load everything
-    # This Field mask only extract entities, images, blocks (reduces payload size)
-    field_mask = "entities,pages.image,pages.blocks"
-    
+
     # For testing purposes without going through the whole trigger-function
-    # hardcoded getting the document and processing it 
+    # hardcoded getting the document and processing it
     """
-    gcs_output_uri = f"gs://practice_sample_training/{doc_type}_tests"                 
+    gcs_output_uri = f"gs://practice_sample_training/{doc_type}_tests"
     gcs_input_uri = f"gs://{bucket}/{input}"
     input_mime_type = mime_type
     """
     print(gcs_output_uri)
     print(gcs_input_uri)
-   
+
     # Alternative for processing an entire folder instead of single file
     gcs_input_prefix = f"gs://{bucket}/{input}"
-    
+
+    # Fast path for small uploads, falls back to batch if the PDF has more than one page
+    if docai_batch.should_process_online(input_mime_type, size):
+        result = docai_batch.process_online(
+            handler=service_invoice_data_handler.handle_data,
+            userId=userId,
+            doc_type=doc_type,
+            project_id=PROJECT_ID,
+            location=LOCATION,
+            processor_id=PROCESSOR_ID,
+            gcs_input_uri=gcs_input_uri,
+            input_mime_type=input_mime_type,
+            field_mask=FIELD_MASK,
+            content=content,
+        )
+        if result is not None:
+            return {gcs_input_uri: result}
+
     print("Starting the process...")
 
     # Commented arguments can be uncommented if you want to:
     # Specify a processor version
     # Batch upload using prefix
-    batch_process_documents(
+    return batch_process_documents(
         userId=userId,
         doc_type=doc_type,
-        project_id=project_id,
-        location=location,
-        processor_id=processor_id,
+        project_id=PROJECT_ID,
+        location=LOCATION,
+        processor_id=PROCESSOR_ID,
         gcs_output_uri=gcs_output_uri,
         gcs_input_uri=gcs_input_uri,
-        # processor_version_id=processor_version_id,
+        # processor_version_id=PROCESSOR_VERSION_ID,
         input_mime_type=input_mime_type,
         # gcs_input_prefix=gcs_input_prefix,
-        field_mask=field_mask,
+        field_mask=FIELD_MASK,
+        wait=wait,
     )
 
 # LOCAL TESTING
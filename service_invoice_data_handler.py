@@ -1,234 +1,58 @@
-from datetime import datetime
-from dateutil import parser
-import re
-import json
+import doc_schema
+from normalize import norm_currencies, norm_invoice_no, norm_tin
+from normalize import norm_date_fuzzy as norm_date
 
 # Example bucket & input path (only used in __main__ testing)
 gcs_bucket = "practice_sample_training"
 input_prefix = "docai/14582948428165940265/0/DUMMY 3 - 2307 - ROBERT-0.json"
 
+# Service Invoice header fields, in output order, with their normalizers
+# Left as blank if missing, invalid values are concatenated with [INVALID]
+SCHEMA = {
+    "fields": {
+        "Invoice_No": norm_invoice_no,
+        "Date": norm_date,
+        "Business_Address": None,
+        "Registered_Name": None,
+        "Sold_To_Tin": norm_tin,
+    },
+    # Sensitive fields keep the text as written instead of normalized_value
+    "mention_text": ("Invoice_No", "Date", "Sold_To_Tin"),
+    "tables": {
+        # Item rows, only amounts are normalized (not descriptions)
+        "Item_Table": {
+            "entity": "Item_Table",
+            "columns": {
+                "Amount": norm_currencies,
+                "Item_Description_Nature_Of_Service": None,
+            },
+        },
+        # Summary/totals rows, always normalized as currency
+        "Item_Table_2": {
+            "entity": "Item_Table_2",
+            "columns": {
+                "Less_Witholding_Tax": norm_currencies,
+                "Total_Amount_Due": norm_currencies,
+            },
+        },
+    },
+}
+_SCHEMA = doc_schema.compile_schema(SCHEMA)
+
 def handle_data(document):
     """
     Main handler for extracting and normalizing field values
     from a Document AI `document` object for Service Invoice forms.
 
-    Steps:
-    - Define expected high-level fields (Invoice_No, Date, etc.).
-    - Extract data from entities (including Item tables).
+    Steps (see SCHEMA and doc_schema.py):
+    - One pass over document.entities for header fields, Item table rows
+      and confidence scores.
     - Normalize special fields (TIN, Dates, Currency, Invoice Numbers).
     - Compute average confidence score for all extracted fields.
     - Return merged dictionary with field values + item tables.
     """
+    return _SCHEMA.handle(document)
 
-    # Expected "header" fields
-    field_values = {
-        "Invoice_No": "",
-        "Date": "",
-        "Business_Address": "",
-        "Registered_Name": "",
-        "Sold_To_Tin": 0,
-    }
-    # Expected fields inside Item Table 1
-    table_one_values = ["Amount",
-                        "Item_Description_Nature_Of_Service",
-                    ]
-    # Expected fields inside Item Table 2 (summary/totals)
-    table_two_values = ["Less_Witholding_Tax",
-                        "Total_Amount_Due",
-                    ]
-    # Containers for itemized rows
-    Item_Table = []
-    Item_Table_2 = []
-    
-    # Extract form fields (labeled data) to only get the Key Value Pairs from raw json
-    extracted_data = {}
-
-     # Loop through all entities
-    for field in document.entities:
-        
-        # Handle Item Table 1 rows
-        if field.type == "Item_Table":
-
-            row_dict = {field_name: "" for field_name in table_one_values}
-            
-            for property in field.properties:
-                property_type = property.type
-                value = property.mention_text
-
-                # Only normalize numeric fields (not descriptions)
-                if property_type != "Item_Description_Nature_Of_Service":
-                    value = norm_currency(value)
-                
-                if property_type in table_one_values:
-                    row_dict[property_type] = value
-                
-
-            Item_Table.append(row_dict)
-            
-        # Handle Item Table 2 rows (summary values)
-        elif field.type == "Item_Table_2":
-            row_dict2 = {field_name: "" for field_name in table_two_values}
-
-            for property in field.properties:
-                property_type = property.type
-                value = property.mention_text
-                value = norm_currency(value) # Always normalize as currency
-                if property_type in table_two_values:
-                    row_dict2[property_type] = value
-            
-            Item_Table_2.append(row_dict2)
-
-        # Confidence score for current entity
-        confidence = round(field.confidence, 2)
-        key = field.type.strip()
-
-        # Extract field value
-        # Prefer normalized_value unless sensitive (TIN, Date, Invoice_No)
-        if hasattr(field, 'normalized_value') and field.normalized_value:
-            if "Invoice_No" in field.type or "Date" in field.type or "Sold_To_Tin" in field.type:
-                value = field.mention_text.strip()
-            else:
-                value = field.normalized_value.text.strip()
-        else:
-            value = field.mention_text.strip()
-        extracted_data[key] = value
-
-        # Track per-field confidence
-        extracted_data[f"{key}_confidence"] = float(confidence)
-
-    # Printed in the logs, for debugging purposes
-    # print(json.dumps(Item_Table, indent=2))
-    # print(json.dumps(Item_Table_2, indent=2))
-
-    # Normalize and validate fields
-    data = extracted_data
-    count = 0
-    confidence = 0
-    
-    # Normalizing and validating the extracted data
-    # Left as blank if missing 
-    # Invalid values are concatenated with [INVALID]
-    for key in field_values.keys():
-        if key in data:
-            value = data.get(key)
-            if value is None:
-                continue
-            try:
-                if "Date" in key:
-                    # Normalize date fields
-                    field_values[key] = norm_date(value)
-
-                elif "Sold_To_Tin" in key:
-                    # Normalize TIN fields
-                    field_values[key] = norm_tin(value)
-
-                elif "Invoice_No" in key:
-                    # Normalize ZIP code fields
-                    field_values[key] = norm_invoice_no(value)
-                else: 
-                    field_values[key] = value
-            except ValueError as e:
-                print(f"Error normalizing field '{key}': {e}")
-                field_values[key] = ""
-        else:
-            # If missing, leave blank
-            field_values[key] = ""
-
-    # For debugging purposes, printed at logs
-    # print(json.dumps(field_values, indent=2))
-    
-    # Get the confidence average (Currently only for field values not tables)
-    for key in data.keys():
-        if "_confidence" in key:
-            confidence += float(data.get(key, 0))
-            count += 1
-    if count != 0:
-        confidence /= count
-
-    field_values["confidence_average"] = round(confidence, 2)
-    
-    # Final return
-    
-    try:
-        # Adding table_row key to the field_values and its value is the table rows
-        return {**field_values, "Item_Table": Item_Table, "Item_Table_2": Item_Table_2}
-    except Exception as e:
-        print(f"Error processing output: {e}")
-
-def norm_currency(currency):
-    """
-    Normalize currency received
-    - Replace OCR misreads (O→0, I→1, etc.)
-    - Strip out non-numeric/non-decimal characters
-    - Returns cleaned numeric string
-    Args:
-        currency (float): The number to be normalized
-    
-    Returns:
-        str: The normalized currency in string in format.
-    """
-    mapping = {"O": "0", "o": "0", "I": "1", "l": "1", "S": "5", "p":"0"}
-    for k, v in mapping.items():
-        currency = currency.replace(k, v)
-    cleaned = re.sub(r"[^0-9.]", "", currency) #Removes non number values
-    return cleaned
-
-def norm_tin(num):
-    """
-    Normalize TIN (Tax Identification Number).
-    - Replace OCR misreads.
-    - Keep only digits.
-    - Return as integer.
-    Args:
-        num (num): The TIN string to normalize.
-    
-    Returns:
-        int: The normalized TIN.
-    """
-    mapping = {"O": "0", "o": "0", "I": "1", "l": "1", "S": "5", "p":"0"}
-    for k, v in mapping.items():
-        num = num.replace(k, v)
-    num = ''.join(filter(str.isdigit, num))  # Remove non-numeric characters
-    return int(num)
-
-def norm_date(date_str):
-    
-    """
-    Normalize date strings to 'MM-DD-YYYY' format.
-    Uses dateutil.parser with fuzzy parsing to handle messy inputs.
-    
-    Args:
-        date_str (str): The date string to normalize.
-    
-    Returns:
-        str: The normalized date string in 'MM-DD-YYYY' format.
-    """
-
-    date_format = "%m-%d-%Y"  # MM-DD-YYYY
-    print("Normalizing Date filtered the digits ",date_str)
-   
-    dt = parser.parse(date_str, fuzzy=True)
-    return dt.strftime(date_format)
-
-def norm_invoice_no(invoice_no):
-    """
-    Normalize invoice numbers.
-    - Replace OCR misreads.
-    - Keep only digits.
-    - Return cleaned invoice number as string.
-
-    Args:
-        invoice_no (str): The invoice number to normalize
-
-    Returns:
-        invoice_no (str): Normalized value of invoice number.
-    """
-    mapping = {"O": "0", "o": "0", "I": "1", "l": "1", "S": "5", "p":"0"}
-    for k, v in mapping.items():
-        invoice_no = invoice_no.replace(k, v)
-    invoice_no = "".join(filter(str.isdigit, invoice_no))
-    return invoice_no
-    
 def main():
     """
     Test harness (currently unusable).
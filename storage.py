@@ -0,0 +1,264 @@
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import threading
+import time
+
+import clients
+
+# Storage layer shared by every module.
+# All object reads, writes, listings and deletes go through a Storage object so
+# that:
+# - metadata is sent with the upload itself (no second patch request),
+# - small writes can be batched and sent in parallel (Storage.batch),
+# - request, byte and latency counters cover the whole pipeline (Storage.stats),
+# - the backend can be GCS or a local directory. Set STORAGE_ROOT to run the
+#   pipeline against <STORAGE_ROOT>/<bucket>/<object> (local_storage.py).
+#
+# The return/ function is deployed from its own folder, cloudbuild.yaml copies
+# this module next to it before deploying.
+
+# Local directory backend instead of GCS, for local runs and benchmarks
+STORAGE_ROOT = os.environ.get("STORAGE_ROOT")
+# Threads uploading batched small writes
+STORAGE_WRITE_WORKERS = int(os.environ.get("STORAGE_WRITE_WORKERS", "8"))
+
+class Storage:
+    """
+    Object storage on top of a google.cloud.storage.Client compatible client.
+
+    Args:
+        client: GCS client, or local_storage.LocalStorageClient.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._write_pool = None
+
+        # Counters, see stats()
+        self.requests = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+        # operation -> [calls, total seconds]
+        self.latency = {}
+
+    def _record(self, operation, started, bytes_up=0, bytes_down=0, requests=1):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.requests += requests
+            self.bytes_up += bytes_up
+            self.bytes_down += bytes_down
+            entry = self.latency.setdefault(operation, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def stats(self):
+        """
+        Counters since the process started: requests, bytes and the average
+        latency of every kind of operation in milliseconds.
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "bytes_up": self.bytes_up,
+                "bytes_down": self.bytes_down,
+                "latency_ms": {
+                    operation: round(total * 1000 / calls, 2)
+                    for operation, (calls, total) in self.latency.items()
+                },
+            }
+
+    def bucket(self, bucket_name):
+        """Bucket handle, no request is made."""
+        return self.client.bucket(bucket_name)
+
+    def blob(self, bucket_name, name):
+        """Blob handle, no request is made."""
+        return self.client.bucket(bucket_name).blob(name)
+
+    def list(self, bucket_name, prefix=""):
+        """
+        Blobs under a prefix (with name, content_type, size, metadata).
+        """
+        started = time.perf_counter()
+        blobs = list(self.client.list_blobs(bucket_name, prefix=prefix))
+        self._record("list", started)
+        return blobs
+
+    def read(self, bucket_name, name, **kwargs):
+        """Downloads an object."""
+        return self.read_blob(self.blob(bucket_name, name), **kwargs)
+
+    def read_blob(self, blob, **kwargs):
+        """Downloads a blob, kwargs (if_generation_match...) go to download_as_bytes."""
+        started = time.perf_counter()
+        data = blob.download_as_bytes(**kwargs)
+        self._record("read", started, bytes_down=len(data))
+        return data
+
+    def reload_blob(self, blob):
+        """Refreshes a blob's generation and metadata."""
+        started = time.perf_counter()
+        blob.reload()
+        self._record("reload", started)
+
+    def write(self, bucket_name, name, data, content_type, metadata=None, **kwargs):
+        """
+        Uploads an object with its metadata in the same request.
+
+        Returns:
+            The uploaded blob.
+        """
+        blob = self.blob(bucket_name, name)
+        self.write_blob(blob, data, content_type, metadata=metadata, **kwargs)
+        return blob
+
+    def write_blob(self, blob, data, content_type, metadata=None, **kwargs):
+        """
+        Uploads data to a blob. Metadata set before the upload is part of the
+        upload request, kwargs (if_generation_match...) go to upload_from_string.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if metadata is not None:
+            blob.metadata = metadata
+        started = time.perf_counter()
+        blob.upload_from_string(data, content_type=content_type, **kwargs)
+        self._record("write", started, bytes_up=len(data))
+
+    def delete(self, bucket_name, name, **kwargs):
+        self.delete_blob(self.blob(bucket_name, name), **kwargs)
+
+    def delete_blob(self, blob, **kwargs):
+        """Deletes a blob, kwargs (if_generation_match...) go to delete."""
+        started = time.perf_counter()
+        blob.delete(**kwargs)
+        self._record("delete", started)
+
+    def open_writer(self, bucket_name, name, content_type, metadata=None, chunk_size=8 * 1024 * 1024):
+        """
+        Write-only file object for a large object, see ChunkedUpload.
+        """
+        blob = self.blob(bucket_name, name)
+        if metadata is not None:
+            blob.metadata = metadata
+        return ChunkedUpload(self, blob, content_type, chunk_size)
+
+    def batch(self):
+        """
+        Collects small writes and uploads them in parallel, see WriteBatch.
+        """
+        with self._lock:
+            if self._write_pool is None:
+                self._write_pool = ThreadPoolExecutor(max_workers=STORAGE_WRITE_WORKERS)
+        return WriteBatch(self, self._write_pool)
+
+class WriteBatch:
+    """
+    Small writes queued on the storage write pool.
+
+    write() returns right away, so the caller goes on with its work while the
+    uploads are in flight; flush() (or leaving the with block) waits for all
+    of them and raises the first error.
+    """
+
+    def __init__(self, storage, pool):
+        self.storage = storage
+        self._pool = pool
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def write(self, bucket_name, name, data, content_type, metadata=None, **kwargs):
+        future = self._pool.submit(
+            self.storage.write, bucket_name, name, data, content_type, metadata, **kwargs
+        )
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def flush(self):
+        with self._lock:
+            futures, self._futures = self._futures, []
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        return len(futures)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            # Still wait for the queued writes, but keep the original error
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Batched write failed: {e}")
+
+class ChunkedUpload:
+    """
+    Write-only file object for a blob: buffered until the first chunk is
+    full, then streamed with blob.open("wb") (resumable upload). Objects
+    smaller than a chunk go up in a single request, metadata included.
+    """
+
+    def __init__(self, storage, blob, content_type, chunk_size):
+        self.storage = storage
+        self.blob = blob
+        self.content_type = content_type
+        # Resumable chunks must be a multiple of 256 KB
+        self.chunk_size = max(1, chunk_size // (256 * 1024)) * 256 * 1024
+        self.bytes_written = 0
+        self._buffer = io.BytesIO()
+        self._writer = None
+        self._started = time.perf_counter()
+        self._chunks = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        if self._writer is not None:
+            self._writer.write(data)
+            return len(data)
+        self._buffer.write(data)
+        if self._buffer.tell() >= self.chunk_size:
+            self._writer = self.blob.open("wb", content_type=self.content_type, chunk_size=self.chunk_size)
+            self._writer.write(self._buffer.getvalue())
+            self._buffer = None
+        return len(data)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            # Session start plus one request per chunk
+            requests = 1 + -(-self.bytes_written // self.chunk_size)
+            self.storage._record("stream", self._started, bytes_up=self.bytes_written, requests=requests)
+        elif self._buffer is not None:
+            self.storage.write_blob(self.blob, self._buffer.getvalue(), self.content_type)
+            self._buffer = None
+
+def get_storage():
+    """
+    Returns the Storage shared by this process: the local directory under
+    STORAGE_ROOT when set, otherwise the shared GCS client.
+    """
+    if STORAGE_ROOT:
+        def build_local():
+            from local_storage import LocalStorageClient
+            return Storage(LocalStorageClient(STORAGE_ROOT))
+        return clients.get_client("storage-layer", build_local)
+
+    client = clients.storage_client()
+    storage = clients.get_client("storage-layer", lambda: Storage(client))
+    if storage.client is not client:
+        # A different client was plugged in (clients.set_client), follow it
+        storage = Storage(client)
+        clients.set_client("storage-layer", storage)
+    return storage
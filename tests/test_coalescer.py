@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from coalescer import EventCoalescer
+
+class Recorder:
+    """flush_fn that records every group and answers each item with its value doubled."""
+
+    def __init__(self):
+        self.groups = []
+        self.lock = threading.Lock()
+
+    def __call__(self, key, items):
+        with self.lock:
+            self.groups.append((key, list(items), time.monotonic()))
+        return [item * 2 for item in items]
+
+def test_flushes_when_batch_is_full():
+    flush = Recorder()
+    coalescer = EventCoalescer(flush, max_batch_size=3, max_wait_seconds=60)
+    futures = [coalescer.submit("form2307", i) for i in range(3)]
+    assert [future.result(timeout=2) for future in futures] == [0, 2, 4]
+    assert [(key, items) for key, items, _ in flush.groups] == [("form2307", [0, 1, 2])]
+
+def test_flushes_oldest_after_max_wait():
+    flush = Recorder()
+    coalescer = EventCoalescer(flush, max_batch_size=50, max_wait_seconds=0.2)
+    start = time.monotonic()
+    first = coalescer.submit("form2307", 1)
+    time.sleep(0.1)
+    second = coalescer.submit("form2307", 2)
+    assert (first.result(timeout=2), second.result(timeout=2)) == (2, 4)
+    # One group, flushed by the first item's window, not restarted by the second
+    (_, items, flushed_at), = flush.groups
+    assert items == [1, 2]
+    assert 0.15 <= flushed_at - start < 0.3
+
+def test_keys_are_buffered_apart():
+    flush = Recorder()
+    coalescer = EventCoalescer(flush, max_batch_size=2, max_wait_seconds=60)
+    futures = [coalescer.submit(key, i) for i, key in enumerate(["a", "b", "a", "b"])]
+    for future in futures:
+        future.result(timeout=2)
+    assert sorted((key, items) for key, items, _ in flush.groups) == [("a", [0, 2]), ("b", [1, 3])]
+
+def test_errors_reach_their_callers():
+    def flush(key, items):
+        return [ValueError(item) if item == "bad" else item for item in items]
+
+    coalescer = EventCoalescer(flush, max_batch_size=2, max_wait_seconds=60)
+    good, bad = coalescer.submit("k", "good"), coalescer.submit("k", "bad")
+    assert good.result(timeout=2) == "good"
+    with pytest.raises(ValueError):
+        bad.result(timeout=2)
+
+def test_flush_fn_failure_fails_the_group():
+    def flush(key, items):
+        raise RuntimeError("operation failed")
+
+    coalescer = EventCoalescer(flush, max_batch_size=10, max_wait_seconds=60)
+    futures = [coalescer.submit("k", i) for i in range(3)]
+    coalescer.flush()
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=2)
+
+def test_missing_results_fail_instead_of_hanging():
+    coalescer = EventCoalescer(lambda key, items: items[:1], max_batch_size=2, max_wait_seconds=60)
+    first, second = coalescer.submit("k", 1), coalescer.submit("k", 2)
+    assert first.result(timeout=2) == 1
+    with pytest.raises(ValueError):
+        second.result(timeout=2)
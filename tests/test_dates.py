@@ -0,0 +1,67 @@
+import random
+from datetime import datetime
+
+import pytest
+from dateutil import parser as dateutil_parser
+
+import dates
+from benchmarks.bench_dates import legacy_fuzzy, ocr_date
+
+EDGE_CASES = [
+    "", "garbage", "02-29-2024", "02-29-2025", "13/05/2025", "31-12-2025", "00-10-2025",
+    "2025-02-30", "Sept 5th, 2025", "5 Sept 2025", "March 15,2025", "Date: 03/15/2025 (due)",
+    "03-15-0025", "March 15, 0025", "1-1-1000", "12/31/9999",
+]
+
+def dateutil_text(text, fuzzy):
+    try:
+        return dateutil_parser.parse(text, fuzzy=fuzzy).strftime("%m-%d-%Y")
+    except (ValueError, OverflowError):
+        return None
+
+def test_same_dates_as_dateutil():
+    rng = random.Random(0)
+    values = [ocr_date(rng) for _ in range(5000)] + EDGE_CASES
+    dates.parse_date.cache_clear()
+    for text in values:
+        parsed = dates.parse_date(text, fuzzy=True)
+        assert (parsed and parsed.text) == legacy_fuzzy(text), text
+
+@pytest.mark.parametrize("text", EDGE_CASES)
+def test_strict_parse_matches_dateutil(text):
+    parsed = dates.parse_date(text)
+    assert (parsed and parsed.text) == dateutil_text(text, False)
+
+@pytest.mark.parametrize("text, later", [
+    ("March 15", "03-15-2031"),
+    ("15 March", "03-15-2031"),
+    ("2025", "07-09-2025"),
+    ("March 2025", "03-09-2025"),
+])
+def test_partial_dates_are_completed_from_today(text, later, monkeypatch):
+    assert dates.parse_date(text, True).text == dateutil_text(text, True)
+
+    # On another day dateutil fills in that day, a cached result wouldn't
+    class OtherDay(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2031, 7, 9, 10, 30)
+
+    monkeypatch.setattr("dateutil.parser._parser.datetime.datetime", OtherDay)
+    assert dateutil_text(text, True) == later
+    assert dates.parse_date(text, True).text == later
+
+def test_full_dates_are_cached():
+    dates.parse_date.cache_clear()
+    for _ in range(3):
+        dates.parse_date("March 15, 2025", True)
+        dates.parse_date("no date here", True)
+    info = dates.parse_date.cache_info()
+    assert (info.misses, info.hits) == (2, 4)
+
+def test_parsed_date_fields():
+    parsed = dates.parse_date("2025-08-31")
+    assert (parsed.year, parsed.month, parsed.day) == (2025, 8, 31)
+    assert parsed.quarter == 3 and parsed.quarter_label == "3rd Quarter"
+    assert parsed.to_datetime() == datetime(2025, 8, 31)
+    assert dates.parse_date("01-01-2025") < parsed
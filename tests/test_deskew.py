@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from google.cloud import documentai
+
+import image_extract
+
+def skewed_blocks(skew, count=20, outliers=()):
+    """
+    Text-block quads rotated by skew degrees around the page center (image
+    coordinates, y down: a positive skew tilts the text clockwise), plus
+    blocks tilted by the angles in outliers (stamps, handwriting).
+
+    Blocks are 0.3 wide and 0.05 high: the top edge is found by sorting the
+    vertices by y, which needs the tilt to raise the far corner less than
+    the block height (under about 9 degrees here).
+    """
+    blocks = []
+    angles = [skew] * count + list(outliers)
+    for i, angle in enumerate(angles):
+        rad = np.radians(angle)
+        cos, sin = np.cos(rad), np.sin(rad)
+        y = 0.1 + 0.7 * i / len(angles)
+
+        def rotate(x, y):
+            x, y = x - 0.5, y - 0.5
+            return documentai.NormalizedVertex(x=x * cos - y * sin + 0.5, y=x * sin + y * cos + 0.5)
+
+        blocks.append(documentai.Document.Page.Block(layout=documentai.Document.Page.Layout(
+            bounding_poly=documentai.BoundingPoly(normalized_vertices=[
+                rotate(0.3, y), rotate(0.6, y), rotate(0.6, y + 0.05), rotate(0.3, y + 0.05),
+            ])
+        )))
+    return blocks
+
+def legacy_angle(blocks):
+    """The loop deskew_using_layout used before block_angles/skew_angle."""
+    angles = []
+    for block in blocks:
+        bbox = sorted(block.layout.bounding_poly.normalized_vertices, key=lambda v: (v.y, v.x))
+        if len(bbox) >= 2:
+            angles.append(np.degrees(np.arctan2(bbox[1].y - bbox[0].y, bbox[1].x - bbox[0].x)))
+    return float(np.median(angles)) if angles else None
+
+def angle(blocks):
+    return image_extract.skew_angle(image_extract.block_angles(blocks))
+
+@pytest.mark.parametrize("skew", [0.5, 1.0, 2.5, 5.0])
+def test_clockwise_skew_matches_legacy(skew):
+    blocks = skewed_blocks(skew)
+    assert angle(blocks) == pytest.approx(skew, abs=1e-3)
+    assert angle(blocks) == pytest.approx(legacy_angle(blocks), abs=1e-3)
+
+@pytest.mark.parametrize("skew", [-0.5, -1.0, -2.5, -5.0])
+def test_counter_clockwise_skew_is_small_negative(skew):
+    blocks = skewed_blocks(skew)
+    assert angle(blocks) == pytest.approx(skew, abs=1e-3)
+    # The legacy loop took the top-right vertex first and returned an angle
+    # near 180, rotating the page upside down instead of straightening it
+    assert abs(legacy_angle(blocks)) > 170
+
+def test_straight_page():
+    assert angle(skewed_blocks(0.0)) == pytest.approx(0.0, abs=1e-3)
+
+def test_outlier_blocks_are_ignored():
+    # A few stamps tilted a lot more than the page don't pull the skew
+    blocks = skewed_blocks(2.0, count=20, outliers=(7.0, 8.0, 8.5, -8.0))
+    assert angle(blocks) == pytest.approx(2.0, abs=1e-3)
+
+def test_steep_blocks_are_dropped():
+    # Edges tilted more than DESKEW_MAX_ANGLE don't count towards the skew
+    angles = np.array([1.0, 1.0, 1.0, 60.0, -75.0])
+    assert image_extract.skew_angle(angles) == pytest.approx(1.0)
+    assert image_extract.skew_angle(np.array([60.0, -75.0])) is None
+
+def test_no_usable_block():
+    assert angle([]) is None
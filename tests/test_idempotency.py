@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from idempotency import (
+    CLAIMED, DONE, IN_FLIGHT,
+    GcsLeaseStore, IdempotencyGuard, InMemoryLeaseStore, SQLiteLeaseStore,
+)
+from local_storage import LocalStorageClient
+
+TTL = 0.2
+
+@pytest.fixture(params=["memory", "sqlite", "gcs"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryLeaseStore()
+    if request.param == "sqlite":
+        return SQLiteLeaseStore(str(tmp_path / "leases.db"))
+    return GcsLeaseStore("leases", storage_client=LocalStorageClient(str(tmp_path)))
+
+def test_claim_is_exclusive(store):
+    assert store.claim("k", "a", TTL) == CLAIMED
+    assert store.claim("k", "b", TTL) == IN_FLIGHT
+    assert store.claim("other", "b", TTL) == CLAIMED
+
+def test_completed_lease_drops_duplicates(store):
+    store.claim("k", "a", TTL)
+    store.complete("k", "a")
+    assert store.claim("k", "b", TTL) == DONE
+
+def test_released_lease_can_be_claimed(store):
+    store.claim("k", "a", TTL)
+    store.release("k", "a")
+    assert store.claim("k", "b", TTL) == CLAIMED
+
+def test_unfinished_lease_expires(store):
+    store.claim("k", "a", TTL)
+    time.sleep(TTL + 0.05)
+    assert store.claim("k", "b", TTL) == CLAIMED
+
+def test_done_lease_expires(store):
+    store.claim("k", "a", TTL)
+    store.complete("k", "a")
+    time.sleep(TTL + 0.05)
+    assert store.claim("k", "b", TTL) == CLAIMED
+
+def test_only_owner_completes_or_releases(store):
+    store.claim("k", "a", TTL)
+    store.complete("k", "b")
+    store.release("k", "b")
+    assert store.claim("k", "c", TTL) == IN_FLIGHT
+
+def test_stale_owner_cannot_touch_takeover(store):
+    # a's lease expires and b takes it over: a finishing late must neither
+    # complete nor release b's lease
+    store.claim("k", "a", TTL)
+    time.sleep(TTL + 0.05)
+    assert store.claim("k", "b", TTL) == CLAIMED
+    store.complete("k", "a")
+    store.release("k", "a")
+    assert store.claim("k", "c", TTL) == IN_FLIGHT
+    store.complete("k", "b")
+    assert store.claim("k", "c", TTL) == DONE
+
+def test_concurrent_claims_have_one_winner(store):
+    results = []
+    barrier = threading.Barrier(8)
+
+    def claim(owner):
+        barrier.wait()
+        results.append(store.claim("k", owner, 5))
+
+    threads = [threading.Thread(target=claim, args=(f"owner-{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(CLAIMED) == 1
+
+def test_guard_runs_once_and_releases_on_error(store):
+    guard = IdempotencyGuard(store, ttl=5)
+    calls = []
+    assert guard.run("k", lambda: calls.append(1) or "result") == "result"
+    assert guard.run("k", lambda: calls.append(2)) is None
+    assert calls == [1]
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        guard.run("retry", fail)
+    assert guard.run("retry", lambda: "second attempt") == "second attempt"
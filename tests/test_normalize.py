@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+import normalize
+from benchmarks.bench_normalize import CASES, corpus
+
+# Values OCR produces that the random corpus rarely hits
+EDGE_CASES = [
+    "", " ", "-", "O", "Ilp", "SSS", "0.0.0", "١٢٣٤", "12³4", "１２３４",
+    "12-3l-2O25", "O3 3I 2O2S", "2-30-2025", "13-45-2025", "02292024", "02292025",
+    "P1,234.5O", "₱ 12.OO", "No. OOl23", "N° 4S6", "123-456-789-OOO", "4O23 ", "4023.",
+]
+
+def outcome(fn, value):
+    """fn(value), or the type of the exception it raises."""
+    try:
+        return fn(value)
+    except Exception as e:
+        return type(e)
+
+@pytest.mark.parametrize("kind", sorted(CASES))
+def test_scalar_matches_legacy(kind):
+    legacy, scalar, _ = CASES[kind]
+    values = corpus(kind, 5000, random.Random(kind)) + EDGE_CASES
+    normalize.norm_date.cache_clear()
+    for value in values:
+        assert outcome(scalar, value) == outcome(legacy, value), value
+
+@pytest.mark.parametrize("kind", sorted(CASES))
+def test_batch_matches_legacy(kind):
+    legacy, _, batched = CASES[kind]
+    values = [v for v in corpus(kind, 5000, random.Random(kind)) + EDGE_CASES
+              if not isinstance(outcome(legacy, v), type)]
+    expected = [legacy(v) for v in values]
+    assert [r for i in range(0, len(values), 50) for r in batched(values[i:i + 50])] == expected
+
+def test_cached_dates_match_uncached():
+    values = corpus("date", 500, random.Random(1)) * 2
+    normalize.norm_date.cache_clear()
+    first = [normalize.norm_date(v) for v in values]
+    assert first[:500] == first[500:]
+    assert normalize.norm_date.cache_info().hits >= 500
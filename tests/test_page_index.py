@@ -0,0 +1,124 @@
+import json
+
+import fitz
+import pytest
+
+import clients
+import docai_batch
+import image_extract
+import page_index
+from benchmarks.bench_page_index import bundle
+from local_storage import LocalStorageClient
+
+def certificate(payee, tin, amount):
+    """One page of the same 2307 template, filled in."""
+    pdf = fitz.open()
+    page = pdf.new_page(width=612, height=1008)
+    page.insert_text((150, 60), "Certificate of Creditable Tax Withheld at Source", fontsize=12)
+    for row, label in enumerate(("Payee's Name", "TIN", "Amount of Income Payments")):
+        page.draw_rect(fitz.Rect(40, 106 + 60 * row, 572, 140 + 60 * row), width=0.8)
+        page.insert_text((46, 120 + 60 * row), label, fontsize=8)
+    page.insert_text((60, 135), payee, fontsize=11)
+    page.insert_text((60, 195), tin, fontsize=11)
+    page.insert_text((60, 255), amount, fontsize=11)
+    data = pdf.tobytes(garbage=1, deflate=True)
+    pdf.close()
+    return data
+
+FIRST = certificate("HARMONY TRADING INC.", "123-456-789-000", "12,500.00")
+SECOND = certificate("HARMONY TRADING INC.", "123-456-789-001", "12,500.00")
+THIRD = certificate("MERIDIAN FOODS CORP.", "987-654-321-000", "8,000.00")
+
+@pytest.fixture
+def storage_client(tmp_path, monkeypatch):
+    # Every storage.get_storage() caller (check_upload, replay) on a local directory
+    client = LocalStorageClient(str(tmp_path))
+    clients.set_client("storage", client)
+    monkeypatch.setattr(page_index, "PAGE_INDEX_REFRESH_SECONDS", 0)
+    return client
+
+def digest(data):
+    return page_index.page_digests(data, "application/pdf")
+
+def test_same_template_pages_differ():
+    # One digit of the TIN apart
+    assert len({digest(FIRST)[0], digest(SECOND)[0], digest(THIRD)[0]}) == 3
+
+def test_page_keeps_its_digest_in_another_pdf():
+    assert digest(bundle([THIRD, FIRST, SECOND])) == digest(THIRD) + digest(FIRST) + digest(SECOND)
+    assert digest(FIRST) == digest(certificate("HARMONY TRADING INC.", "123-456-789-000", "12,500.00"))
+
+def test_image_digest_is_its_bytes():
+    assert page_index.page_digests(b"jpeg bytes", "image/jpeg") == page_index.page_digests(b"jpeg bytes", "image/png")
+    assert page_index.page_digests(b"jpeg bytes", "image/jpeg") != page_index.page_digests(b"jpeg bytez", "image/jpeg")
+
+def test_index_lookup():
+    index = page_index.PageDigestIndex()
+    index.add_document(["a", "b"], {"pdf": "first.pdf"})
+    index.add_document(["b", "c"], {"pdf": "second.pdf"})
+    assert index.lookup("a") == {"document": {"pdf": "first.pdf"}, "doc_id": 0, "page": 0}
+    # The latest document wins
+    assert index.lookup("b") == {"document": {"pdf": "second.pdf"}, "doc_id": 1, "page": 0}
+    assert index.lookup("d") is None
+    assert len(index) == 3
+
+def test_store_is_per_user_and_shared_between_instances(storage_client):
+    writer = page_index.PageIndexStore("index", storage_client=storage_client)
+    reader = page_index.PageIndexStore("index", storage_client=storage_client)
+    assert reader.index("form2307", "user-a").lookup("a") is None
+
+    writer.add("form2307", "user-a", ["a", "b"], {"pdf": "first.pdf"})
+    assert reader.index("form2307", "user-a").lookup("b")["page"] == 1
+    assert reader.index("form2307", "user-b").lookup("a") is None
+    assert reader.index("service_invoice", "user-a").lookup("a") is None
+
+def test_replayable_rules():
+    per_page = {"finalized": ["p0.json", "p1.json"], "pages": 2}
+    online = {"finalized": ["doc.json"], "pages": 2}
+    match = lambda document, doc_id, page: {"document": document, "doc_id": doc_id, "page": page}
+
+    assert page_index.replayable([match(per_page, 0, 1)])
+    assert not page_index.replayable([match(per_page, 0, 0), None])
+    assert not page_index.replayable([])
+    # A single finalized JSON covers the whole document only
+    assert page_index.replayable([match(online, 1, 0), match(online, 1, 1)])
+    assert not page_index.replayable([match(online, 1, 0)])
+    assert not page_index.replayable([match(online, 1, 1), match(online, 1, 0)])
+
+def test_known_upload_is_replayed_for_its_user_only(storage_client):
+    store = page_index.PageIndexStore("index", storage_client=storage_client)
+    uploads = storage_client.bucket("uploads")
+    uploads.blob("a/first.pdf").upload_from_string(FIRST)
+    uploads.blob("a/resent.pdf").upload_from_string(bundle([FIRST]))
+    uploads.blob("a/other.pdf").upload_from_string(SECOND)
+
+    # First upload: unknown, processed and recorded
+    check = page_index.check_upload(store, "uploads", "a/first.pdf", "application/pdf", "user-a", "form2307")
+    assert not check.replayed and check.content == FIRST
+    storage_client.bucket(image_extract.BUCKET_NAME).blob("pdfs/first.pdf").upload_from_string(FIRST)
+    storage_client.bucket("processed").blob("first-0_finalized.json").upload_from_string(json.dumps({"tin": "000"}))
+    check.record({"status": "ok", "pages": 1, "bucket": "processed",
+                  "finalized": ["first-0_finalized.json"], "pdf": "pdfs/first.pdf"})
+
+    # Same page resent by the same user: replayed
+    resent = page_index.check_upload(store, "uploads", "a/resent.pdf", "application/pdf", "user-a", "form2307")
+    assert resent.replayed and resent.result["pages"] == 1
+    (finalized,) = resent.result["finalized"]
+    copy = storage_client.bucket(docai_batch.ONLINE_OUTPUT_BUCKET).blob(finalized)
+    assert json.loads(copy.download_as_bytes()) == {"tin": "000"}
+    pdf = storage_client.bucket(image_extract.BUCKET_NAME).blob(resent.result["pdf"]).download_as_bytes()
+    assert digest(pdf) == digest(FIRST)
+
+    # Another user, or another certificate on the same template: processed
+    other_user = page_index.check_upload(store, "uploads", "a/resent.pdf", "application/pdf", "user-b", "form2307")
+    other_page = page_index.check_upload(store, "uploads", "a/other.pdf", "application/pdf", "user-a", "form2307")
+    assert not other_user.replayed and not other_page.replayed
+
+def test_failed_or_partial_results_are_not_recorded(storage_client):
+    store = page_index.PageIndexStore("index", storage_client=storage_client)
+    check = page_index.UploadCheck(store, "form2307", "user-a", digest(FIRST))
+    check.record({"status": "failed"})
+    check.record({"status": "partial", "pages": 1, "finalized": ["x"], "bucket": "b", "pdf": "p"})
+    # Page count differs from the upload
+    check.record({"status": "ok", "pages": 2, "finalized": ["x", "y"], "bucket": "b", "pdf": "p"})
+    assert store.index("form2307", "user-a").lookup(digest(FIRST)[0]) is None
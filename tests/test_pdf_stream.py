@@ -0,0 +1,102 @@
+import io
+
+import fitz
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_extract
+from pdf_stream import DEFAULT_DPI, StreamingPdfWriter
+
+def page_image(width=200, height=300):
+    """Binarized page: white with black bars and a diagonal."""
+    img = np.full((height, width), 255, dtype=np.uint8)
+    img[20:40, 10:190] = 0
+    img[100:110, :] = 0
+    for i in range(min(width, height)):
+        img[i, i] = 0
+    return img
+
+def encoded(img, fmt, mode="L", dpi=None, **params):
+    out = io.BytesIO()
+    pil = Image.fromarray(img).convert(mode)
+    if dpi:
+        params["dpi"] = (dpi, dpi)
+    pil.save(out, format=fmt, **params)
+    return out.getvalue()
+
+def round_trip(pages, dpi=None):
+    out = io.BytesIO()
+    writer = StreamingPdfWriter(out, dpi=dpi)
+    for data in pages:
+        writer.add_page(data)
+    writer.close()
+    return fitz.open(stream=out.getvalue(), filetype="pdf")
+
+def pixels(pdf, number):
+    """Gray pixels of the page's image, as stored in the PDF."""
+    xref = pdf[number].get_images()[0][0]
+    pix = fitz.Pixmap(pdf, xref)
+    if pix.n > 1:
+        pix = fitz.Pixmap(fitz.csGRAY, pix)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+def image_filter(pdf, number):
+    return pdf.xref_get_key(pdf[number].get_images()[0][0], "Filter")[1]
+
+@pytest.mark.parametrize("mode", ["L", "RGB"])
+def test_jpeg_is_embedded_as_is(mode):
+    img = page_image()
+    data = encoded(img, "JPEG", mode, dpi=150, quality=95)
+    with round_trip([data]) as pdf:
+        assert image_filter(pdf, 0) == "/DCTDecode"
+        assert pdf.extract_image(pdf[0].get_images()[0][0])["image"] == data
+        assert np.abs(pixels(pdf, 0).astype(int) - img).mean() < 8
+
+@pytest.mark.parametrize("mode", ["L", "1", "RGB", "P"])
+def test_png_is_lossless(mode):
+    img = page_image()
+    with round_trip([encoded(img, "PNG", mode, dpi=150)]) as pdf:
+        assert image_filter(pdf, 0) == "/FlateDecode"
+        assert np.array_equal(pixels(pdf, 0), img)
+
+def test_g4_is_lossless():
+    img = page_image()
+    data = image_extract.encode_g4(img, dpi=150)
+    with round_trip([data]) as pdf:
+        assert image_filter(pdf, 0) == "/CCITTFaxDecode"
+        assert np.array_equal(pixels(pdf, 0), img)
+
+@pytest.mark.parametrize("fmt, params", [
+    ("JPEG", {}),
+    ("PNG", {}),
+    ("TIFF", {"compression": "group4"}),
+])
+def test_page_size_from_dpi(fmt, params):
+    img = page_image(200, 300)
+    mode = "1" if fmt == "TIFF" else "L"
+    with round_trip([encoded(img, fmt, mode, dpi=150, **params), encoded(img, fmt, mode, **params)]) as pdf:
+        # 200x300 pixels at 150 dpi (PNG stores it in pixels per meter,
+        # rounded), then without a resolution at 96 dpi
+        assert pdf[0].rect.width == pytest.approx(200 * 72 / 150, abs=0.05)
+        assert pdf[0].rect.height == pytest.approx(300 * 72 / 150, abs=0.05)
+        assert pdf[1].rect.width == pytest.approx(200 * 72 / DEFAULT_DPI, abs=0.01)
+        assert pdf[1].rect.height == pytest.approx(300 * 72 / DEFAULT_DPI, abs=0.01)
+
+def test_fixed_dpi_overrides_the_images():
+    img = page_image(200, 300)
+    with round_trip([encoded(img, "PNG", dpi=300)], dpi=72) as pdf:
+        assert (pdf[0].rect.width, pdf[0].rect.height) == pytest.approx((200, 300), abs=0.01)
+
+def test_mixed_pages_keep_their_order():
+    pages = [page_image(100 + 20 * i, 150) for i in range(3)]
+    data = [
+        encoded(pages[0], "JPEG", quality=95),
+        encoded(pages[1], "PNG"),
+        image_extract.encode_g4(pages[2], dpi=DEFAULT_DPI),
+    ]
+    with round_trip(data) as pdf:
+        assert pdf.page_count == 3
+        assert [pixels(pdf, i).shape for i in range(3)] == [page.shape for page in pages]
+        assert np.array_equal(pixels(pdf, 1), pages[1])
+        assert np.array_equal(pixels(pdf, 2), pages[2])
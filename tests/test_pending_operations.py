@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import docai_batch
+import pending_operations
+from idempotency import GcsLeaseStore, IdempotencyGuard, InMemoryLeaseStore
+from local_processor import LocalDocumentProcessorClient
+from local_storage import LocalStorageClient
+
+INPUTS = [{"gcs_uri": f"gs://uploads/{i}.pdf", "mime_type": "application/pdf", "userId": f"user-{i}"} for i in range(3)]
+
+class Outputs:
+    """process_fn recording every output it is asked to process."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def __call__(self, output_gcs_destination, handler, userId, doc_type, source=None):
+        with self.lock:
+            self.calls.append((source, userId))
+        if self.fail:
+            raise RuntimeError("output stage failed")
+        return {"status": "ok", "output": output_gcs_destination}
+
+def submit(client, store):
+    results = docai_batch.batch_process_documents(
+        handler=None,
+        userId=None,
+        doc_type="form2307",
+        project_id="local",
+        location="us",
+        processor_id="test",
+        gcs_output_uri="gs://local_output/processed_path/form2307",
+        gcs_input_documents=[dict(doc) for doc in INPUTS],
+        client=client,
+        wait=False,
+        pending_store=store,
+    )
+    return next(iter(results.values()))["operation"]
+
+@pytest.fixture
+def client():
+    return LocalDocumentProcessorClient(operation_overhead=0, per_document=0, max_concurrent_operations=100)
+
+@pytest.fixture(params=["memory", "sqlite", "gcs"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return pending_operations.InMemoryPendingStore()
+    if request.param == "sqlite":
+        return pending_operations.SQLitePendingStore(str(tmp_path / "pending.db"))
+    return pending_operations.GcsPendingStore("pending", storage_client=LocalStorageClient(str(tmp_path)))
+
+def test_running_operation_is_left_pending(store):
+    client = LocalDocumentProcessorClient(operation_overhead=60, max_concurrent_operations=100)
+    name = submit(client, store)
+    outputs = Outputs()
+    assert pending_operations.complete_operation(name, store, client=client, process_fn=outputs) == pending_operations.RUNNING
+    assert store.get(name) is not None and outputs.calls == []
+
+def test_completes_once(client, store):
+    name = submit(client, store)
+    outputs = Outputs()
+    seen = []
+    guard = IdempotencyGuard(InMemoryLeaseStore())
+
+    status = pending_operations.complete_operation(
+        name, store, client=client, guard=guard, process_fn=outputs,
+        on_results=lambda context, results: seen.append(results),
+    )
+    assert status == pending_operations.COMPLETED
+    # Every input once, with its own userId
+    assert sorted(outputs.calls) == sorted((doc["gcs_uri"], doc["userId"]) for doc in INPUTS)
+    assert store.get(name) is None
+    assert [sorted(results) for results in seen] == [sorted(doc["gcs_uri"] for doc in INPUTS)]
+
+    # A later shard event or poll finds nothing left to do
+    again = pending_operations.complete_operation(name, store, client=client, guard=guard, process_fn=outputs)
+    assert again == pending_operations.SKIPPED
+    assert len(outputs.calls) == len(INPUTS)
+
+def test_concurrent_instances_complete_once(client, tmp_path):
+    storage_client = LocalStorageClient(str(tmp_path))
+    store = pending_operations.GcsPendingStore("pending", storage_client=storage_client)
+    name = submit(client, store)
+    outputs = Outputs()
+
+    def instance(_):
+        # Each instance has its own guard over the shared lease bucket
+        guard = IdempotencyGuard(GcsLeaseStore("leases", storage_client=storage_client))
+        return pending_operations.complete_operation(name, store, client=client, guard=guard, process_fn=outputs)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(instance, range(8)))
+    assert statuses.count(pending_operations.COMPLETED) == 1
+    assert statuses.count(pending_operations.SKIPPED) == 7
+    assert len(outputs.calls) == len(INPUTS)
+
+def test_failed_completion_is_retried(client, store):
+    name = submit(client, store)
+    guard = IdempotencyGuard(InMemoryLeaseStore())
+    with pytest.raises(RuntimeError):
+        pending_operations.complete_operation(name, store, client=client, guard=guard, process_fn=Outputs(fail=True))
+    # The record stays and the lease is released, the next poll finishes it
+    assert store.get(name) is not None
+    status = pending_operations.complete_operation(name, store, client=client, guard=guard, process_fn=Outputs())
+    assert status == pending_operations.COMPLETED
+
+def test_poll_counts_each_outcome(client, store):
+    names = [submit(client, store) for _ in range(3)]
+    guard = IdempotencyGuard(InMemoryLeaseStore())
+    # Another instance holds the lease of one operation
+    guard.store.claim(f"operation:{names[0]}", "other-instance", 60)
+    summary = pending_operations.poll_pending(store, client=client, guard=guard, process_fn=Outputs())
+    assert summary == {"completed": 2, "running": 0, "skipped": 1, "failed": 0}
@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pytest
+from google.api_core.exceptions import ResourceExhausted
+
+from scheduler import SubmissionScheduler
+
+class FakeOperation:
+    def __init__(self, scheduler=None):
+        self.finished = False
+        self.scheduler = scheduler
+        self.polled_with_lock_free = []
+
+    def done(self):
+        if self.scheduler is not None:
+            # The scheduler must not hold its lock while polling
+            free = self.scheduler._cond.acquire(blocking=False)
+            if free:
+                self.scheduler._cond.release()
+            self.polled_with_lock_free.append(free)
+        return self.finished
+
+class FakeClient:
+    """batch_process_documents returns a new operation, after failing `quota_errors` times."""
+
+    def __init__(self, quota_errors=0, scheduler=None):
+        self.quota_errors = quota_errors
+        self.scheduler = scheduler
+        self.operations = []
+
+    def batch_process_documents(self, request):
+        if self.quota_errors:
+            self.quota_errors -= 1
+            raise ResourceExhausted("quota")
+        operation = FakeOperation(self.scheduler)
+        self.operations.append(operation)
+        return operation
+
+def test_in_flight_cap():
+    scheduler = SubmissionScheduler(max_in_flight=2, max_wait_seconds=0.2, poll_interval=0.02)
+    client = FakeClient()
+    scheduler.submit(client, None)
+    scheduler.submit(client, None)
+    assert scheduler.in_flight == 2
+    with pytest.raises(ResourceExhausted):
+        scheduler.submit(client, None)
+    assert len(client.operations) == 2
+
+def test_done_operation_frees_its_slot():
+    scheduler = SubmissionScheduler(max_in_flight=1, max_wait_seconds=2, poll_interval=0.02)
+    client = FakeClient()
+    first = scheduler.submit(client, None)
+    threading.Timer(0.1, lambda: setattr(first, "finished", True)).start()
+    start = time.monotonic()
+    scheduler.submit(client, None)
+    assert 0.08 <= time.monotonic() - start < 1
+    assert scheduler.in_flight == 1
+
+def test_release_frees_its_slot():
+    scheduler = SubmissionScheduler(max_in_flight=1, max_wait_seconds=2, poll_interval=5)
+    client = FakeClient()
+    first = scheduler.submit(client, None)
+    threading.Timer(0.1, scheduler.release, args=(first,)).start()
+    start = time.monotonic()
+    scheduler.submit(client, None)
+    # Woken by release, not by the next poll
+    assert time.monotonic() - start < 1
+
+def test_untracked_submissions_hold_no_slot():
+    scheduler = SubmissionScheduler(max_in_flight=1, max_wait_seconds=0.2)
+    client = FakeClient()
+    for _ in range(3):
+        scheduler.submit(client, None, track=False)
+    assert scheduler.in_flight == 0
+
+def test_operations_are_polled_without_the_lock():
+    scheduler = SubmissionScheduler(max_in_flight=1, max_wait_seconds=0.3, poll_interval=0.02)
+    client = FakeClient(scheduler=scheduler)
+    first = scheduler.submit(client, None)
+    with pytest.raises(ResourceExhausted):
+        scheduler.submit(client, None)
+    assert first.polled_with_lock_free and all(first.polled_with_lock_free)
+
+def test_page_rate():
+    # 10 pages per second, the bucket starts full
+    scheduler = SubmissionScheduler(pages_per_period=10, period=1.0, max_in_flight=100, max_wait_seconds=5)
+    client = FakeClient()
+    start = time.monotonic()
+    scheduler.submit(client, None, pages=10)
+    assert time.monotonic() - start < 0.1
+    scheduler.submit(client, None, pages=5)
+    assert 0.4 <= time.monotonic() - start < 0.8
+
+def test_page_rate_gives_up_after_max_wait():
+    scheduler = SubmissionScheduler(pages_per_period=10, period=10.0, max_in_flight=100, max_wait_seconds=0.2)
+    client = FakeClient()
+    scheduler.submit(client, None, pages=10)
+    with pytest.raises(ResourceExhausted):
+        scheduler.submit(client, None, pages=10)
+
+def test_quota_error_lowers_limits_and_retries():
+    scheduler = SubmissionScheduler(pages_per_period=100, max_in_flight=4, max_wait_seconds=5,
+                                    base_backoff=0.01, max_backoff=0.02)
+    client = FakeClient()
+    for _ in range(3):
+        scheduler.submit(client, None)
+    # Other instances use the quota: errors with nothing of ours running
+    for operation in client.operations:
+        operation.finished = True
+    client.quota_errors = 2
+    scheduler.submit(client, None)
+    assert scheduler.quota_errors == 2
+    assert scheduler.limit == 1
+    assert scheduler.rate_scale == pytest.approx(0.25)
+    assert len(client.operations) == 4